@@ -8,21 +8,1169 @@ Data: 2025-10-20
 Licença: MIT
 """
 
+import http
+import http.client
 import http.server
 import socketserver
+import asyncio
+import argparse
 import json
 import re
 import os
+import sys
+import io
 from datetime import datetime
+from email.utils import formatdate
+from urllib.parse import parse_qs, urlsplit
 import socket
+import ssl
 import base64
+import gzip
+import hashlib
+import zlib
+import secrets
+import queue
+import signal
+import threading
+import time
 from pathlib import Path
+from collections import Counter, OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import bisect
+import functools
+import itertools
+import math
+import csv
+import mmap
+import shutil
+import tempfile
+import contextlib
+import traceback
+import errno
+import stat
+
+try:
+    import numpy as np
+except ImportError:  # Opcional: validate_many usa o caminho escalar
+    np = None
+
+try:
+    import orjson
+except ImportError:  # Opcional: o codec JSON usa o módulo json padrão
+    orjson = None
 
 # Configurações do Azure (via variáveis de ambiente)
 AZURE_ENDPOINT = os.getenv('AZURE_COMPUTER_VISION_ENDPOINT', 'https://sua-instancia.cognitiveservices.azure.com/')
 AZURE_KEY = os.getenv('AZURE_COMPUTER_VISION_KEY', 'sua-chave-aqui')
+
+# Cliente Azure: timeout de leitura e da operação inteira, timeout de conexão (s),
+# conexões HTTPS persistentes no pool e intervalo entre consultas do resultado
+AZURE_TIMEOUT = float(os.getenv('AZURE_TIMEOUT', 30))
+AZURE_CONNECT_TIMEOUT = float(os.getenv('AZURE_CONNECT_TIMEOUT', 5))
+AZURE_POOL_SIZE = int(os.getenv('AZURE_POOL_SIZE', 4))
+AZURE_POLL_INTERVAL = float(os.getenv('AZURE_POLL_INTERVAL', 0.5))
+
+# Consulta adaptativa do resultado: limites do intervalo entre consultas (s), análises
+# concluídas usadas nas estatísticas de tempo até o resultado e mínimo delas para
+# trocar o intervalo fixo (AZURE_POLL_INTERVAL) pelos quantis observados
+AZURE_POLL_MIN_INTERVAL = float(os.getenv('AZURE_POLL_MIN_INTERVAL', 0.05))
+AZURE_POLL_MAX_INTERVAL = float(os.getenv('AZURE_POLL_MAX_INTERVAL', 2.0))
+AZURE_LATENCY_WINDOW = int(os.getenv('AZURE_LATENCY_WINDOW', 256))
+AZURE_LATENCY_MIN_SAMPLES = int(os.getenv('AZURE_LATENCY_MIN_SAMPLES', 5))
+
+# Modelo: 'read' (Computer Vision Read 3.2) ou um modelo prebuilt do Form Recognizer
+# (ex.: prebuilt-idDocument, prebuilt-creditCard) na versão de API indicada
+AZURE_MODEL = os.getenv('AZURE_MODEL', 'read')
+AZURE_FORM_API_VERSION = os.getenv('AZURE_FORM_API_VERSION', '2023-07-31')
 DEFAULT_PORT = int(os.getenv('PORT', 8000))
 
+# Configurações do servidor concorrente
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', (os.cpu_count() or 1) * 4))
+SERVER_QUEUE_SIZE = int(os.getenv('SERVER_QUEUE_SIZE', 128))
+
+# Engine do servidor: 'threads' (pool de threads) ou 'asyncio' (event loop)
+SERVER_ENGINE = os.getenv('SERVER_ENGINE', 'threads')
+ASYNC_IDLE_TIMEOUT = float(os.getenv('ASYNC_IDLE_TIMEOUT', 30))
+
+# Processos worker no modo prefork (1 = processo único)
+SERVER_PROCESSES = int(os.getenv('SERVER_PROCESSES', 1))
+
+# Conexões persistentes (HTTP/1.1 keep-alive)
+KEEPALIVE_TIMEOUT = float(os.getenv('KEEPALIVE_TIMEOUT', 5))
+KEEPALIVE_MAX_REQUESTS = int(os.getenv('KEEPALIVE_MAX_REQUESTS', 100))
+
+# Engine de threads: segundos sem receber nada no meio de uma requisição (cabeçalhos e corpo)
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', 30))
+
+# Compressão das respostas JSON (abaixo do limite em bytes não compensa)
+JSON_COMPRESS_MIN_SIZE = int(os.getenv('JSON_COMPRESS_MIN_SIZE', 512))
+JSON_COMPRESS_LEVEL = int(os.getenv('JSON_COMPRESS_LEVEL', 6))
+
+# Validação em lote NDJSON (/validate/batch)
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', 256))
+BATCH_MAX_LINE = int(os.getenv('BATCH_MAX_LINE', 16384))
+BATCH_READ_SIZE = 65536
+
+# Upload de imagem (/upload-image): tamanho máximo do arquivo e quanto dele fica em memória
+MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 10485760))
+UPLOAD_SPOOL_SIZE = int(os.getenv('UPLOAD_SPOOL_SIZE', 1048576))
+UPLOAD_READ_SIZE = 65536
+UPLOAD_OVERHEAD = 65536  # boundaries, cabeçalhos das partes e campos de texto
+UPLOAD_MAX_PART_HEADERS = 8192
+CHUNK_LINE_LIMIT = 1024  # linha de tamanho de chunk / trailer de corpo chunked
+SNIFF_SIZE = 12  # bytes iniciais do arquivo usados para reconhecer o formato
+
+# Codec JSON: 'auto' (orjson se instalado), 'orjson' ou 'json'; limites do corpo JSON recebido
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+JSON_MAX_BODY = int(os.getenv('JSON_MAX_BODY', 65536))
+JSON_MAX_DEPTH = int(os.getenv('JSON_MAX_DEPTH', 32))
+
+# Tabela BIN/IIN extra (CSV: start,end,brand,bank_name,edition), somada à embutida
+BIN_TABLE_FILE = os.getenv('BIN_TABLE_FILE', '')
+
+# Cache de resultados de validate_manual_input (0 = desativado); TTL em segundos
+VALIDATION_CACHE_SIZE = int(os.getenv('VALIDATION_CACHE_SIZE', 10000))
+VALIDATION_CACHE_TTL = float(os.getenv('VALIDATION_CACHE_TTL', 300))
+
+# Perfil lean de /validate: campos devolvidos quando o cliente não escolhe (?fields=)
+LEAN_DEFAULT_FIELDS = tuple(f.strip() for f in os.getenv('LEAN_DEFAULT_FIELDS', 'valid,reasons,card_type').split(','))
+
+# Cache das análises de imagem (SHA-256 dos bytes): entradas em memória, validade (s) e
+# nível em disco, compartilhado entre processos e reinícios. O disco guarda os dados do
+# cartão em claro: só é usado com IMAGE_CACHE_DIR configurado (limite em bytes; 0 = sem disco)
+IMAGE_CACHE_SIZE = int(os.getenv('IMAGE_CACHE_SIZE', 256))
+IMAGE_CACHE_TTL = float(os.getenv('IMAGE_CACHE_TTL', 3600))
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', '')
+IMAGE_CACHE_DISK_BYTES = int(os.getenv('IMAGE_CACHE_DISK_BYTES', 64 * 1024 * 1024))
+
+# Jobs de análise de imagem (POST /jobs): workers do pool, jobs esperando na fila (acima
+# disso, 503), tempo (s) e quantidade de resultados concluídos guardados para GET /jobs/{id}
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 64))
+JOB_TTL = float(os.getenv('JOB_TTL', 600))
+JOB_MAX_RETAINED = int(os.getenv('JOB_MAX_RETAINED', 1000))
+
+# Progresso em Server-Sent Events (GET /jobs/{id}/events): intervalo (s) do comentário
+# que mantém a conexão viva enquanto nenhuma etapa termina
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', 15))
+
+# Regras por bandeira (tamanhos de número e CVV, uso de Luhn) em JSON
+CARD_RULES_FILE = os.getenv('CARD_RULES_FILE') or str(Path(__file__).with_name('card_rules.json'))
+
+# Favicon simples em base64
+FAVICON_B64 = 'AAABAAEAEBAAAAEAIABoBAAAFgAAACgAAAAQAAAAIAAAAAEAIAAAAAAAAAQAABILAAASCwAAAAAAAAAAAAD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A'
+
+# Núcleo de validação: cada campo é normalizado uma única vez
+_NON_DIGITS = re.compile(r'\D')
+_NON_ASCII_DIGITS = re.compile(r'[^0-9]')
+_LUHN_PLAIN = bytes.maketrans(b'0123456789', bytes(range(10)))
+_LUHN_DOUBLED = bytes.maketrans(b'0123456789', bytes([0, 2, 4, 6, 8, 1, 3, 5, 7, 9]))
+_month_boundary = (0.0, 0)  # (timestamp do próximo mês, ano * 12 + mês atual)
+
+def normalize_digits(value):
+    """
+    Dígitos de `value` (equivale a re.sub(r'\\D', '', str(value)))
+    
+    O caso comum (só dígitos ASCII, espaços e hífens) não passa pela regex.
+    """
+    text = value if type(value) is str else str(value)
+    compact = text.replace(' ', '').replace('-', '')
+    if compact.isascii() and compact.isdigit():
+        return compact
+    return _NON_DIGITS.sub('', text)
+
+def luhn_valid(digits):
+    """Luhn sobre dígitos normalizados, por tabela (sem lista intermediária)"""
+    if len(digits) < 13:
+        return False
+    if not digits.isascii():
+        # Dígitos Unicode (ex.: árabe-índicos) valem o mesmo que int() daria
+        digits = ''.join(str(int(digit)) for digit in digits)
+    data = digits.encode('ascii')
+    checksum = sum(data[-1::-2].translate(_LUHN_PLAIN)) + sum(data[-2::-2].translate(_LUHN_DOUBLED))
+    return checksum % 10 == 0
+
+def card_type_of(digits):
+    """Bandeira pelo prefixo dos dígitos normalizados (tabela BIN)"""
+    return BIN_TABLE.lookup(digits)[0]
+
+def _current_month(now):
+    """(timestamp do próximo mês, ano * 12 + mês) válido para `now`"""
+    global _month_boundary
+    if now >= _month_boundary[0]:
+        today = datetime.fromtimestamp(now)
+        next_month = datetime(today.year + today.month // 12, today.month % 12 + 1, 1)
+        _month_boundary = (next_month.timestamp(), today.year * 12 + today.month)
+    return _month_boundary
+
+def current_month_key():
+    """
+    ano * 12 + mês da data local atual
+    
+    O valor só muda na virada do mês, então fica em cache até lá; cada
+    chamada custa um time.time() em vez de um datetime.now().
+    """
+    return _current_month(time.time())[1]
+
+def next_month_start(now=None):
+    """Timestamp da próxima virada de mês (quando expiry_valid pode mudar)"""
+    return _current_month(time.time() if now is None else now)[0]
+
+def expiry_valid(expiry):
+    """MM/AA válido e com mês de expiração posterior ao atual"""
+    text = expiry if type(expiry) is str else str(expiry)
+    if len(text) == 5 and text[2] == '/':
+        clean = text[:2] + text[3:]
+        if not (clean.isascii() and clean.isdigit()):
+            clean = _NON_ASCII_DIGITS.sub('', text)
+    else:
+        clean = _NON_ASCII_DIGITS.sub('', text)
+    
+    if len(clean) != 4:
+        return False
+    month = int(clean[:2])
+    year = 2000 + int(clean[2:])
+    # datetime(ano, mês, 1) > agora  <=>  (ano, mês) posterior ao mês atual
+    return 1 <= month <= 12 and year * 12 + month > current_month_key()
+
+def cvv_valid(cvv, card_type):
+    """CVV com o tamanho definido nas regras da bandeira"""
+    return len(normalize_digits(cvv)) in CARD_RULES.get(card_type, DEFAULT_CARD_RULE).cvv_lengths
+
+def pan_check(digits, card_type):
+    """
+    Verifica o número normalizado contra as regras da bandeira
+    
+    Returns:
+        str: 'luhn' (válido pelo Luhn), 'unchecked' (válido, bandeira sem
+        Luhn), 'length' (tamanho inválido) ou 'checksum' (falha no Luhn)
+    """
+    rule = CARD_RULES.get(card_type, DEFAULT_CARD_RULE)
+    if len(digits) not in rule.pan_lengths:
+        return 'length'
+    if not rule.luhn:
+        return 'unchecked'
+    return 'luhn' if luhn_valid(digits) else 'checksum'
+
+# Faixas de BIN/IIN por bandeira: (início, fim) como prefixos do número
+BUILTIN_BIN_RANGES = (
+    ('4', '4', 'Visa'),
+    ('51', '55', 'Mastercard'),
+    ('2221', '2720', 'Mastercard'),
+    ('34', '34', 'American Express'),
+    ('37', '37', 'American Express'),
+    ('6011', '6011', 'Discover'),
+    ('622126', '622925', 'Discover'),
+    ('644', '649', 'Discover'),
+    ('65', '65', 'Discover'),
+    ('3528', '3589', 'JCB'),
+    ('300', '305', 'Diners Club'),
+    ('36', '36', 'Diners Club'),
+    ('38', '39', 'Diners Club'),
+    ('384100', '384100', 'Hipercard'),
+    ('384140', '384140', 'Hipercard'),
+    ('384160', '384160', 'Hipercard'),
+    ('606282', '606282', 'Hipercard'),
+    ('637095', '637095', 'Hipercard'),
+    ('637568', '637568', 'Hipercard'),
+    ('637599', '637599', 'Hipercard'),
+    ('637609', '637609', 'Hipercard'),
+    ('637612', '637612', 'Hipercard'),
+    ('401178', '401179', 'Elo'),
+    ('431274', '431274', 'Elo'),
+    ('438935', '438935', 'Elo'),
+    ('451416', '451416', 'Elo'),
+    ('457393', '457393', 'Elo'),
+    ('457631', '457632', 'Elo'),
+    ('504175', '504175', 'Elo'),
+    ('506699', '506778', 'Elo'),
+    ('509000', '509999', 'Elo'),
+    ('627780', '627780', 'Elo'),
+    ('636297', '636297', 'Elo'),
+    ('636368', '636368', 'Elo'),
+    ('650031', '650033', 'Elo'),
+    ('650035', '650051', 'Elo'),
+    ('650405', '650439', 'Elo'),
+    ('650485', '650538', 'Elo'),
+    ('650541', '650598', 'Elo'),
+    ('650700', '650718', 'Elo'),
+    ('650720', '650727', 'Elo'),
+    ('650901', '650920', 'Elo'),
+    ('651652', '651679', 'Elo'),
+    ('655000', '655019', 'Elo'),
+    ('655021', '655058', 'Elo'),
+)
+
+class BinTable:
+    """
+    Índice de faixas BIN/IIN -> (bandeira, banco, edição)
+    
+    Cada faixa vira um intervalo de chaves de KEY_DIGITS dígitos (início
+    completado com 0, fim com 9). Na carga as faixas sobrepostas são
+    achatadas em segmentos disjuntos, com a faixa interna vencendo (ex.:
+    Elo 401178 dentro de Visa 4; em sobreposição parcial, a que começa
+    depois), então a consulta é um int() dos primeiros dígitos e um
+    bisect: O(log n), sem varrer a tabela. Cada segmento guarda quantos
+    dígitos o prefixo da sua faixa tem: uma entrada mais curta (ex.: '3'
+    diante de Diners 300-305) não chega a identificar a faixa e fica
+    Desconhecido, em vez de casar pelo preenchimento com zeros.
+    """
+    
+    KEY_DIGITS = 8
+    UNKNOWN = ('Desconhecido', None, None)
+    
+    def __init__(self, ranges=()):
+        """ranges: iterável de (início, fim, bandeira, banco, edição)"""
+        width = self.KEY_DIGITS
+        intervals = []
+        for order, (start, end, brand, bank, edition) in enumerate(ranges):
+            low = int(start[:width].ljust(width, '0'))
+            high = int((end or start)[:width].ljust(width, '9'))
+            if low <= high:
+                # Dígitos que a entrada precisa ter para cair na faixa (o prefixo mais longo dela)
+                needed = min(max(len(start), len(end or start)), width)
+                intervals.append((low, -high, order, ((brand, bank or None, edition or None), needed)))
+        # Início crescente, faixa mais larga antes; em empate, a linha mais recente por cima
+        intervals.sort()
+        
+        starts, ends, entries, min_digits = [], [], [], []
+        
+        def emit(low, high, entry):
+            if low > high:
+                return
+            if entries and entries[-1] is entry[0] and min_digits[-1] == entry[1] and ends[-1] + 1 == low:
+                ends[-1] = high
+            else:
+                starts.append(low)
+                ends.append(high)
+                entries.append(entry[0])
+                min_digits.append(entry[1])
+        
+        stack, cursor = [], 0
+        for low, high, _, entry in intervals:
+            high = -high
+            while stack and stack[-1][0] < low:
+                top_high, top_entry = stack.pop()
+                emit(cursor, top_high, top_entry)
+                cursor = max(cursor, top_high + 1)
+            if stack:
+                emit(cursor, low - 1, stack[-1][1])
+            stack.append((high, entry))
+            cursor = low
+        while stack:
+            top_high, top_entry = stack.pop()
+            emit(cursor, top_high, top_entry)
+            cursor = max(cursor, top_high + 1)
+        
+        self.starts, self.ends, self.entries, self.min_digits = starts, ends, entries, min_digits
+        self.ranges = len(intervals)
+        self._arrays = None
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def lookup(self, digits):
+        """(bandeira, banco, edição) para dígitos normalizados"""
+        if not digits:
+            return self.UNKNOWN
+        key = int(digits[:self.KEY_DIGITS].ljust(self.KEY_DIGITS, '0'))
+        index = bisect.bisect_right(self.starts, key) - 1
+        if index >= 0 and key <= self.ends[index] and len(digits) >= self.min_digits[index]:
+            return self.entries[index]
+        return self.UNKNOWN
+    
+    def lookup_keys(self, keys, lengths):
+        """Versão vetorial de lookup para chaves já calculadas e total de dígitos de cada uma (NumPy)"""
+        if self._arrays is None:
+            self._arrays = (np.array(self.starts, dtype=np.int64), np.array(self.ends, dtype=np.int64),
+                            np.array(self.min_digits, dtype=np.int64))
+        starts, ends, min_digits = self._arrays
+        index = np.searchsorted(starts, keys, side='right') - 1
+        clipped = np.maximum(index, 0)
+        found = (index >= 0) & (keys <= ends[clipped]) & (lengths >= min_digits[clipped])
+        entries, unknown = self.entries, self.UNKNOWN
+        return [entries[i] if ok else unknown for i, ok in zip(index.tolist(), found.tolist())]
+    
+    @classmethod
+    def load(cls, path=None):
+        """
+        Tabela embutida mais as faixas do CSV em `path` (opcional)
+        
+        O CSV tem cabeçalho start,end,brand,bank_name,edition; só start e
+        brand são obrigatórios. Faixas do arquivo prevalecem sobre as
+        embutidas de mesmo tamanho.
+        """
+        ranges = [(start, end, brand, None, None) for start, end, brand in BUILTIN_BIN_RANGES]
+        if path:
+            with open(path, newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                header = [name.strip().lower() for name in next(reader, [])]
+                columns = [header.index(name) if name in header else None
+                           for name in ('start', 'end', 'brand', 'bank_name', 'edition')]
+                if columns[0] is None or columns[2] is None:
+                    raise ValueError(f'{path}: cabeçalho precisa de start e brand')
+                for row in reader:
+                    row += [''] * (len(header) - len(row))
+                    start, end, brand, bank, edition = (row[i].strip() if i is not None else ''
+                                                        for i in columns)
+                    if start.isdigit() and brand:
+                        ranges.append((start, end if end.isdigit() else '', brand, bank, edition))
+        return cls(ranges)
+
+# Carregada na importação: no modo prefork os workers herdam a tabela pronta
+BIN_TABLE = BinTable.load(BIN_TABLE_FILE)
+
+CardRule = namedtuple('CardRule', 'pan_lengths cvv_lengths luhn')
+
+def _lengths(spec):
+    """[13, [16, 19]] -> frozenset({13, 16, 17, 18, 19})"""
+    lengths = set()
+    for item in spec:
+        if isinstance(item, list):
+            lengths.update(range(item[0], item[1] + 1))
+        else:
+            lengths.add(int(item))
+    return frozenset(lengths)
+
+def load_card_rules(path):
+    """
+    Compila o JSON de regras numa tabela de despacho {bandeira: CardRule}
+    
+    Os intervalos viram frozensets, então cada validação faz um dict.get e
+    testes `in` de custo constante, qualquer que seja o número de
+    bandeiras. A regra 'Desconhecido' é obrigatória e vale também para
+    bandeiras da tabela BIN sem regra própria.
+    """
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    rules = {
+        brand: CardRule(_lengths(spec['pan_lengths']), _lengths(spec['cvv_lengths']), bool(spec.get('luhn', True)))
+        for brand, spec in config.items()
+    }
+    if BinTable.UNKNOWN[0] not in rules:
+        raise ValueError(f"{path}: falta a regra '{BinTable.UNKNOWN[0]}'")
+    return rules
+
+CARD_RULES = load_card_rules(CARD_RULES_FILE)
+DEFAULT_CARD_RULE = CARD_RULES[BinTable.UNKNOWN[0]]
+
+def apply_bin_info(extracted):
+    """
+    Completa bandeira, banco e edição de dados extraídos de imagem pela
+    tabela BIN; só sobrescreve o que a tabela conhece
+    """
+    card_type, bank_name, edition = BIN_TABLE.lookup(normalize_digits(extracted.get('card_number') or ''))
+    if card_type != BinTable.UNKNOWN[0]:
+        extracted['card_type'] = card_type
+    if bank_name:
+        extracted['bank_name'] = bank_name
+    if edition:
+        extracted['edition'] = edition
+    return extracted
+
+class ResultCache:
+    """
+    Cache LRU com TTL, seguro entre threads
+    
+    As chaves são resumos BLAKE2b com chave secreta aleatória por processo
+    (o dado original, ex.: o número do cartão, nunca fica guardado como
+    chave). Cada entrada expira no que vier primeiro: o TTL ou o `until`
+    informado no put.
+    """
+    
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._hasher = hashlib.blake2b(key=secrets.token_bytes(32), digest_size=16)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+    
+    def key(self, *parts):
+        """Resumo com chave das partes (str) que identificam a entrada"""
+        hasher = self._hasher.copy()
+        hasher.update('\x1f'.join(parts).encode('utf-8', 'surrogatepass'))
+        return hasher.digest()
+    
+    def get(self, key):
+        """Valor em cache ou None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if now >= entry[0]:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, key, value, until=None):
+        """Guarda `value` até now + ttl (ou `until`, se antes)"""
+        expires = time.time() + self.ttl
+        if until is not None and until < expires:
+            expires = until
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """Contadores para o /status"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+def _copy_validation(validation):
+    """Cópia dos dicts de validação (o cache não compartilha objetos mutáveis)"""
+    return {key: value.copy() if type(value) is dict else value for key, value in validation.items()}
+
+class ImageResultCache:
+    """
+    Cache das extrações de imagem, endereçado pelo SHA-256 dos bytes
+    
+    Dois níveis: LRU em memória (ResultCache) na frente de um diretório com
+    um <sha256>.json por imagem, limitado a max_disk_bytes. A escrita no
+    disco é atômica (arquivo temporário + os.replace), então as entradas
+    sobrevivem a reinícios e são lidas por todos os processos (prefork) sem
+    lock. Acertos marcam o atime do arquivo e, ao passar do limite, os
+    menos usados saem primeiro.
+    
+    Os valores trazem os dados do cartão em claro (número, nome, validade),
+    então o disco só entra com um diretório configurado: ele é criado com
+    0700, recusado se pertencer a outro usuário, e os arquivos são 0600.
+    Toda entrada vale `ttl` segundos a partir da gravação (mtime), mesmo
+    sendo acessada; as vencidas são apagadas na leitura e na limpeza.
+    
+    Guarda só a extração (a parte cara); validação e confiança são
+    recalculadas a cada uso, já que dependem da data atual.
+    """
+    
+    def __init__(self, namespace, max_size=IMAGE_CACHE_SIZE, directory=IMAGE_CACHE_DIR,
+                 max_disk_bytes=IMAGE_CACHE_DISK_BYTES, ttl=IMAGE_CACHE_TTL):
+        self.memory = ResultCache(max_size, ttl) if max_size > 0 else None
+        self.ttl = ttl
+        self.directory = None
+        self.max_disk_bytes = max_disk_bytes
+        self._disk_bytes = None  # estimativa local; recontada no diretório ao passar do limite
+        self._sweep_at = 0.0
+        self._lock = threading.Lock()
+        self.memory_hits = self.disk_hits = self.misses = 0
+        self.bytes_saved = self.disk_evictions = self.disk_expired = self.disk_errors = 0
+        if directory and max_disk_bytes > 0:
+            try:
+                self.directory = self._private_directory(Path(directory), namespace)
+            except OSError as e:
+                print(f"⚠️  Cache de imagens sem disco ({directory}): {e}")
+    
+    @staticmethod
+    def _private_directory(base, namespace):
+        """Cria base/namespace com 0700 e confere que os dois são diretórios deste usuário"""
+        path = base / namespace
+        # A base é conferida antes de criar o namespace dentro dela (link para outro lugar)
+        for directory in (base, path):
+            directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            info = os.lstat(directory)
+            if not stat.S_ISDIR(info.st_mode):
+                raise OSError(errno.ENOTDIR, 'não é um diretório (ou é um link)', str(directory))
+            if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+                raise OSError(errno.EPERM, 'diretório pertence a outro usuário', str(directory))
+        # Só o nível do namespace é nosso para corrigir; a base pode ser compartilhada
+        if stat.S_IMODE(os.lstat(path).st_mode) & 0o077:
+            os.chmod(path, 0o700)
+        return path
+    
+    def get(self, digest, size=0):
+        """Extração guardada para a imagem (SHA-256 em hex) de `size` bytes, ou None"""
+        value = self.memory.get(digest) if self.memory is not None else None
+        disk_hit = False
+        if value is None and self.directory is not None:
+            value = self._disk_get(digest)
+            disk_hit = value is not None
+            if disk_hit and self.memory is not None:
+                self.memory.put(digest, value)
+        
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            if disk_hit:
+                self.disk_hits += 1
+            else:
+                self.memory_hits += 1
+            self.bytes_saved += size
+        return dict(value)
+    
+    def put(self, digest, value):
+        """Guarda a extração (dict) da imagem nos dois níveis"""
+        value = dict(value)
+        if self.memory is not None:
+            self.memory.put(digest, value)
+        if self.directory is not None:
+            try:
+                self._disk_put(digest, JSON_CODEC.dumps(value))
+            except OSError:
+                with self._lock:
+                    self.disk_errors += 1
+    
+    def _disk_get(self, digest):
+        path = self.directory / f'{digest}.json'
+        try:
+            info = path.stat()
+            now = time.time()
+            if now - info.st_mtime > self.ttl:
+                path.unlink()
+                with self._lock:
+                    self.disk_expired += 1
+                return None
+            value = JSON_CODEC.loads(path.read_bytes())
+            # atime = último uso (LRU); o mtime continua sendo a gravação (TTL)
+            os.utime(path, (now, info.st_mtime))
+        except FileNotFoundError:
+            return None
+        except (OSError, JsonError):
+            with self._lock:
+                self.disk_errors += 1
+            return None
+        return value if isinstance(value, dict) else None
+    
+    def _disk_put(self, digest, data):
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp, self.directory / f'{digest}.json')
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(temp)
+            raise
+        
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data)
+            if (self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes
+                    or time.time() >= self._sweep_at):
+                self._evict()
+    
+    def _evict(self):
+        """
+        Recalcula o uso do diretório: apaga as entradas vencidas e, acima do
+        limite, as menos usadas até 90% dele
+        """
+        now = time.time()
+        self._sweep_at = now + min(self.ttl, 600)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                with contextlib.suppress(OSError):
+                    info = entry.stat()
+                    if now - info.st_mtime > self.ttl:
+                        os.unlink(entry.path)
+                        self.disk_expired += 1
+                        continue
+                    entries.append((info.st_atime, info.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_disk_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_disk_bytes * 0.9:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+                    self.disk_evictions += 1
+                total -= size
+        self._disk_bytes = total
+    
+    def stats(self):
+        """Contadores para o /status (por processo)"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'memory_size': self.memory.stats()['size'] if self.memory is not None else 0,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+                'bytes_saved': self.bytes_saved,
+                'disk_bytes': self._disk_bytes,
+                'disk_max_bytes': self.max_disk_bytes if self.directory is not None else 0,
+                'disk_evictions': self.disk_evictions,
+                'disk_expired': self.disk_expired,
+                'disk_errors': self.disk_errors
+            }
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False)
+_compact_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+class RequestError(ValueError):
+    """Requisição rejeitada pela API; status é o código HTTP da resposta"""
+    
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+class JsonError(RequestError):
+    """JSON recebido rejeitado pelo codec"""
+
+_JSON_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+_NOT_BRACKETS = bytes(sorted(set(range(256)) - set(b'[]{}')))
+_BRACKET_STEP = {ord('['): 1, ord('{'): 1, ord(']'): -1, ord('}'): -1}
+
+def _json_depth(data):
+    """Maior aninhamento de objetos/listas em `data` (ignorando strings)"""
+    skeleton = _JSON_STRING.sub(b'', data).translate(None, _NOT_BRACKETS)
+    return max(itertools.accumulate(_BRACKET_STEP[c] for c in skeleton), default=0)
+
+class JsonCodec:
+    """
+    Codec JSON único da API: bytes na entrada, bytes na saída
+    
+    loads() lê direto dos bytes do corpo (sem decode intermediário) e
+    aplica os limites de tamanho e de aninhamento antes de montar qualquer
+    objeto. dumps() devolve bytes UTF-8 do backend; com orjson a saída é
+    compacta (sem espaços), o que é o mesmo JSON.
+    """
+    
+    def __init__(self, backend=JSON_BACKEND, max_body=JSON_MAX_BODY, max_depth=JSON_MAX_DEPTH):
+        if backend == 'auto':
+            backend = 'orjson' if orjson is not None else 'json'
+        if backend == 'orjson' and orjson is None:
+            raise ValueError('JSON_BACKEND=orjson, mas o pacote orjson não está instalado')
+        if backend not in ('orjson', 'json'):
+            raise ValueError(f'JSON_BACKEND inválido: {backend}')
+        self.name = backend
+        self.max_body = max_body
+        self.max_depth = max_depth
+        self._loads = orjson.loads if backend == 'orjson' else self._stdlib_loads
+    
+    @staticmethod
+    def _stdlib_loads(data):
+        # O corpo é sempre UTF-8: pula a detecção de codificação do json.loads(bytes)
+        return json.loads(data.decode('utf-8'))
+    
+    def loads(self, data):
+        """Decodifica o corpo JSON (bytes) de uma requisição"""
+        if len(data) > self.max_body:
+            raise JsonError(f'Corpo JSON maior que {self.max_body} bytes', 413)
+        # Só há como passar do limite com mais aberturas que o limite
+        if data.count(b'{') + data.count(b'[') > self.max_depth and _json_depth(data) > self.max_depth:
+            raise JsonError(f'JSON com mais de {self.max_depth} níveis de aninhamento')
+        try:
+            return self._loads(data)
+        except ValueError as e:
+            raise JsonError(f'JSON inválido: {e}') from None
+    
+    def dumps(self, data, compact=False):
+        """Corpo JSON (UTF-8) de uma resposta; compact=True tira os espaços também no json"""
+        if self.name == 'orjson':
+            return orjson.dumps(data)
+        return (_compact_encoder if compact else _json_encoder).encode(data).encode('utf-8')
+
+JSON_CODEC = JsonCodec()
+
+class AzureError(Exception):
+    """Falha na chamada ao Azure (rede, timeout, status HTTP ou operação com erro)"""
+
+_CARD_NUMBER_LINE = re.compile(r'[\d -]{13,25}')
+_EXPIRY_TEXT = re.compile(r'(?<!\d)(0[1-9]|1[0-2])\s*/\s*(\d{4}|\d{2})(?!\d)')
+_NAME_LINE = re.compile(r"[A-ZÀ-Ý][A-ZÀ-Ý.' ]{2,30}")
+_NOT_NAME_WORDS = frozenset((
+    'VALID', 'THRU', 'VALIDO', 'ATE', 'ATÉ', 'BANK', 'BANCO', 'VISA', 'MASTERCARD', 'ELO', 'AMERICAN',
+    'EXPRESS', 'HIPERCARD', 'DEBIT', 'CREDIT', 'DEBITO', 'DÉBITO', 'CREDITO', 'CRÉDITO', 'PLATINUM',
+    'GOLD', 'BLACK', 'INFINITE', 'INTERNATIONAL', 'INTERNACIONAL', 'ELECTRONIC', 'MEMBER', 'SINCE'
+))
+
+def parse_card_text(lines):
+    """
+    Campos do cartão a partir das linhas de texto reconhecidas (OCR)
+    
+    Número: a primeira linha só de dígitos/espaços com 13 a 19 dígitos que
+    passe no Luhn (ou a primeira com tamanho válido). Validade: o primeiro
+    MM/AA ou MM/AAAA. Nome: a primeira linha em maiúsculas com duas ou mais
+    palavras que não sejam termos impressos no cartão. Campos não achados
+    ficam vazios (a validação os reporta como não encontrados).
+    """
+    numbers = [line.strip() for line in lines if _CARD_NUMBER_LINE.fullmatch(line.strip())
+               and 13 <= len(normalize_digits(line)) <= 19]
+    card_number = next((n for n in numbers if luhn_valid(normalize_digits(n))), numbers[0] if numbers else '')
+    
+    expiry_date = ''
+    for line in lines:
+        match = _EXPIRY_TEXT.search(line)
+        if match:
+            expiry_date = f'{match.group(1)}/{match.group(2)[-2:]}'
+            break
+    
+    cardholder_name = ''
+    for line in lines:
+        words = line.split()
+        if (len(words) >= 2 and _NAME_LINE.fullmatch(line.strip())
+                and not any(word.strip('.') in _NOT_NAME_WORDS for word in words)):
+            cardholder_name = ' '.join(words)
+            break
+    
+    return {'card_number': card_number, 'cardholder_name': cardholder_name, 'expiry_date': expiry_date}
+
+# Quantis da duração estimada no Azure visitados pelas consultas de AzureReadClient
+_POLL_QUANTILES = (0.5, 0.7, 0.85, 0.95, 0.99)
+
+class LatencyWindow:
+    """
+    Últimas durações observadas (s), com quantis por ordenação
+    
+    Guarda no máximo size valores (os mais antigos saem primeiro). quantile
+    devolve None enquanto a janela está vazia.
+    """
+    
+    def __init__(self, size=256):
+        self._values = deque(maxlen=max(1, size))
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._values)
+    
+    def add(self, seconds):
+        with self._lock:
+            self._values.append(seconds)
+    
+    def quantile(self, q):
+        """Quantil q (0 a 1) pelo método do vizinho mais próximo"""
+        return self.quantiles((q,))[0]
+    
+    def quantiles(self, qs):
+        """Vários quantis com uma ordenação só"""
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return [None] * len(qs)
+        n = len(values)
+        return [values[min(n - 1, max(0, math.ceil(q * n) - 1))] for q in qs]
+    
+    def quantile_ms(self, q):
+        value = self.quantile(q)
+        return None if value is None else round(value * 1000, 1)
+
+class AzureReadClient:
+    """
+    Cliente HTTP do Azure Read (ou de um modelo prebuilt do Form Recognizer)
+    
+    As conexões (HTTPS, ou HTTP para um servidor local de testes) ficam num
+    pool limitado a pool_size e são reaproveitadas entre chamadas; uma
+    conexão parada que o servidor já fechou é refeita uma vez. connect_timeout
+    vale para abrir a conexão e timeout para cada leitura e para a operação
+    inteira (envio + consultas do resultado). O corpo é enviado direto do
+    buffer da imagem (memoryview sobre bytes ou mmap, sem cópia).
+    
+    O resultado é consultado num event loop, com intervalo adaptado ao
+    Retry-After e ao tempo até o resultado das últimas análises (mediana e
+    p99 em stats()).
+    """
+    
+    def __init__(self, endpoint, key, model=AZURE_MODEL, timeout=AZURE_TIMEOUT,
+                 connect_timeout=AZURE_CONNECT_TIMEOUT, pool_size=AZURE_POOL_SIZE,
+                 poll_interval=AZURE_POLL_INTERVAL, poll_min_interval=AZURE_POLL_MIN_INTERVAL,
+                 poll_max_interval=AZURE_POLL_MAX_INTERVAL, context=None):
+        url = urlsplit(endpoint)
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise ValueError(f'Endpoint do Azure inválido: {endpoint}')
+        self.key = key
+        self.model = model
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.poll_interval = poll_interval
+        self.poll_min_interval = poll_min_interval
+        self.poll_max_interval = max(poll_max_interval, poll_min_interval)
+        self._https = url.scheme == 'https'
+        self._host = url.hostname
+        self._port = url.port
+        self._context = context if context is not None or not self._https else ssl.create_default_context()
+        
+        base = url.path.rstrip('/')
+        if model == 'read':
+            self._analyze_path = f'{base}/vision/v3.2/read/analyze'
+        else:
+            self._analyze_path = (f'{base}/formrecognizer/documentModels/{model}:analyze'
+                                  f'?api-version={AZURE_FORM_API_VERSION}')
+        
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self.pool_size = pool_size
+        self.requests = self.connections_opened = self.connections_reused = self.errors = 0
+        self.time_to_result = LatencyWindow(AZURE_LATENCY_WINDOW)
+        self.completion = LatencyWindow(AZURE_LATENCY_WINDOW)
+        self.analyses = self.polls = self.in_flight = 0
+        self._loop = None
+        # Uma thread por conexão do pool: as chamadas excedentes esperam na fila do executor
+        self._executor = ThreadPoolExecutor(pool_size, thread_name_prefix='azure-http')
+    
+    def analyze(self, image, progress=None):
+        """
+        Campos do cartão (parse_card_text) extraídos da imagem (bytes ou mmap)
+        
+        Versão bloqueante de analyze_async: a análise roda no event loop do
+        cliente (uma thread só para todas as análises em andamento) e a thread
+        chamadora só espera o resultado.
+        """
+        return asyncio.run_coroutine_threadsafe(self.analyze_async(image, progress), self._event_loop()).result()
+    
+    async def analyze_async(self, image, progress=None):
+        """
+        Versão asyncio de analyze, para rodar no event loop de quem chama
+        
+        As chamadas HTTP (bloqueantes, pelo pool) vão para um executor com uma
+        thread por conexão; entre uma consulta e outra só há asyncio.sleep,
+        então muitas análises esperam juntas sem ocupar threads. O intervalo
+        vem de _next_delay. progress(etapa, dados), se informado, recebe
+        'ocr_submitted' quando o Azure aceita a imagem.
+        """
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._lock:
+            self.in_flight += 1
+        try:
+            with memoryview(image) as body:
+                while True:
+                    status, response, data = await loop.run_in_executor(
+                        self._executor, self._request, 'POST', self._analyze_path, body,
+                        {'Content-Type': 'application/octet-stream'})
+                    if status != 429:
+                        break
+                    await self._throttled(deadline, self._retry_after(response))
+            if status != 202:
+                raise AzureError(f'Azure respondeu {status}: {data[:200].decode("utf-8", "replace")}')
+            location = response.getheader('Operation-Location') or ''
+            url = urlsplit(location)
+            if not url.path:
+                raise AzureError('Azure não devolveu Operation-Location')
+            path = url.path + (f'?{url.query}' if url.query else '')
+            if progress is not None:
+                progress('ocr_submitted', {})
+            
+            polls = late = 0
+            running = time.monotonic()
+            retry_after = self._retry_after(response)
+            while True:
+                delay, late = self._next_delay(time.monotonic() - start, polls, late, retry_after)
+                await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+                sent = time.monotonic()
+                status, response, data = await loop.run_in_executor(self._executor, self._request, 'GET', path)
+                polls += 1
+                retry_after = self._retry_after(response)
+                if status == 429:
+                    # Limite de requisições: espera o Retry-After e consulta de novo
+                    self._check_deadline(deadline)
+                    continue
+                if status != 200:
+                    raise AzureError(f'Azure respondeu {status} ao consultar o resultado')
+                try:
+                    result = json.loads(data)
+                except ValueError:
+                    raise AzureError('Resultado do Azure não é JSON') from None
+                state = str(result.get('status', '')).lower()
+                if state == 'succeeded':
+                    fields = self._card_fields(result.get('analyzeResult') or {})
+                    # A operação terminou entre a última consulta 'running' e esta
+                    self._completed(time.monotonic() - start, (running + sent) / 2 - start, polls)
+                    return fields
+                if state == 'failed':
+                    raise AzureError(f'Análise do Azure falhou: {result.get("error") or result}')
+                running = sent
+                self._check_deadline(deadline)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+    
+    def _next_delay(self, elapsed, polls, late, retry_after):
+        """
+        (espera até a próxima consulta, consultas além da estimativa)
+        
+        Com amostras suficientes, as consultas miram quantis da duração
+        estimada da operação no Azure (meio do intervalo entre a última
+        consulta 'running' e a que trouxe o resultado): a primeira espera vai
+        direto ao p50 e as seguintes passam por _POLL_QUANTILES, sem esperar
+        mais que poll_interval de cada vez; passado o último quantil, o
+        intervalo parte da distância entre os dois últimos e cresce 1,5x por
+        consulta até poll_max_interval. Sem amostras, consulta a cada
+        poll_interval. Um Retry-After do Azure é sempre respeitado.
+        """
+        targets = ()
+        if len(self.completion) >= AZURE_LATENCY_MIN_SAMPLES:
+            targets = self.completion.quantiles(_POLL_QUANTILES)
+        target = next((t for t in targets if t > elapsed + self.poll_min_interval), None)
+        if target is not None:
+            delay = target - elapsed if polls == 0 else min(target - elapsed, self.poll_interval)
+        elif targets:
+            step = min(max(targets[-1] - targets[-2], self.poll_min_interval), self.poll_interval)
+            delay = min(step * 1.5 ** late, self.poll_max_interval)
+            late += 1
+        else:
+            delay = self.poll_interval
+        return max(delay, retry_after, self.poll_min_interval), late
+    
+    @staticmethod
+    def _retry_after(response):
+        """Retry-After (em segundos) da resposta; 0 se ausente ou em formato de data"""
+        try:
+            return max(0.0, float(response.getheader('Retry-After') or 0))
+        except ValueError:
+            return 0.0
+    
+    async def _throttled(self, deadline, retry_after):
+        """Espera pedida num 429 ao enviar a imagem"""
+        self._check_deadline(deadline)
+        await asyncio.sleep(min(max(retry_after, self.poll_interval), max(0.0, deadline - time.monotonic())))
+    
+    def _check_deadline(self, deadline):
+        if time.monotonic() >= deadline:
+            raise AzureError(f'Análise do Azure passou de {self.timeout}s')
+    
+    def _completed(self, seconds, completion, polls):
+        self.time_to_result.add(seconds)
+        self.completion.add(completion)
+        with self._lock:
+            self.analyses += 1
+            self.polls += polls
+    
+    def _event_loop(self):
+        """Event loop compartilhado pelas chamadas bloqueantes de analyze (criado no primeiro uso)"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='azure-poll', daemon=True).start()
+            return self._loop
+    
+    @staticmethod
+    def _card_fields(analysis):
+        """Campos do cartão a partir de analyzeResult (Read 3.2 ou Form Recognizer)"""
+        if 'readResults' in analysis:
+            lines = [line.get('text', '') for page in analysis['readResults'] for line in page.get('lines', ())]
+        else:
+            lines = (analysis.get('content') or '').splitlines()
+        extracted = parse_card_text(lines)
+        
+        # Modelos prebuilt já trazem os campos nomeados: eles têm precedência
+        documents = analysis.get('documents') or ()
+        fields = (documents[0].get('fields') or {}) if documents else {}
+        for name, key in (('CardNumber', 'card_number'), ('CardHolderName', 'cardholder_name'),
+                          ('ExpirationDate', 'expiry_date'), ('IssuingBank', 'bank_name')):
+            field = fields.get(name) or {}
+            value = field.get('valueString') or field.get('content')
+            if value:
+                extracted[key] = value
+        extracted['confidence'] = 'azure'
+        return extracted
+    
+    def _request(self, method, path, body=None, headers=None):
+        """(status, resposta, corpo) de uma chamada por uma conexão do pool"""
+        headers = {'Ocp-Apim-Subscription-Key': self.key, **(headers or {})}
+        with self._slots:
+            for attempt in range(2):
+                conn, reused = self._checkout()
+                try:
+                    conn.request(method, path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                    conn.close()
+                    if reused and attempt == 0:
+                        # O servidor fechou a conexão parada: tenta uma vez numa nova
+                        continue
+                    self._count_error()
+                    raise AzureError(f'Conexão com o Azure caiu: {e}') from e
+                except (OSError, http.client.HTTPException) as e:
+                    conn.close()
+                    self._count_error()
+                    raise AzureError(f'Falha na chamada ao Azure: {e}') from e
+                
+                with self._lock:
+                    self.requests += 1
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._idle.put(conn)
+                return response.status, response, data
+    
+    def _checkout(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            with self._lock:
+                self.connections_reused += 1
+            return conn, True
+        
+        if self._https:
+            conn = http.client.HTTPSConnection(self._host, self._port, timeout=self.connect_timeout,
+                                               context=self._context)
+        else:
+            conn = http.client.HTTPConnection(self._host, self._port, timeout=self.connect_timeout)
+        try:
+            conn.connect()
+        except OSError as e:
+            conn.close()
+            self._count_error()
+            raise AzureError(f'Não foi possível conectar ao Azure: {e}') from e
+        conn.sock.settimeout(self.timeout)
+        with self._lock:
+            self.connections_opened += 1
+        return conn, False
+    
+    def _count_error(self):
+        with self._lock:
+            self.errors += 1
+    
+    def close(self):
+        """Fecha as conexões paradas no pool e para o event loop das chamadas bloqueantes"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+        self._executor.shutdown(wait=False)
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+    
+    def stats(self):
+        """Contadores para o /status"""
+        with self._lock:
+            return {
+                'model': self.model,
+                'pool_size': self.pool_size,
+                'idle_connections': self._idle.qsize(),
+                'requests': self.requests,
+                'connections_opened': self.connections_opened,
+                'connections_reused': self.connections_reused,
+                'errors': self.errors,
+                'in_flight': self.in_flight,
+                'analyses': self.analyses,
+                'polls_per_analysis': round(self.polls / self.analyses, 2) if self.analyses else None,
+                'time_to_result_p50_ms': self.time_to_result.quantile_ms(0.5),
+                'time_to_result_p99_ms': self.time_to_result.quantile_ms(0.99)
+            }
+
 class CardAnalyzer:
     """
     Sistema de análise de cartão de crédito com Azure AI
@@ -34,50 +1182,118 @@ class CardAnalyzer:
     - Interface web moderna e responsiva
     """
     
-    def __init__(self):
+    def __init__(self, verbose=True, cache_size=VALIDATION_CACHE_SIZE, cache_ttl=VALIDATION_CACHE_TTL,
+                 image_cache_size=IMAGE_CACHE_SIZE):
         self.azure_configured = bool(AZURE_ENDPOINT and AZURE_KEY and 'sua-chave-aqui' not in AZURE_KEY)
+        self.azure_client = AzureReadClient(AZURE_ENDPOINT, AZURE_KEY) if self.azure_configured else None
+        self.cache = ResultCache(cache_size, cache_ttl) if cache_size > 0 else None
+        # A extração muda com o modo (Azure ou simulação): cada um tem seu espaço no cache
+        self.image_cache = (ImageResultCache('app-azure' if self.azure_configured else 'app-simulacao',
+                                             image_cache_size) if image_cache_size > 0 else None)
+        if not verbose:
+            return
         if self.azure_configured:
             print(f"✅ Azure AI configurado: {AZURE_ENDPOINT}")
         else:
             print("⚠️  Azure AI não configurado - funcionará em modo simulação")
     
-    def analyze_image(self, image_data):
+    def analyze_image(self, image_data, digest=None, progress=None):
         """
         Analisa imagem do cartão enviada pelo usuário
         
         Args:
-            image_data: Dados binários da imagem
+            image_data: Dados binários da imagem (bytes ou mmap do upload)
+            digest: SHA-256 (hex) dos bytes, se já calculado no upload
+            progress: progress(etapa, dados) chamado a cada etapa concluída:
+                'ocr_submitted' (só Azure), 'ocr_complete' (extracted_data
+                do OCR) e 'validation' (extracted_data com BIN e validation)
             
         Returns:
             dict: Resultado da análise com dados extraídos e validação
+            (com error, message e timestamp em caso de falha)
         """
         try:
-            if self.azure_configured:
-                # Aqui seria a integração real com Azure Computer Vision
-                extracted_data = self._simulate_azure_extraction(image_data)
+            return self._image_result(image_data, self._cached_extraction(image_data, digest, progress), progress)
+        except Exception as e:
+            return self._image_error(e)
+    
+    async def analyze_image_async(self, image_data, digest=None, progress=None):
+        """
+        Versão asyncio de analyze_image: a consulta ao Azure espera no event
+        loop de quem chama, junto com as demais análises em andamento
+        
+        O image_cache (SHA-256 dos bytes e nível em disco) roda no executor
+        padrão do loop, fora da thread do event loop.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            if self.image_cache is not None:
+                digest, extracted_data = await loop.run_in_executor(None, self._cache_lookup, image_data, digest)
+            else:
+                extracted_data = None
+            cached = extracted_data is not None
+            if not cached:
+                if self.azure_client is not None:
+                    extracted_data = await self.azure_client.analyze_async(image_data, progress)
+                else:
+                    extracted_data = self._simulate_extraction()
+                if self.image_cache is not None:
+                    await loop.run_in_executor(None, self._cache_store, digest, extracted_data)
+            if progress is not None:
+                progress('ocr_complete', {'cached': cached, 'extracted_data': dict(extracted_data)})
+            return self._image_result(image_data, extracted_data, progress)
+        except Exception as e:
+            return self._image_error(e)
+    
+    def _image_result(self, image_data, extracted_data, progress=None):
+        apply_bin_info(extracted_data)
+        
+        validation = self.validate_card_data(extracted_data)
+        if progress is not None:
+            progress('validation', {'extracted_data': dict(extracted_data), 'validation': validation})
+        confidence = self._calculate_confidence(extracted_data, validation)
+        
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'azure_analysis': self.azure_configured,
+            'image_processed': True,
+            'image_size': len(image_data) if image_data else 0,
+            'extracted_data': extracted_data,
+            'validation': validation,
+            'confidence_scores': confidence
+        }
+    
+    @staticmethod
+    def _image_error(e):
+        return build_error(f'Erro na análise: {str(e)}')
+    
+    def _cached_extraction(self, image_data, digest, progress=None):
+        """Extração da imagem, reaproveitada do image_cache para bytes já vistos"""
+        digest, extracted_data = self._cache_lookup(image_data, digest)
+        cached = extracted_data is not None
+        if not cached:
+            if self.azure_client is not None:
+                extracted_data = self.azure_client.analyze(image_data, progress)
             else:
                 # Modo simulação
                 extracted_data = self._simulate_extraction()
-            
-            validation = self.validate_card_data(extracted_data)
-            confidence = self._calculate_confidence(extracted_data, validation)
-            
-            return {
-                'timestamp': datetime.now().isoformat(),
-                'azure_analysis': self.azure_configured,
-                'image_processed': True,
-                'image_size': len(image_data) if image_data else 0,
-                'extracted_data': extracted_data,
-                'validation': validation,
-                'confidence_scores': confidence
-            }
-            
-        except Exception as e:
-            return {
-                'error': True,
-                'message': f'Erro na análise: {str(e)}',
-                'timestamp': datetime.now().isoformat()
-            }
+            self._cache_store(digest, extracted_data)
+        if progress is not None:
+            progress('ocr_complete', {'cached': cached, 'extracted_data': dict(extracted_data)})
+        return extracted_data
+    
+    def _cache_lookup(self, image_data, digest):
+        """(digest, extração do image_cache ou None)"""
+        cache = self.image_cache
+        if cache is None:
+            return digest, None
+        if digest is None:
+            digest = hashlib.sha256(image_data or b'').hexdigest()
+        return digest, cache.get(digest, len(image_data) if image_data else 0)
+    
+    def _cache_store(self, digest, extracted_data):
+        if self.image_cache is not None:
+            self.image_cache.put(digest, extracted_data)
     
     def validate_manual_input(self, card_data):
         """
@@ -89,28 +1305,56 @@ class CardAnalyzer:
         Returns:
             dict: Resultado da validação
         """
-        extracted = {
-            'card_number': card_data.get('cardNumber', ''),
-            'cardholder_name': card_data.get('holderName', ''),
-            'expiry_date': card_data.get('expiryDate', ''),
-            'cvv': card_data.get('cvv', ''),
-            'card_type': self._identify_card_type(card_data.get('cardNumber', ''))
-        }
-        
-        validation = self.validate_card_data(extracted)
+        # O número é normalizado uma vez só para bandeira/BIN, Luhn e cache
+        card_number = card_data.get('cardNumber', '')
+        holder_name = card_data.get('holderName', '')
+        expiry_date = card_data.get('expiryDate', '')
+        cvv = card_data.get('cvv', '')
+        digits = normalize_digits(card_number)
         
-        # Validação específica do CVV
-        cvv_validation = self._validate_cvv(extracted['cvv'], extracted['card_type'])
-        validation['cvv'] = cvv_validation
+        # O resultado só depende destas partes; o CVV entra apenas pelo tamanho
+        cache = self.cache
+        if cache is not None:
+            key = cache.key(digits, 'y' if card_number else 'n', repr(holder_name), repr(expiry_date),
+                            str(len(normalize_digits(cvv))))
+            cached = cache.get(key)
+            if cached is not None:
+                bin_info, validation, confidence = cached
+                return self._manual_result(card_number, holder_name, expiry_date, cvv, bin_info,
+                                           _copy_validation(validation), dict(confidence))
         
-        validation['overall_valid'] = all([
-            validation['card_number']['valid'],
-            validation['expiry_date']['valid'],
-            validation['cardholder_name']['valid'],
-            validation['cvv']['valid']
-        ])
+        bin_info = BIN_TABLE.lookup(digits)
+        result = self._manual_result(card_number, holder_name, expiry_date, cvv, bin_info, None, None,
+                                     pan_digits=digits)
+        if cache is not None:
+            # A validade da data muda na virada do mês: a entrada não passa dela
+            cache.put(key, (bin_info, _copy_validation(result['validation']), dict(result['confidence_scores'])),
+                      until=next_month_start())
+        return result
+    
+    def _manual_result(self, card_number, holder_name, expiry_date, cvv, bin_info, validation, confidence,
+                       pan_digits=None):
+        """Monta o resultado de validate_manual_input (valida se validation for None)"""
+        card_type, bank_name, edition = bin_info
+        extracted = {
+            'card_number': card_number,
+            'cardholder_name': holder_name,
+            'expiry_date': expiry_date,
+            'cvv': cvv,
+            'card_type': card_type,
+            'bank_name': bank_name,
+            'edition': edition
+        }
         
-        confidence = self._calculate_confidence(extracted, validation)
+        if validation is None:
+            validation = self.validate_card_data(extracted, pan_digits=pan_digits)
+            
+            # Validação específica do CVV
+            cvv_validation = self._validate_cvv(cvv, card_type)
+            validation['cvv'] = cvv_validation
+            validation['overall_valid'] = validation['overall_valid'] and cvv_validation['valid']
+            
+            confidence = self._calculate_confidence(extracted, validation)
         
         return {
             'timestamp': datetime.now().isoformat(),
@@ -120,154 +1364,108 @@ class CardAnalyzer:
             'confidence_scores': confidence
         }
     
-    def validate_card_data(self, data):
+    def validate_many(self, records):
+        """
+        Valida vários registros de entrada manual de uma vez
+        
+        Com NumPy instalado, Luhn, expiração, tamanho do CVV e bandeira são
+        calculados como operações vetoriais sobre os dígitos de todos os
+        registros; sem NumPy, cai no validate_manual_input registro a
+        registro. Registros com campos não-ASCII ou que não são strings
+        também usam o caminho escalar, para manter exatamente o mesmo
+        comportamento (dígitos Unicode, exceções).
+        
+        Args:
+            records: lista de dicts no formato de validate_manual_input
+            
+        Returns:
+            list: um resultado por registro, campo a campo igual ao de
+            validate_manual_input
+        """
+        records = list(records)
+        if np is None:
+            return [self.validate_manual_input(record) for record in records]
+        
+        results = [None] * len(records)
+        fast, fields = [], ([], [], [], [])
+        for index, record in enumerate(records):
+            values = (record.get('cardNumber', ''), record.get('holderName', ''),
+                      record.get('expiryDate', ''), record.get('cvv', ''))
+            if all(type(v) is str and v.isascii() for v in values):
+                fast.append(index)
+                for column, value in zip(fields, values):
+                    column.append(value)
+            else:
+                results[index] = self.validate_manual_input(record)
+        
+        if fast:
+            timestamp = datetime.now().isoformat()
+            for index, result in zip(fast, _validate_columns(*fields, timestamp)):
+                results[index] = result
+        return results
+    
+    def validate_card_data(self, data, pan_digits=None):
         """
         Valida dados do cartão usando algoritmos padrão
         
         Args:
             data: dict com dados do cartão
+            pan_digits: dígitos já normalizados do número (opcional)
             
         Returns:
             dict: Resultado detalhado da validação
         """
-        validation = {
-            'card_number': {'valid': False, 'message': ''},
-            'expiry_date': {'valid': False, 'message': ''},
-            'cardholder_name': {'valid': False, 'message': ''},
-            'overall_valid': False
-        }
-        
-        # Validação do número do cartão (Algoritmo de Luhn)
-        if data.get('card_number'):
-            if self._luhn_check(data['card_number']):
-                validation['card_number']['valid'] = True
-                validation['card_number']['message'] = 'Número válido pelo algoritmo de Luhn'
-            else:
-                validation['card_number']['message'] = 'Número inválido (falha no algoritmo de Luhn)'
+        # Validação do número do cartão (regras da bandeira e algoritmo de Luhn)
+        card_number = data.get('card_number')
+        if not card_number:
+            number_check = field_result('card_number', 'missing')
         else:
-            validation['card_number']['message'] = 'Número não encontrado'
+            digits = normalize_digits(card_number) if pan_digits is None else pan_digits
+            card_type = data.get('card_type') or card_type_of(digits)
+            number_check = field_result('card_number', pan_check(digits, card_type), card_type)
         
         # Validação da data de expiração
-        if data.get('expiry_date') and data['expiry_date'] not in ['00/00', 'MM/AA']:
-            if self._validate_expiry_date(data['expiry_date']):
-                validation['expiry_date']['valid'] = True
-                validation['expiry_date']['message'] = 'Data válida e não expirada'
-            else:
-                validation['expiry_date']['message'] = 'Data inválida ou expirada'
+        expiry = data.get('expiry_date')
+        if not expiry or expiry in EXPIRY_PLACEHOLDERS:
+            expiry_check = field_result('expiry_date', 'missing')
         else:
-            validation['expiry_date']['message'] = 'Data não encontrada ou ilegível'
+            expiry_check = field_result('expiry_date', 'valid' if self._validate_expiry_date(expiry) else 'invalid')
         
         # Validação do nome do portador
-        if data.get('cardholder_name') and data['cardholder_name'] not in ['CARDHOLDER NAME', 'NOME DO PORTADOR']:
-            if len(data['cardholder_name'].strip()) >= 2:
-                validation['cardholder_name']['valid'] = True
-                validation['cardholder_name']['message'] = 'Nome válido'
-            else:
-                validation['cardholder_name']['message'] = 'Nome muito curto'
-        else:
-            validation['cardholder_name']['message'] = 'Nome não encontrado ou genérico'
-        
-        validation['overall_valid'] = all([
-            validation['card_number']['valid'],
-            validation['expiry_date']['valid'],
-            validation['cardholder_name']['valid']
-        ])
+        name_check = field_result('cardholder_name', name_verdict(data.get('cardholder_name')))
         
-        return validation
+        return {
+            'card_number': number_check,
+            'expiry_date': expiry_check,
+            'cardholder_name': name_check,
+            'overall_valid': number_check['valid'] and expiry_check['valid'] and name_check['valid']
+        }
     
     def _luhn_check(self, card_number):
         """Implementa o algoritmo de Luhn para validação de cartões"""
         try:
-            # Remove caracteres não numéricos
-            digits = [int(d) for d in re.sub(r'\D', '', str(card_number))]
-            
-            if len(digits) < 13:
-                return False
-            
-            checksum = 0
-            is_even = False
-            
-            # Processa dígitos da direita para esquerda
-            for digit in reversed(digits):
-                if is_even:
-                    digit *= 2
-                    if digit > 9:
-                        digit -= 9
-                checksum += digit
-                is_even = not is_even
-            
-            return checksum % 10 == 0
-            
+            return luhn_valid(normalize_digits(card_number))
         except (ValueError, TypeError):
             return False
     
     def _validate_expiry_date(self, expiry):
         """Valida data de expiração do cartão"""
         try:
-            # Remove caracteres não numéricos
-            clean = re.sub(r'[^0-9]', '', str(expiry))
-            
-            if len(clean) != 4:
-                return False
-            
-            month = int(clean[:2])
-            year = int('20' + clean[2:])
-            
-            if month < 1 or month > 12:
-                return False
-            
-            # Verifica se não está expirado
-            current = datetime.now()
-            expiry_date = datetime(year, month, 1)
-            
-            return expiry_date > current
-            
+            return expiry_valid(expiry)
         except (ValueError, TypeError):
             return False
     
     def _validate_cvv(self, cvv, card_type):
         """Valida CVV baseado no tipo do cartão"""
         try:
-            clean = re.sub(r'\D', '', str(cvv))
-            
-            if card_type == 'American Express':
-                valid = len(clean) == 4
-            else:
-                valid = len(clean) == 3
-            
-            return {
-                'valid': valid,
-                'message': 'CVV válido' if valid else f'CVV inválido para {card_type}'
-            }
+            return field_result('cvv', 'valid' if cvv_valid(cvv, card_type) else 'invalid', card_type)
             
         except (ValueError, TypeError):
-            return {'valid': False, 'message': 'CVV inválido'}
+            return field_result('cvv', 'unreadable')
     
     def _identify_card_type(self, card_number):
         """Identifica o tipo do cartão pelo número"""
-        clean = re.sub(r'\D', '', str(card_number))
-        
-        if clean.startswith('4'):
-            return 'Visa'
-        elif clean.startswith(('5', '2')):
-            return 'Mastercard'
-        elif clean.startswith(('34', '37')):
-            return 'American Express'
-        elif clean.startswith('6'):
-            return 'Discover'
-        else:
-            return 'Desconhecido'
-    
-    def _simulate_azure_extraction(self, image_data):
-        """Simula extração com Azure (para demonstração)"""
-        return {
-            'card_number': '4532 3100 9999 1048',
-            'cardholder_name': 'PORTADOR DO CARTAO',
-            'expiry_date': '12/28',
-            'card_type': 'Visa',
-            'bank_name': 'BANCO EXEMPLO',
-            'confidence': 'high'
-        }
+        return card_type_of(normalize_digits(card_number))
     
     def _simulate_extraction(self):
         """Simulação básica para modo sem Azure"""
@@ -280,33 +1478,1300 @@ class CardAnalyzer:
             'confidence': 'simulated'
         }
     
-    def _calculate_confidence(self, data, validation):
-        """Calcula pontuação de confiança da análise"""
-        scores = {}
+    def _calculate_confidence(self, data, validation):
+        """Calcula pontuação de confiança da análise"""
+        scores = {}
+        
+        scores['card_number'] = 95 if validation['card_number']['valid'] else 20
+        scores['expiry_date'] = 90 if validation['expiry_date']['valid'] else 25
+        scores['cardholder_name'] = 85 if validation['cardholder_name']['valid'] else 30
+        
+        if 'cvv' in validation:
+            scores['cvv'] = 95 if validation['cvv']['valid'] else 15
+        
+        scores['overall'] = sum(scores.values()) // len(scores)
+        
+        return scores
+
+# Motivos de falha por campo (ver FIELD_RESULTS), devolvidos pelo perfil lean.
+# Os valores são contrato com os clientes: não renumerar.
+REASON_NUMBER_MISSING = 101
+REASON_NUMBER_LENGTH = 102
+REASON_NUMBER_CHECKSUM = 103
+REASON_EXPIRY_MISSING = 201
+REASON_EXPIRY_INVALID = 202
+REASON_NAME_MISSING = 301
+REASON_NAME_SHORT = 302
+REASON_CVV_INVALID = 401
+
+REASON_CODES = {
+    REASON_NUMBER_MISSING: 'Número não encontrado',
+    REASON_NUMBER_LENGTH: 'Tamanho do número inválido para a bandeira',
+    REASON_NUMBER_CHECKSUM: 'Falha no algoritmo de Luhn',
+    REASON_EXPIRY_MISSING: 'Data não encontrada ou ilegível',
+    REASON_EXPIRY_INVALID: 'Data inválida ou expirada',
+    REASON_NAME_MISSING: 'Nome não encontrado ou genérico',
+    REASON_NAME_SHORT: 'Nome muito curto',
+    REASON_CVV_INVALID: 'CVV inválido para a bandeira',
+}
+
+# (válido, mensagem, código) de cada campo por veredito. Os dois caminhos
+# de validação (validate_card_data/_validate_cvv e o vetorial
+# _validate_columns) só decidem o veredito e montam o resultado daqui;
+# {card_type} é substituído pela bandeira.
+FIELD_RESULTS = {
+    'card_number': {
+        'missing': (False, 'Número não encontrado', REASON_NUMBER_MISSING),
+        'luhn': (True, 'Número válido pelo algoritmo de Luhn', 0),
+        'unchecked': (True, 'Número válido', 0),
+        'length': (False, 'Número inválido (tamanho inválido para {card_type})', REASON_NUMBER_LENGTH),
+        'checksum': (False, 'Número inválido (falha no algoritmo de Luhn)', REASON_NUMBER_CHECKSUM),
+    },
+    'expiry_date': {
+        'missing': (False, 'Data não encontrada ou ilegível', REASON_EXPIRY_MISSING),
+        'valid': (True, 'Data válida e não expirada', 0),
+        'invalid': (False, 'Data inválida ou expirada', REASON_EXPIRY_INVALID),
+    },
+    'cardholder_name': {
+        'missing': (False, 'Nome não encontrado ou genérico', REASON_NAME_MISSING),
+        'valid': (True, 'Nome válido', 0),
+        'short': (False, 'Nome muito curto', REASON_NAME_SHORT),
+    },
+    'cvv': {
+        'valid': (True, 'CVV válido', 0),
+        'invalid': (False, 'CVV inválido para {card_type}', REASON_CVV_INVALID),
+        'unreadable': (False, 'CVV inválido', REASON_CVV_INVALID),
+    },
+}
+
+# Valores que o OCR devolve quando não conseguiu ler o campo
+EXPIRY_PLACEHOLDERS = ('00/00', 'MM/AA')
+NAME_PLACEHOLDERS = ('CARDHOLDER NAME', 'NOME DO PORTADOR')
+
+# Mensagem de falha -> código, para o perfil lean (as mensagens com
+# {card_type} são reconhecidas pelo texto antes da bandeira)
+_REASON_BY_MESSAGE = {message: code for checks in FIELD_RESULTS.values()
+                      for valid, message, code in checks.values() if not valid and '{' not in message}
+_REASON_BY_PREFIX = tuple((message.partition('{')[0], code) for checks in FIELD_RESULTS.values()
+                          for valid, message, code in checks.values() if not valid and '{' in message)
+
+def field_result(field, verdict, card_type=None):
+    """{'valid': bool, 'message': str} de um campo para o veredito (ver FIELD_RESULTS)"""
+    valid, message, _ = FIELD_RESULTS[field][verdict]
+    if '{' in message:
+        message = message.format(card_type=card_type)
+    return {'valid': valid, 'message': message}
+
+def reason_code(check):
+    """Código (REASON_CODES) de um campo reprovado, pela mensagem de FIELD_RESULTS"""
+    message = check['message']
+    code = _REASON_BY_MESSAGE.get(message)
+    if code is None:
+        code = next((code for prefix, code in _REASON_BY_PREFIX if message.startswith(prefix)), 0)
+    return code
+
+def name_verdict(name):
+    """Veredito do nome do portador: 'missing', 'valid' ou 'short'"""
+    if not name or name in NAME_PLACEHOLDERS:
+        return 'missing'
+    return 'valid' if len(name.strip()) >= 2 else 'short'
+
+def strip_lines(text):
+    """
+    Minificação conservadora: remove indentação e linhas vazias. As quebras
+    de linha são mantidas para não alterar o JavaScript (inserção automática
+    de ponto e vírgula, comentários //).
+    """
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+def minify_html(html):
+    """Remove comentários HTML e aplica strip_lines"""
+    return strip_lines(re.sub(r'<!--.*?-->', '', html, flags=re.S))
+
+def parse_accept_encoding(header):
+    """Converte Accept-Encoding em {codificação: q}"""
+    weights = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    return weights
+
+def choose_encoding(header, available):
+    """Escolhe a melhor codificação de `available` aceita pelo cliente (ou 'identity')"""
+    weights = parse_accept_encoding(header)
+    best, best_q = 'identity', 0.0
+    for coding in available:
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def compress_response(body, accept_encoding, min_size=JSON_COMPRESS_MIN_SIZE, level=JSON_COMPRESS_LEVEL):
+    """
+    Comprime uma resposta dinâmica conforme o Accept-Encoding
+    
+    Retorna (corpo, headers). Corpos menores que min_size saem como estão
+    e sem Vary, já que não dependem do Accept-Encoding.
+    """
+    if len(body) < min_size:
+        return body, []
+    
+    headers = [('Vary', 'Accept-Encoding')]
+    encoding = choose_encoding(accept_encoding, ['gzip', 'deflate'])
+    if encoding == 'identity':
+        return body, headers
+    
+    # wbits=31 gera o formato gzip, 15 o formato zlib usado pelo 'deflate' do HTTP
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31 if encoding == 'gzip' else 15)
+    compressed = compressor.compress(body) + compressor.flush()
+    if len(compressed) >= len(body):
+        return body, headers
+    return compressed, headers + [('Content-Encoding', encoding)]
+
+def etag_matches(if_none_match, etag):
+    """Comparação fraca de If-None-Match (RFC 7232)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+class StaticPayload:
+    """
+    Resposta estática codificada uma única vez, com variante gzip
+    
+    Cada variante tem ETag próprio; negotiate() escolhe a variante pelo
+    Accept-Encoding e devolve 304 quando o If-None-Match confere.
+    """
+    
+    def __init__(self, body, content_type, cache_control='no-cache', compress=True):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {'identity': (body, f'"{self.digest}"')}
+        if compress:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = (compressed, f'"{self.digest}-gz"')
+    
+    @classmethod
+    def from_html(cls, html, **kwargs):
+        return cls(minify_html(html).encode('utf-8'), 'text/html; charset=utf-8', **kwargs)
+    
+    def negotiate(self, accept_encoding, if_none_match):
+        """Retorna (status, corpo, headers) para a requisição"""
+        encoding = choose_encoding(accept_encoding, [c for c in self.variants if c != 'identity'])
+        body, etag = self.variants[encoding]
+        
+        headers = [('ETag', etag), ('Cache-Control', self.cache_control)]
+        if len(self.variants) > 1:
+            headers.append(('Vary', 'Accept-Encoding'))
+        if etag_matches(if_none_match, etag):
+            return 304, b'', headers
+        if encoding != 'identity':
+            headers.append(('Content-Encoding', encoding))
+        return 200, body, headers
+
+class StaticAssets:
+    """
+    Registro de assets estáticos servidos por URL com fingerprint
+    
+    A URL inclui o hash do conteúdo, então muda sempre que o conteúdo muda
+    e a resposta pode ser cacheada para sempre (immutable).
+    """
+    
+    prefix = '/static/'
+    cache_control = 'public, max-age=31536000, immutable'
+    
+    def __init__(self):
+        self._payloads = {}
+    
+    def add(self, name, body, content_type):
+        """Registra um asset e retorna sua URL com fingerprint"""
+        payload = StaticPayload(body, content_type, self.cache_control)
+        stem, _, ext = name.rpartition('.')
+        url = f'{self.prefix}{stem}.{payload.digest[:12]}.{ext}'
+        self._payloads[url] = payload
+        return url
+    
+    def get(self, path):
+        return self._payloads.get(path)
+    
+    def externalize(self, html, name, icon_url=None):
+        """
+        Move o <style> e o <script> inline da página para assets
+        
+        Retorna o HTML reduzido, que só referencia as URLs com fingerprint.
+        O script continua no mesmo lugar (fim do body) e sem defer, então a
+        ordem de execução não muda.
+        """
+        def style(match):
+            url = self.add(f'{name}.css', strip_lines(match.group(1)).encode('utf-8'), 'text/css; charset=utf-8')
+            return f'<link rel="stylesheet" href="{url}">'
+        
+        def script(match):
+            url = self.add(f'{name}.js', strip_lines(match.group(1)).encode('utf-8'),
+                           'application/javascript; charset=utf-8')
+            return f'<script src="{url}"></script>'
+        
+        html = re.sub(r'<style>(.*?)</style>', style, html, count=1, flags=re.S)
+        html = re.sub(r'<script>(.*?)</script>', script, html, count=1, flags=re.S)
+        if icon_url:
+            html = html.replace('</head>', f'<link rel="icon" href="{icon_url}">\n</head>', 1)
+        return html
+
+def build_status(analyzer, jobs=None):
+    """Monta o payload de /status (compartilhado entre as engines)"""
+    return {
+        'status': 'online',
+        'azure_configured': analyzer.azure_configured,
+        'timestamp': datetime.now().isoformat(),
+        'version': '2.0.0',
+        'bin_ranges': BIN_TABLE.ranges,
+        'json_codec': JSON_CODEC.name,
+        'validation_cache': analyzer.cache.stats() if analyzer.cache is not None else None,
+        'upload_rejections': upload_rejections(),
+        'image_cache': analyzer.image_cache.stats() if analyzer.image_cache is not None else None,
+        'azure_client': analyzer.azure_client.stats() if analyzer.azure_client is not None else None,
+        'jobs': jobs.stats() if jobs is not None else None
+    }
+
+def job_accepted(job):
+    """Payload da resposta 202 de POST /jobs"""
+    return {'job_id': job.id, 'status': job.status, 'status_url': f'/jobs/{job.id}',
+            'events_url': f'/jobs/{job.id}/events', 'submitted_at': job.submitted_at}
+
+def sse_event(index, event):
+    """Mensagem Server-Sent Events de uma etapa (id = posição no job, data = JSON numa linha)"""
+    return b'id: %d\nevent: %s\ndata: %s\n\n' % (index, event['stage'].encode('ascii'),
+                                                  JSON_CODEC.dumps(event, compact=True))
+
+def sse_resume(last_event_id):
+    """Primeira etapa a enviar numa reconexão (cabeçalho Last-Event-ID)"""
+    try:
+        return max(0, int(last_event_id) + 1)
+    except (TypeError, ValueError):
+        return 0
+
+def build_error(message):
+    """Monta o payload padrão de erro da API"""
+    return {
+        'error': True,
+        'message': message,
+        'timestamp': datetime.now().isoformat()
+    }
+
+_VALIDATED_FIELDS = ('card_number', 'expiry_date', 'cardholder_name', 'cvv')
+
+def reason_codes(validation):
+    """Códigos (REASON_CODES) dos campos reprovados, na ordem dos campos"""
+    return [reason_code(validation[name]) for name in _VALIDATED_FIELDS
+            if name in validation and not validation[name]['valid']]
+
+# Perfil lean: campo -> valor tirado do resultado já calculado (sem eco da entrada)
+LEAN_FIELDS = {
+    'valid': lambda result: result['validation']['overall_valid'],
+    'reasons': lambda result: reason_codes(result['validation']),
+    'card_type': lambda result: result['extracted_data'].get('card_type'),
+    'bank_name': lambda result: result['extracted_data'].get('bank_name'),
+    'edition': lambda result: result['extracted_data'].get('edition'),
+    'score': lambda result: result['confidence_scores']['overall'],
+    'timestamp': lambda result: result['timestamp'],
+}
+
+if not set(LEAN_DEFAULT_FIELDS) <= LEAN_FIELDS.keys():
+    raise ValueError(f'LEAN_DEFAULT_FIELDS inválido: {",".join(LEAN_DEFAULT_FIELDS)}')
+
+def response_fields(query, profile=None, fields=None):
+    """
+    Campos do perfil lean pedidos pelo cliente, ou None para o perfil completo
+    
+    O perfil vem de ?profile=lean ou do cabeçalho X-Response-Profile e os
+    campos de ?fields=a,b ou de X-Response-Fields; a query vence o
+    cabeçalho. Escolher campos já implica o perfil lean.
+    """
+    params = parse_qs(query) if query else {}
+    profile = (params.get('profile', [profile])[-1] or '').strip().lower()
+    fields = params.get('fields', [fields])[-1]
+    if profile not in ('', 'full', 'lean'):
+        raise RequestError(f'Perfil de resposta inválido: {profile}')
+    if profile == 'full' or not (profile or fields):
+        return None
+    if not fields:
+        return LEAN_DEFAULT_FIELDS
+    
+    selected = tuple(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+    unknown = [name for name in selected if name not in LEAN_FIELDS]
+    if unknown or not selected:
+        raise RequestError(f'Campos inválidos: {", ".join(unknown) or fields} '
+                           f'(disponíveis: {", ".join(LEAN_FIELDS)})')
+    return selected
+
+def lean_view(result, fields):
+    """Payload do perfil lean com os campos pedidos; erros passam inalterados"""
+    if result.get('error'):
+        return result
+    return {name: LEAN_FIELDS[name](result) for name in fields}
+
+def _ragged_digits(values):
+    """
+    Extrai os dígitos ASCII de várias strings de uma vez (NumPy)
+    
+    Os dígitos de todos os registros ficam num único vetor plano, sem
+    matriz com padding (um registro com milhares de dígitos não aumenta o
+    custo dos outros).
+    
+    Returns:
+        tuple: (dígitos, registro de cada dígito, posição do dígito dentro
+        do registro, total de dígitos por registro)
+    """
+    count = len(values)
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=count)
+    buffer = np.frombuffer(''.join(values).encode('ascii'), dtype=np.uint8)
+    is_digit = (buffer >= 48) & (buffer <= 57)
+    
+    digits = buffer[is_digit].astype(np.int64) - 48
+    owner = np.repeat(np.arange(count), lengths)[is_digit]
+    counts = np.bincount(owner, minlength=count)
+    position = np.arange(len(digits)) - (np.cumsum(counts) - counts)[owner]
+    return digits, owner, position, counts
+
+def _digit_at(digits, owner, position, index, count):
+    """Dígito na posição `index` de cada registro (-1 se não existir)"""
+    column = np.full(count, -1, dtype=np.int64)
+    mask = position == index
+    column[owner[mask]] = digits[mask]
+    return column
+
+def _validate_columns(numbers, names, expiries, cvvs, timestamp):
+    """Núcleo vetorial de CardAnalyzer.validate_many (colunas de strings ASCII)"""
+    count = len(numbers)
+    
+    # Luhn: dobra dígitos em posição ímpar a partir da direita
+    digits, owner, position, pan_len = _ragged_digits(numbers)
+    from_right = pan_len[owner] - 1 - position
+    weighted = np.where(from_right % 2 == 1, digits * 2, digits)
+    weighted -= np.where(weighted > 9, 9, 0)
+    checksum = np.bincount(owner, weights=weighted, minlength=count).astype(np.int64)
+    luhn_ok = (pan_len >= 13) & (checksum % 10 == 0)
+    
+    # Bandeira/BIN: chave com os primeiros dígitos (completada com 0), busca na tabela
+    width = BinTable.KEY_DIGITS
+    head = position < width
+    weights = 10 ** (width - 1 - position[head])
+    keys = np.bincount(owner[head], weights=digits[head] * weights, minlength=count).astype(np.int64)
+    bins = BIN_TABLE.lookup_keys(keys, pan_len)
+    pan_len = pan_len.tolist()
+    
+    # Expiração MMAA: o mês de expiração precisa ser posterior ao atual
+    digits, owner, position, exp_len = _ragged_digits(expiries)
+    month = _digit_at(digits, owner, position, 0, count) * 10 + _digit_at(digits, owner, position, 1, count)
+    year = 2000 + _digit_at(digits, owner, position, 2, count) * 10 + _digit_at(digits, owner, position, 3, count)
+    now = datetime.now()
+    expiry_ok = (exp_len == 4) & (month >= 1) & (month <= 12) & (year * 12 + month > now.year * 12 + now.month)
+    
+    # CVV: tamanho conferido contra as regras da bandeira no laço abaixo
+    cvv_len = _ragged_digits(cvvs)[3].tolist()
+    rules = CARD_RULES
+    
+    # Listas Python: indexar arrays NumPy elemento a elemento é lento
+    luhn_ok, expiry_ok = luhn_ok.tolist(), expiry_ok.tolist()
+    
+    results = []
+    for i, (number, name, expiry, cvv) in enumerate(zip(numbers, names, expiries, cvvs)):
+        card_type_name, bank_name, edition = bins[i]
+        rule = rules.get(card_type_name, DEFAULT_CARD_RULE)
+        
+        if not number:
+            verdict = 'missing'
+        elif pan_len[i] not in rule.pan_lengths:
+            verdict = 'length'
+        elif not rule.luhn:
+            verdict = 'unchecked'
+        else:
+            verdict = 'luhn' if luhn_ok[i] else 'checksum'
+        number_check = field_result('card_number', verdict, card_type_name)
+        
+        if not expiry or expiry in EXPIRY_PLACEHOLDERS:
+            verdict = 'missing'
+        else:
+            verdict = 'valid' if expiry_ok[i] else 'invalid'
+        expiry_check = field_result('expiry_date', verdict)
+        
+        name_check = field_result('cardholder_name', name_verdict(name))
+        cvv_check = field_result('cvv', 'valid' if cvv_len[i] in rule.cvv_lengths else 'invalid', card_type_name)
+        
+        scores = {
+            'card_number': 95 if number_check['valid'] else 20,
+            'expiry_date': 90 if expiry_check['valid'] else 25,
+            'cardholder_name': 85 if name_check['valid'] else 30,
+            'cvv': 95 if cvv_check['valid'] else 15
+        }
+        scores['overall'] = sum(scores.values()) // 4
+        
+        validation = {
+            'card_number': number_check,
+            'expiry_date': expiry_check,
+            'cardholder_name': name_check,
+            'overall_valid': number_check['valid'] and expiry_check['valid'] and name_check['valid'] and cvv_check['valid'],
+            'cvv': cvv_check
+        }
+        
+        results.append({
+            'timestamp': timestamp,
+            'manual_input': True,
+            'extracted_data': {
+                'card_number': number,
+                'cardholder_name': name,
+                'expiry_date': expiry,
+                'cvv': cvv,
+                'card_type': card_type_name,
+                'bank_name': bank_name,
+                'edition': edition
+            },
+            'validation': validation,
+            'confidence_scores': scores
+        })
+    return results
+
+class BatchValidator:
+    """
+    Validação incremental de um corpo NDJSON (rota /validate/batch)
+    
+    feed() recebe pedaços arbitrários do corpo e devolve as linhas de
+    resultado já prontas, em NDJSON e na ordem de entrada. No máximo
+    batch_size registros e uma linha parcial ficam em memória, então o
+    consumo não depende do tamanho do lote. Linhas inválidas viram uma
+    linha de erro com o número da linha, sem interromper o lote.
+    Com fields (ver response_fields), cada resultado sai no perfil lean.
+    """
+    
+    def __init__(self, analyzer, batch_size=BATCH_SIZE, max_line=BATCH_MAX_LINE, first_line=0, fields=None):
+        self.analyzer = analyzer
+        self.fields = fields
+        self.batch_size = max(1, batch_size)
+        self.max_line = max_line
+        self.line_number = first_line
+        self.records = 0
+        self.valid = 0
+        self.errors = 0
+        self.card_types = Counter()
+        self.failures = Counter()
+        self._partial = bytearray()
+        self._skipping = False
+        self._pending = []
+    
+    def feed(self, data):
+        """Processa um pedaço do corpo; retorna bytes de saída (pode ser b'')"""
+        output = []
+        start = 0
+        while True:
+            end = data.find(b'\n', start)
+            if end < 0:
+                break
+            self._partial += data[start:end]
+            self._line(output)
+            start = end + 1
+        
+        if not self._skipping:
+            self._partial += data[start:]
+            if len(self._partial) > self.max_line:
+                # Linha longa demais: descarta até a próxima quebra de linha
+                self._partial.clear()
+                self._skipping = True
+        return b''.join(output)
+    
+    def finish(self):
+        """Processa a última linha (sem \\n final) e o lote pendente"""
+        output = []
+        if self._partial or self._skipping:
+            self._line(output)
+        self._flush(output)
+        return b''.join(output)
+    
+    def _line(self, output):
+        self.line_number += 1
+        line, skipped = bytes(self._partial), self._skipping
+        self._partial.clear()
+        self._skipping = False
+        
+        if skipped:
+            self._queue(self._error(f'Linha maior que {self.max_line} bytes'), output)
+        elif line.strip():
+            try:
+                record = JSON_CODEC.loads(line)
+            except JsonError as e:
+                self._queue(self._error(str(e)), output)
+            else:
+                if isinstance(record, dict):
+                    self._queue(record, output)
+                else:
+                    self._queue(self._error('Registro deve ser um objeto JSON'), output)
+    
+    def add(self, record):
+        """Enfileira um registro já decodificado (ex.: linha de CSV); retorna bytes de saída"""
+        self.line_number += 1
+        output = []
+        self._queue(record, output)
+        return b''.join(output)
+    
+    def add_error(self, message):
+        """Registra uma linha inválida lida fora do feed(); retorna bytes de saída"""
+        self.line_number += 1
+        output = []
+        self._queue(self._error(message), output)
+        return b''.join(output)
+    
+    def _queue(self, item, output):
+        if isinstance(item, _BatchError):
+            self.errors += 1
+        else:
+            self.records += 1
+        self._pending.append(item)
+        if len(self._pending) >= self.batch_size:
+            self._flush(output)
+    
+    def _error(self, message):
+        error = build_error(message)
+        error['line'] = self.line_number
+        return _BatchError(error)
+    
+    def _flush(self, output):
+        if not self._pending:
+            return
+        records = [item for item in self._pending if not isinstance(item, _BatchError)]
+        results = iter(self.analyzer.validate_many(records))
+        for item in self._pending:
+            if isinstance(item, _BatchError):
+                line = JSON_CODEC.dumps(item.payload)
+            else:
+                result = next(results)
+                validation = result['validation']
+                self.card_types[result['extracted_data']['card_type']] += 1
+                if validation['overall_valid']:
+                    self.valid += 1
+                else:
+                    self.failures.update(field for field in ('card_number', 'expiry_date', 'cardholder_name', 'cvv')
+                                         if not validation[field]['valid'])
+                if self.fields is None:
+                    line = JSON_CODEC.dumps(result)
+                else:
+                    line = JSON_CODEC.dumps(lean_view(result, self.fields), compact=True)
+            output.append(line + b'\n')
+        self._pending = []
+
+class _BatchError:
+    """Linha de erro na fila do BatchValidator (não passa pela validação)"""
+    
+    __slots__ = ('payload',)
+    
+    def __init__(self, payload):
+        self.payload = payload
+
+_HEADER_PARAM = re.compile(r';\s*([\w*.-]+)\s*=\s*(?:"((?:[^"\\]|\\.)*)"|([^;]*))')
+
+def header_params(value):
+    """Parâmetros de um cabeçalho como Content-Type/Content-Disposition (nomes em minúsculas)"""
+    return {match.group(1).lower(): match.group(2) if match.group(2) is not None else match.group(3).strip()
+            for match in _HEADER_PARAM.finditer(value or '')}
+
+def is_chunked(transfer_encoding):
+    """Se o cabeçalho Transfer-Encoding da requisição pede corpo chunked"""
+    return 'chunked' in (transfer_encoding or '').lower()
+
+def parse_content_length(value):
+    """Tamanho do corpo no cabeçalho Content-Length (0 sem o cabeçalho); malformado é 400"""
+    if value is None:
+        return 0
+    value = value.strip()
+    # int() aceitaria '+5', '-1' e '1_000'
+    if not (value.isascii() and value.isdigit()):
+        raise RequestError('Content-Length inválido')
+    return int(value)
+
+def parse_chunk_size(line):
+    """Tamanho do chunk na linha 'hex[;extensões]\\r\\n' de um corpo chunked"""
+    if not line:
+        raise ConnectionAbortedError
+    try:
+        if not line.endswith(b'\n'):
+            raise ValueError
+        size = int(line.split(b';', 1)[0].strip(), 16)
+        if size < 0:
+            raise ValueError
+    except ValueError:
+        raise RequestError('Corpo chunked malformado') from None
+    return size
+
+_HEIC_BRANDS = (b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1')
+
+def sniff_image_type(head):
+    """Formato da imagem pelos bytes iniciais (jpeg, png, webp ou heic), ou None"""
+    if head[:3] == b'\xff\xd8\xff':
+        return 'jpeg'
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp' and head[8:12] in _HEIC_BRANDS:
+        return 'heic'
+    return None
+
+# Uploads recusados por motivo (expect_too_large, too_large, not_image), para o /status
+_upload_rejections = Counter()
+_upload_rejections_lock = threading.Lock()
+
+def upload_rejected(reason, message, status=400):
+    """Conta a recusa de um upload e devolve o RequestError para levantar"""
+    with _upload_rejections_lock:
+        _upload_rejections[reason] += 1
+    return RequestError(message, status)
+
+def upload_rejections():
+    """Cópia dos contadores de uploads recusados"""
+    with _upload_rejections_lock:
+        return dict(_upload_rejections)
+
+# Rotas cujo corpo é uma imagem (UploadParser)
+UPLOAD_ROUTES = ('/upload-image', '/jobs')
+
+def check_content_length(route, length, reason='too_large'):
+    """Recusa (413) um Content-Length declarado acima do limite da rota, antes de ler o corpo"""
+    if route in UPLOAD_ROUTES and length > MAX_FILE_SIZE + UPLOAD_OVERHEAD:
+        raise upload_rejected(reason, f'Arquivo maior que {MAX_FILE_SIZE} bytes', 413)
+    if route == '/validate' and length > JSON_CODEC.max_body:
+        raise JsonError(f'Corpo JSON maior que {JSON_CODEC.max_body} bytes', 413)
+
+class UploadParser:
+    """
+    Parser incremental do corpo de /upload-image
+    
+    feed() recebe pedaços arbitrários do corpo. Em multipart/form-data só a
+    parte do arquivo (campo `field` ou a primeira com filename) é guardada,
+    num SpooledTemporaryFile: até spool_size bytes em memória e o resto em
+    disco; as demais partes são descartadas enquanto chegam. Outros tipos
+    de conteúdo são tratados como a imagem crua. O buffer interno guarda no
+    máximo um pedaço mais o tamanho do delimitador, e passar de
+    max_file_size interrompe a leitura com RequestError 413. Com sniff, os
+    primeiros SNIFF_SIZE bytes do arquivo precisam ser de JPEG, PNG, WebP ou
+    HEIC (sniff_image_type); senão a leitura para ali com RequestError 415.
+    
+    Uso: with UploadParser(content_type) as upload: feed()..., finish(),
+    upload.data().
+    """
+    
+    _PREAMBLE, _DELIMITER, _HEADERS, _BODY, _DONE = range(5)
+    
+    def __init__(self, content_type, max_file_size=MAX_FILE_SIZE, spool_size=UPLOAD_SPOOL_SIZE, field='image',
+                 sniff=True):
+        self.max_file_size = max_file_size
+        self.spool_size = spool_size
+        self.field = field
+        self.sniff = sniff
+        self.size = 0
+        self.received = 0
+        self.filename = None
+        self.content_type = None
+        self.image_type = None
+        self._sha256 = None
+        self._spool = None
+        self._view = None
+        self._writing = False
+        self._head = None
+        
+        if (content_type or '').split(';')[0].strip().lower().startswith('multipart/'):
+            boundary = header_params(content_type).get('boundary')
+            if not boundary:
+                raise RequestError('Cabeçalho multipart sem boundary')
+            # O CRLF inicial faz o primeiro delimitador casar com o mesmo padrão dos outros
+            self._delimiter = b'\r\n--' + boundary.encode('latin-1')
+            self._buffer = bytearray(b'\r\n')
+            self._state = self._PREAMBLE
+        else:
+            self._delimiter = None
+            self.content_type = content_type
+            self._start_file()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def feed(self, data):
+        """Processa um pedaço do corpo (bytes, bytearray ou memoryview)"""
+        self.received += len(data)
+        if self.received > self.max_file_size + UPLOAD_OVERHEAD:
+            raise upload_rejected('too_large', f'Arquivo maior que {self.max_file_size} bytes', 413)
+        if self._delimiter is None:
+            self._write(data)
+            return
+        self._buffer += data
+        self._parse()
+    
+    def finish(self):
+        """Confere o fim do corpo (o multipart precisa do delimitador final)"""
+        if self._delimiter is not None and self._state != self._DONE:
+            raise RequestError('Corpo multipart incompleto')
+        self._end_file()
+        if self._spool is not None:
+            self._spool.flush()
+    
+    def data(self):
+        """
+        Conteúdo do arquivo, ou None se nenhum arquivo veio no corpo
+        
+        Abaixo de spool_size é uma cópia em bytes do que está em memória;
+        acima, o arquivo já está em disco e volta mapeado (mmap, sem cópia).
+        Vale até close().
+        """
+        if self._spool is None:
+            return None
+        if self._view is None:
+            # O SpooledTemporaryFile vai para disco quando passa de max_size
+            if self.size > self.spool_size:
+                self._view = mmap.mmap(self._spool.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._spool.seek(0)
+                self._view = self._spool.read()
+        return self._view
+    
+    def sha256(self):
+        """SHA-256 (hex) do arquivo, calculado enquanto o corpo chegava"""
+        return self._sha256.hexdigest() if self._sha256 is not None else None
+    
+    def close(self):
+        if isinstance(self._view, mmap.mmap):
+            self._view.close()
+        self._view = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+    
+    def _start_file(self):
+        self._spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        self._sha256 = hashlib.sha256()
+        self._writing = True
+        if self.sniff:
+            self._head = bytearray()
+    
+    def _end_file(self):
+        # Arquivo menor que SNIFF_SIZE: confere com o que chegou
+        if self._head:
+            self._check_head()
+        self._writing = False
+    
+    def _write(self, data):
+        if not self._writing:
+            return
+        self.size += len(data)
+        if self.size > self.max_file_size:
+            raise upload_rejected('too_large', f'Arquivo maior que {self.max_file_size} bytes', 413)
+        if self._head is not None:
+            self._head += data[:SNIFF_SIZE - len(self._head)]
+            if len(self._head) >= SNIFF_SIZE:
+                self._check_head()
+        self._sha256.update(data)
+        self._spool.write(data)
+    
+    def _check_head(self):
+        self.image_type = sniff_image_type(self._head)
+        self._head = None
+        if self.image_type is None:
+            raise upload_rejected('not_image', 'Arquivo não é uma imagem JPEG, PNG, WebP ou HEIC', 415)
+    
+    def _parse(self):
+        buffer, delimiter = self._buffer, self._delimiter
+        while True:
+            if self._state in (self._PREAMBLE, self._BODY):
+                end = buffer.find(delimiter)
+                if end < 0:
+                    # Guarda só o que ainda pode ser o começo de um delimitador
+                    end = len(buffer) - len(delimiter) + 1
+                    if end > 0:
+                        with memoryview(buffer) as view:
+                            self._write(view[:end])
+                        del buffer[:end]
+                    return
+                with memoryview(buffer) as view:
+                    self._write(view[:end])
+                del buffer[:end + len(delimiter)]
+                self._end_file()
+                self._state = self._DELIMITER
+            
+            elif self._state == self._DELIMITER:
+                if buffer[:2] == b'--':
+                    buffer.clear()
+                    self._state = self._DONE
+                    return
+                end = buffer.find(b'\r\n')
+                if end < 0:
+                    if len(buffer) > UPLOAD_MAX_PART_HEADERS:
+                        raise RequestError('Delimitador multipart inválido')
+                    return
+                del buffer[:end + 2]
+                self._state = self._HEADERS
+            
+            elif self._state == self._HEADERS:
+                end = -2 if buffer[:2] == b'\r\n' else buffer.find(b'\r\n\r\n')
+                if end == -1:
+                    if len(buffer) > UPLOAD_MAX_PART_HEADERS:
+                        raise RequestError('Cabeçalhos da parte multipart grandes demais')
+                    return
+                headers = bytes(buffer[:max(end, 0)]).decode('utf-8', 'replace')
+                del buffer[:end + 4]
+                self._start_part(headers)
+                self._state = self._BODY
+            
+            else:
+                # Epílogo depois do delimitador final: ignorado
+                buffer.clear()
+                return
+    
+    def _start_part(self, block):
+        headers = {}
+        for line in block.split('\r\n'):
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        disposition = header_params(headers.get('content-disposition'))
+        if self._spool is None and (disposition.get('name') == self.field or 'filename' in disposition):
+            self.filename = disposition.get('filename')
+            self.content_type = headers.get('content-type')
+            self._start_file()
+
+class Job:
+    """
+    Análise de imagem enfileirada no JobQueue (status: queued, running, done)
+    
+    events guarda as etapas já concluídas, na ordem ('upload',
+    'ocr_submitted', 'ocr_complete', 'validation', 'done'); waiters são
+    chamados (sem argumentos) a cada etapa nova.
+    """
+    
+    __slots__ = ('id', 'status', 'upload', 'result', 'submitted_at', 'submitted', 'started', 'finished',
+                 'events', 'waiters')
+    
+    def __init__(self, upload):
+        self.id = secrets.token_urlsafe(16)
+        self.status = 'queued'
+        self.upload = upload
+        self.result = None
+        self.submitted_at = datetime.now().isoformat()
+        self.submitted = time.monotonic()
+        self.started = self.finished = None
+        self.events = []
+        self.waiters = []
+    
+    def event(self, stage, data):
+        """Registra a etapa (chamar com o lock do JobQueue) e devolve os waiters a acordar"""
+        self.events.append({'stage': stage, 'elapsed_ms': round((time.monotonic() - self.submitted) * 1000, 1),
+                            **data})
+        return tuple(self.waiters)
+    
+    def view(self):
+        """Payload de GET /jobs/{id} (result é o mesmo de analyze_image)"""
+        data = {'job_id': self.id, 'status': self.status, 'submitted_at': self.submitted_at}
+        if self.started is not None:
+            data['wait_ms'] = round((self.started - self.submitted) * 1000, 1)
+        if self.finished is not None:
+            data['service_ms'] = round((self.finished - self.started) * 1000, 1)
+            data['result'] = self.result
+        return data
+
+class JobQueue:
+    """
+    Fila de análises de imagem atendida por um pool fixo de workers
+    
+    submit() só enfileira e devolve o Job na hora; os workers rodam
+    analyze_image fora das conexões HTTP, então o tamanho do pool não
+    depende da concorrência do servidor. Com a fila cheia o job é recusado
+    com 503. Jobs concluídos ficam disponíveis por ttl segundos (no máximo
+    max_retained deles, os mais antigos saem primeiro). stats() traz a
+    profundidade da fila e os quantis de espera e de atendimento: workers
+    suficientes ficam perto de taxa de chegada x atendimento p50.
+    
+    Os jobs vivem no processo que os recebeu (com --processes > 1 o GET
+    pode cair em outro worker).
+    """
+    
+    def __init__(self, analyzer, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE, ttl=JOB_TTL,
+                 max_retained=JOB_MAX_RETAINED):
+        self.analyzer = analyzer
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.ttl = ttl
+        self.max_retained = max(0, int(max_retained))
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._jobs = {}
+        self._done = OrderedDict()  # id -> fim (monotonic), na ordem de conclusão
+        self._lock = threading.Lock()
+        self.wait_time = LatencyWindow()
+        self.service_time = LatencyWindow()
+        self.submitted = self.completed = self.rejected = self.expired = 0
+        self.busy = self.max_queued = 0
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def submit(self, upload):
+        """
+        Enfileira a análise do upload (UploadParser já lido) e devolve o Job
+        
+        O JobQueue passa a ser dono do upload e o fecha depois da análise
+        (ou já na recusa, com RequestError 503).
+        """
+        job = Job(upload)
+        job.event('upload', {'image_size': upload.size, 'image_type': upload.image_type})
+        with self._lock:
+            self._expire(job.submitted)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                upload.close()
+                raise RequestError('Fila de análises cheia, tente novamente', 503) from None
+            self._jobs[job.id] = job
+            self.submitted += 1
+            self.max_queued = max(self.max_queued, self._queue.qsize())
+        return job
+    
+    def get(self, job_id):
+        """Job pelo id, ou None (desconhecido ou expirado)"""
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._jobs.get(job_id)
+    
+    def events(self, job, start=0):
+        """(etapas do job a partir da posição start, se o job já terminou)"""
+        with self._lock:
+            return job.events[start:], job.status == 'done'
+    
+    def subscribe(self, job, wake):
+        """Chama wake() (de outra thread) a cada etapa nova do job"""
+        with self._lock:
+            job.waiters.append(wake)
+    
+    def unsubscribe(self, job, wake):
+        with self._lock:
+            job.waiters.remove(wake)
+    
+    def _progress(self, job, stage, data):
+        with self._lock:
+            waiters = job.event(stage, data)
+        for wake in waiters:
+            wake()
+    
+    def _expire(self, now):
+        done = self._done
+        while done and (len(done) > self.max_retained or now - next(iter(done.values())) >= self.ttl):
+            job_id, _ = done.popitem(last=False)
+            del self._jobs[job_id]
+            self.expired += 1
+    
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            with self._lock:
+                job.status = 'running'
+                job.started = time.monotonic()
+                self.busy += 1
+            self.wait_time.add(job.started - job.submitted)
+            
+            upload = job.upload
+            try:
+                result = self.analyzer.analyze_image(upload.data(), upload.sha256(),
+                                                     lambda stage, data: self._progress(job, stage, data))
+            except Exception as e:
+                result = build_error(f'Erro na análise: {e}')
+            finally:
+                upload.close()
+            
+            finished = time.monotonic()
+            self.service_time.add(finished - job.started)
+            with self._lock:
+                job.upload = None
+                job.result = result
+                job.finished = finished
+                job.status = 'done'
+                waiters = job.event('done', {'result': result})
+                self._done[job.id] = finished
+                self.busy -= 1
+                self.completed += 1
+            for wake in waiters:
+                wake()
+    
+    def close(self):
+        """Para os workers depois dos jobs já enfileirados"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+    
+    def stats(self):
+        """Contadores para o /status"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'busy': self.busy,
+                'queue_size': self.queue_size,
+                'queued': self._queue.qsize(),
+                'max_queued': self.max_queued,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'retained': len(self._jobs),
+                'expired': self.expired,
+                'wait_p50_ms': self.wait_time.quantile_ms(0.5),
+                'wait_p99_ms': self.wait_time.quantile_ms(0.99),
+                'service_p50_ms': self.service_time.quantile_ms(0.5),
+                'service_p99_ms': self.service_time.quantile_ms(0.99)
+            }
+
+class KeepAliveMixin:
+    """
+    HTTP/1.1 com conexões persistentes para os handlers
+    
+    Toda resposta precisa de Content-Length para a conexão continuar
+    aberta; use _send_body. Conexões ociosas por mais de KEEPALIVE_TIMEOUT
+    segundos são fechadas (o socket ocupa um worker do pool enquanto
+    aberto) e a resposta de número KEEPALIVE_MAX_REQUESTS leva
+    Connection: close. Esse timeout vale só na espera pela próxima
+    requisição: depois da linha de requisição, cabeçalhos e corpo têm
+    REQUEST_TIMEOUT segundos por leitura (um upload lento não é cortado).
+    """
+    
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+    request_timeout = REQUEST_TIMEOUT
+    disable_nagle_algorithm = True
+    max_keepalive_requests = KEEPALIVE_MAX_REQUESTS
+    
+    def setup(self):
+        super().setup()
+        self.requests_handled = 0
+        self._body_buffer = None
+    
+    def handle_one_request(self):
+        self.requests_handled += 1
+        self.connection.settimeout(self.timeout)
+        super().handle_one_request()
+    
+    def parse_request(self):
+        # A linha de requisição chegou: daqui até a resposta vale o timeout de requisição
+        self.connection.settimeout(self.request_timeout)
+        return super().parse_request()
+    
+    def end_headers(self):
+        if self.requests_handled >= self.max_keepalive_requests and not self.close_connection:
+            self.send_header('Connection', 'close')
+        super().end_headers()
+    
+    def _read_json(self):
+        """
+        Lê e decodifica o corpo JSON pelo JSON_CODEC
+        
+        Um Content-Length acima do limite é recusado (413) sem ler o corpo;
+        um corpo chunked é recusado assim que passa do limite.
+        """
+        if is_chunked(self.headers.get('Transfer-Encoding')):
+            body = bytearray()
+            for piece in self._iter_body():
+                body += piece
+                if len(body) > JSON_CODEC.max_body:
+                    raise JsonError(f'Corpo JSON maior que {JSON_CODEC.max_body} bytes', 413)
+            return JSON_CODEC.loads(bytes(body))
+        
+        length = parse_content_length(self.headers.get('Content-Length'))
+        check_content_length('/validate', length)
+        return JSON_CODEC.loads(self.rfile.read(length))
+    
+    def handle_expect_100(self):
+        """
+        Expect: 100-continue: recusa antes do envio um corpo declarado acima do limite
         
-        scores['card_number'] = 95 if validation['card_number']['valid'] else 20
-        scores['expiry_date'] = 90 if validation['expiry_date']['valid'] else 25
-        scores['cardholder_name'] = 85 if validation['cardholder_name']['valid'] else 30
+        O cliente ainda não mandou o corpo, então a resposta de erro sai no
+        lugar do 100 Continue e a conexão é fechada.
+        """
+        if not is_chunked(self.headers.get('Transfer-Encoding')):
+            try:
+                length = parse_content_length(self.headers.get('Content-Length'))
+                check_content_length(self.path.partition('?')[0], length, 'expect_too_large')
+            except RequestError as e:
+                body = JSON_CODEC.dumps(build_error(str(e)))
+                self.close_connection = True
+                self._send_body(e.status, 'application/json; charset=utf-8', body, [('Connection', 'close')])
+                return False
+        return super().handle_expect_100()
+    
+    def _iter_body(self):
+        """
+        Corpo da requisição em pedaços de até UPLOAD_READ_SIZE bytes
         
-        if 'cvv' in validation:
-            scores['cvv'] = 95 if validation['cvv']['valid'] else 15
+        Aceita Content-Length ou Transfer-Encoding: chunked (que tem
+        precedência). Os pedaços são memoryviews de um buffer reaproveitado
+        entre as requisições da conexão: cada um vale só até o próximo.
+        """
+        if self._body_buffer is None:
+            self._body_buffer = memoryview(bytearray(UPLOAD_READ_SIZE))
+        try:
+            if not is_chunked(self.headers.get('Transfer-Encoding')):
+                yield from self._read_exactly(parse_content_length(self.headers.get('Content-Length')))
+                return
+            
+            while True:
+                size = parse_chunk_size(self.rfile.readline(CHUNK_LINE_LIMIT))
+                if size == 0:
+                    break
+                yield from self._read_exactly(size)
+                if self.rfile.readline(CHUNK_LINE_LIMIT) not in (b'\r\n', b'\n'):
+                    raise RequestError('Corpo chunked malformado')
+            # Trailers (ignorados) até a linha vazia
+            while self.rfile.readline(CHUNK_LINE_LIMIT) not in (b'\r\n', b'\n', b''):
+                pass
+        except (ConnectionAbortedError, RequestError):
+            # O resto do corpo não foi lido: a conexão não pode ser reaproveitada
+            self.close_connection = True
+            raise
+    
+    def _read_exactly(self, remaining):
+        view = self._body_buffer
+        # readinto1 devolve o que já chegou (uma leitura do socket) sem esperar encher a
+        # view. Mas, pedindo mais que o buffer do rfile, ele copia o que está no buffer
+        # (trazido junto com os cabeçalhos ou a linha do chunk) e ainda espera outro recv:
+        # a primeira leitura se limita ao tamanho do buffer, o que o esvazia
+        limit = io.DEFAULT_BUFFER_SIZE
+        while remaining > 0:
+            count = self.rfile.readinto1(view[:min(len(view), remaining, limit)])
+            if not count:
+                raise ConnectionAbortedError
+            limit = len(view)
+            remaining -= count
+            yield view[:count]
+    
+    def _read_upload(self):
+        """
+        Lê o corpo de um upload pelo UploadParser, em pedaços (_iter_body)
         
-        scores['overall'] = sum(scores.values()) // len(scores)
+        Um Content-Length acima do limite é recusado (413) sem ler o corpo;
+        um corpo chunked é limitado pelo próprio UploadParser enquanto chega.
+        Retorna o UploadParser (o chamador fecha) ou None sem corpo.
+        """
+        if not is_chunked(self.headers.get('Transfer-Encoding')):
+            length = parse_content_length(self.headers.get('Content-Length'))
+            if length <= 0:
+                return None
+            check_content_length(self.path.partition('?')[0], length)
         
-        return scores
+        upload = UploadParser(self.headers.get('Content-Type'))
+        try:
+            for piece in self._iter_body():
+                upload.feed(piece)
+            upload.finish()
+        except BaseException:
+            upload.close()
+            raise
+        return upload
+    
+    def _send_body(self, status, content_type, body, headers=()):
+        """Envia uma resposta completa com Content-Length"""
+        self.send_response(status)
+        if content_type and status != 304:
+            self.send_header('Content-type', content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and status != 304 and self.command != 'HEAD':
+            self.wfile.write(body)
+    
+    def _start_stream(self, content_type, headers=()):
+        """
+        Inicia uma resposta de tamanho desconhecido
+        
+        Usa Transfer-Encoding: chunked em HTTP/1.1; clientes HTTP/1.0 recebem
+        o corpo direto e a conexão é fechada no fim. Retorna se é chunked.
+        """
+        chunked = self.request_version != 'HTTP/1.0'
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        return chunked
+    
+    def _write_chunk(self, data, chunked):
+        if data:
+            self.wfile.write(b'%X\r\n%s\r\n' % (len(data), data) if chunked else data)
+    
+    def _end_stream(self, chunked):
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+    
+    def _send_payload(self, payload):
+        """Envia um StaticPayload negociando codificação e ETag"""
+        status, body, headers = payload.negotiate(self.headers.get('Accept-Encoding'),
+                                                  self.headers.get('If-None-Match'))
+        self._send_body(status, payload.content_type, body, headers)
 
-class WebHandler(http.server.SimpleHTTPRequestHandler):
+class WebHandler(KeepAliveMixin, http.server.SimpleHTTPRequestHandler):
     """Handler HTTP para interface web"""
     
     # Sistema compartilhado
     _analyzer = None
+    _analyzer_lock = threading.Lock()
+    _jobs = None
     
     def __init__(self, *args, **kwargs):
-        if WebHandler._analyzer is None:
-            WebHandler._analyzer = CardAnalyzer()
-        self.analyzer = WebHandler._analyzer
+        self.analyzer = WebHandler.get_analyzer()
         super().__init__(*args, directory=None, **kwargs)
     
+    @staticmethod
+    def get_analyzer():
+        """Retorna o CardAnalyzer compartilhado (criado uma única vez)"""
+        if WebHandler._analyzer is None:
+            with WebHandler._analyzer_lock:
+                if WebHandler._analyzer is None:
+                    WebHandler._analyzer = CardAnalyzer()
+        return WebHandler._analyzer
+    
+    @staticmethod
+    def get_jobs():
+        """Retorna o JobQueue compartilhado (criado no primeiro uso, já no processo worker)"""
+        if WebHandler._jobs is None:
+            analyzer = WebHandler.get_analyzer()
+            with WebHandler._analyzer_lock:
+                if WebHandler._jobs is None:
+                    WebHandler._jobs = JobQueue(analyzer)
+        return WebHandler._jobs
+    
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
@@ -314,8 +2779,7 @@ class WebHandler(http.server.SimpleHTTPRequestHandler):
         super().end_headers()
     
     def do_OPTIONS(self):
-        self.send_response(200)
-        self.end_headers()
+        self._send_body(200, None, b'')
     
     def do_GET(self):
         path = self.path.split('?')[0]  # Remove query parameters
@@ -327,102 +2791,188 @@ class WebHandler(http.server.SimpleHTTPRequestHandler):
                 self._serve_status()
             elif path == '/favicon.ico':
                 self._serve_favicon()
+            elif path.startswith(StaticAssets.prefix):
+                self._serve_asset(path)
+            elif path.startswith('/jobs/'):
+                job_id, _, tail = path[len('/jobs/'):].partition('/')
+                if not tail:
+                    self._serve_job(job_id)
+                elif tail == 'events':
+                    self._stream_job_events(job_id)
+                else:
+                    self.send_error(404)
             else:
                 self.send_error(404)
         except (ConnectionAbortedError, BrokenPipeError):
             pass
     
     def do_POST(self):
+        route, _, query = self.path.partition('?')
         try:
-            if self.path == '/validate':
-                self._handle_validation()
-            elif self.path == '/upload-image':
+            # Content-Length malformado é recusado antes de qualquer resposta (o lote começa o stream antes do corpo)
+            if not is_chunked(self.headers.get('Transfer-Encoding')):
+                parse_content_length(self.headers.get('Content-Length'))
+            if route == '/validate':
+                self._handle_validation(query)
+            elif route == '/validate/batch':
+                self._handle_batch_validation(query)
+            elif route == '/upload-image':
                 self._handle_image_upload()
+            elif route == '/jobs':
+                self._handle_job_submit()
             else:
                 self.send_error(404)
-        except (ConnectionAbortedError, BrokenPipeError):
-            pass
+        except (ConnectionAbortedError, BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except RequestError as e:
+            self._send_error_response(str(e), e.status)
+        except TimeoutError:
+            # Nada chegou em REQUEST_TIMEOUT segundos no meio do corpo
+            self._send_error_response('Tempo esgotado lendo a requisição', 408)
         except Exception as e:
             self._send_error_response(str(e))
     
     def _serve_main_page(self):
-        """Serve a página principal"""
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html; charset=utf-8')
-        self.send_header('Cache-Control', 'no-cache')
-        self.end_headers()
-        
-        html_content = self._get_html_content()
-        self.wfile.write(html_content.encode('utf-8'))
+        """Serve a página principal (pré-renderizada na inicialização)"""
+        self._send_payload(self.main_page)
     
     def _serve_status(self):
         """Serve status da API"""
-        status = {
-            'status': 'online',
-            'azure_configured': self.analyzer.azure_configured,
-            'timestamp': datetime.now().isoformat(),
-            'version': '2.0.0'
-        }
-        
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(status).encode('utf-8'))
+        status = build_status(self.analyzer, WebHandler.get_jobs())
+        self._send_body(200, 'application/json', JSON_CODEC.dumps(status))
     
     def _serve_favicon(self):
-        """Serve favicon"""
-        self.send_response(200)
-        self.send_header('Content-type', 'image/x-icon')
-        self.send_header('Cache-Control', 'max-age=86400')
-        self.end_headers()
-        
-        # Favicon simples em base64
-        favicon_data = base64.b64decode('AAABAAEAEBAAAAEAIABoBAAAFgAAACgAAAAQAAAAIAAAAAEAIAAAAAAAAAQAABILAAASCwAAAAAAAAAAAAD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A')
-        self.wfile.write(favicon_data)
+        """Serve favicon (decodificado uma única vez)"""
+        self._send_payload(self.favicon)
+    
+    def _serve_asset(self, path):
+        """Serve CSS/JS/ícone com fingerprint"""
+        payload = self.assets.get(path)
+        if payload is None:
+            self.send_error(404)
+        else:
+            self._send_payload(payload)
+    
+    def _response_fields(self, query):
+        """Perfil de resposta pedido (ver response_fields)"""
+        return response_fields(query, self.headers.get('X-Response-Profile'), self.headers.get('X-Response-Fields'))
     
-    def _handle_validation(self):
+    def _handle_validation(self, query=''):
         """Processa validação manual"""
-        content_length = int(self.headers.get('Content-Length', 0))
-        post_data = self.rfile.read(content_length)
-        data = json.loads(post_data.decode('utf-8'))
-        
+        fields = self._response_fields(query)
+        data = self._read_json()
         result = self.analyzer.validate_manual_input(data)
-        self._send_json_response(result)
+        if fields is None:
+            self._send_json_response(result)
+        else:
+            self._send_json_response(lean_view(result, fields), compact=True)
+    
+    def _handle_batch_validation(self, query=''):
+        """Valida um lote NDJSON respondendo uma linha por registro, em streaming"""
+        validator = BatchValidator(self.analyzer, fields=self._response_fields(query))
+        chunked = self._start_stream('application/x-ndjson; charset=utf-8', [('Cache-Control', 'no-cache')])
+        
+        try:
+            # Corpo com Content-Length ou chunked, no mesmo pipeline
+            for piece in self._iter_body():
+                self._write_chunk(validator.feed(bytes(piece)), chunked)
+            self._write_chunk(validator.finish(), chunked)
+            self._end_stream(chunked)
+        except (ConnectionAbortedError, BrokenPipeError, ConnectionResetError):
+            raise
+        except (ValueError, TimeoutError) as e:
+            # Corpo malformado (RequestError) ou parado; cabeçalhos já enviados:
+            # encerra sem o chunk final para sinalizar erro
+            self.log_error('Lote NDJSON interrompido: %s', str(e) or 'tempo esgotado lendo o corpo')
+            self.close_connection = True
+        except Exception:
+            # Falha inesperada: o traceback vai para o log e o stream termina do mesmo jeito
+            self.log_error('Erro no lote NDJSON')
+            traceback.print_exc()
+            self.close_connection = True
     
     def _handle_image_upload(self):
-        """Processa upload de imagem"""
-        content_length = int(self.headers.get('Content-Length', 0))
+        """Processa upload de imagem (só a parte do arquivo chega à análise)"""
+        upload = self._read_upload()
+        try:
+            image = upload.data() if upload is not None else None
+            if image:
+                result = self.analyzer.analyze_image(image, upload.sha256())
+            else:
+                result = {'error': True, 'message': 'Nenhuma imagem recebida'}
+        finally:
+            if upload is not None:
+                upload.close()
         
-        if content_length > 0:
-            post_data = self.rfile.read(content_length)
-            result = self.analyzer.analyze_image(post_data)
+        self._send_json_response(result)
+    
+    def _handle_job_submit(self):
+        """Enfileira a análise da imagem e responde 202 com o id do job, sem esperar a análise"""
+        upload = self._read_upload()
+        if upload is None or not upload.size:
+            if upload is not None:
+                upload.close()
+            raise RequestError('Nenhuma imagem recebida')
+        job = WebHandler.get_jobs().submit(upload)
+        body = JSON_CODEC.dumps(job_accepted(job))
+        self._send_body(202, 'application/json; charset=utf-8', body,
+                        [('Location', f'/jobs/{job.id}'), ('Cache-Control', 'no-cache')])
+    
+    def _serve_job(self, job_id):
+        """Status do job e, quando concluído, o resultado de analyze_image"""
+        job = WebHandler.get_jobs().get(job_id)
+        if job is None:
+            self._send_body(404, 'application/json; charset=utf-8', JSON_CODEC.dumps(build_error('Job não encontrado')))
         else:
-            result = {'error': True, 'message': 'Nenhuma imagem recebida'}
+            self._send_json_response(job.view())
+    
+    def _stream_job_events(self, job_id):
+        """Etapas do job em Server-Sent Events, uma mensagem por etapa até 'done'"""
+        jobs = WebHandler.get_jobs()
+        job = jobs.get(job_id)
+        if job is None:
+            self._send_body(404, 'application/json; charset=utf-8', JSON_CODEC.dumps(build_error('Job não encontrado')))
+            return
         
-        self._send_json_response(result)
+        sent = sse_resume(self.headers.get('Last-Event-ID'))
+        ready = threading.Event()
+        chunked = self._start_stream('text/event-stream; charset=utf-8', [('Cache-Control', 'no-cache')])
+        jobs.subscribe(job, ready.set)
+        try:
+            while True:
+                ready.clear()
+                events, done = jobs.events(job, sent)
+                for event in events:
+                    self._write_chunk(sse_event(sent, event), chunked)
+                    sent += 1
+                if done:
+                    break
+                if not events and not ready.wait(SSE_HEARTBEAT):
+                    self._write_chunk(b': keep-alive\n\n', chunked)
+            self._end_stream(chunked)
+        finally:
+            jobs.unsubscribe(job, ready.set)
     
-    def _send_json_response(self, data):
+    def _send_json_response(self, data, compact=False):
         """Envia resposta JSON"""
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json; charset=utf-8')
-        self.send_header('Cache-Control', 'no-cache')
-        self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        body = JSON_CODEC.dumps(data, compact)
+        body, headers = compress_response(body, self.headers.get('Accept-Encoding'))
+        self._send_body(200, 'application/json; charset=utf-8', body, [('Cache-Control', 'no-cache')] + headers)
     
-    def _send_error_response(self, message):
+    def _send_error_response(self, message, status=500):
         """Envia resposta de erro"""
-        error_response = {
-            'error': True,
-            'message': message,
-            'timestamp': datetime.now().isoformat()
-        }
+        error_response = build_error(message)
         
-        self.send_response(500)
-        self.send_header('Content-type', 'application/json; charset=utf-8')
-        self.end_headers()
-        self.wfile.write(json.dumps(error_response).encode('utf-8'))
+        # O corpo da requisição pode não ter sido lido: não reaproveita a conexão
+        body = JSON_CODEC.dumps(error_response)
+        try:
+            self._send_body(status, 'application/json; charset=utf-8', body, [('Connection', 'close')])
+        except (ConnectionAbortedError, BrokenPipeError, ConnectionResetError):
+            # Cliente já foi embora (ex.: 415 antes do fim do upload)
+            self.close_connection = True
     
-    def _get_html_content(self):
+    @staticmethod
+    def _get_html_content():
         """Retorna conteúdo HTML da interface"""
         return '''<!DOCTYPE html>
 <html lang="pt-BR">
@@ -644,6 +3194,10 @@ class WebHandler(http.server.SimpleHTTPRequestHandler):
             background: #dc3545;
             color: white;
         }
+        .status.pending {
+            background: #e9ecef;
+            color: #666;
+        }
     </style>
 </head>
 <body>
@@ -831,7 +3385,17 @@ class WebHandler(http.server.SimpleHTTPRequestHandler):
             btn.innerHTML = '🔍 Validar Cartão';
         });
         
-        // Upload e análise
+        // Upload e análise: o job é criado na hora e o progresso chega por Server-Sent Events.
+        // Em prefork (data-jobs="off") os jobs não são compartilhados entre os processos:
+        // a página usa /upload-image, sem progresso, como faz quando o stream falha.
+        const JOBS_ENABLED = document.body.dataset.jobs !== 'off';
+        const ANALYSIS_STAGES = [
+            ['upload', '📤 Imagem enviada'],
+            ['ocr_submitted', '🤖 Enviada ao Azure AI'],
+            ['ocr_complete', '📋 Texto extraído'],
+            ['validation', '🔍 Dados validados']
+        ];
+        
         async function uploadAndAnalyze() {
             if (!selectedFile) {
                 alert('❌ Selecione uma imagem primeiro!');
@@ -840,23 +3404,29 @@ class WebHandler(http.server.SimpleHTTPRequestHandler):
             
             const btn = document.getElementById('uploadBtn');
             btn.disabled = true;
-            btn.innerHTML = '⏳ Analisando...';
+            btn.innerHTML = '⏳ Enviando...';
             
             try {
                 const formData = new FormData();
                 formData.append('image', selectedFile);
                 
-                const response = await fetch('/upload-image', {
+                const response = await fetch(JOBS_ENABLED ? '/jobs' : '/upload-image', {
                     method: 'POST',
                     body: formData
                 });
                 
-                const result = await response.json();
+                const data = await response.json();
                 
-                if (result.error) {
-                    displayError(result.message);
+                if (data.error) {
+                    displayError(data.message);
+                } else if (!JOBS_ENABLED) {
+                    displayImageResult(data);
                 } else {
-                    displayImageResult(result);
+                    btn.innerHTML = '⏳ Analisando...';
+                    if (!await followAnalysis(data)) {
+                        // Stream indisponível (outro processo, conexão perdida): análise direta
+                        await analyzeDirect();
+                    }
                 }
                 
             } catch (error) {
@@ -867,6 +3437,99 @@ class WebHandler(http.server.SimpleHTTPRequestHandler):
             btn.innerHTML = '📸 Analisar com Azure AI';
         }
         
+        async function analyzeDirect() {
+            const formData = new FormData();
+            formData.append('image', selectedFile);
+            
+            const response = await fetch('/upload-image', {
+                method: 'POST',
+                body: formData
+            });
+            
+            const result = await response.json();
+            
+            if (result.error) {
+                displayError(result.message);
+            } else {
+                displayImageResult(result);
+            }
+        }
+        
+        // Resolve true ao exibir o resultado e false se o stream cair antes do fim
+        function followAnalysis(job) {
+            return new Promise(resolve => {
+                const source = new EventSource(job.events_url);
+                const extracted = {};
+                let reached = -1;
+                
+                const onStage = (e) => {
+                    const event = JSON.parse(e.data);
+                    if (event.stage === 'done') {
+                        source.close();
+                        if (event.result.error) {
+                            displayError(event.result.message);
+                        } else {
+                            displayImageResult(event.result);
+                        }
+                        resolve(true);
+                        return;
+                    }
+                    Object.assign(extracted, event.extracted_data || {});
+                    reached = Math.max(reached, ANALYSIS_STAGES.findIndex(([stage]) => stage === event.stage));
+                    displayProgress(reached, extracted, event.validation);
+                };
+                
+                ANALYSIS_STAGES.forEach(([stage]) => source.addEventListener(stage, onStage));
+                source.addEventListener('done', onStage);
+                source.onerror = () => {
+                    // Queda momentânea: o EventSource reconecta sozinho (Last-Event-ID)
+                    if (source.readyState === EventSource.CLOSED) {
+                        resolve(false);
+                    }
+                };
+            });
+        }
+        
+        function displayProgress(reached, extracted, validation) {
+            const result = document.getElementById('result');
+            const field = (label, value) => value ? `
+                <div class="validation-item">
+                    <span><strong>${label}:</strong></span>
+                    <span>${value}</span>
+                </div>` : '';
+            
+            let html = `
+                <h3>⏳ Analisando a imagem...</h3>
+                <div class="validation-grid">
+                    ${ANALYSIS_STAGES.map(([stage, label], i) => `
+                    <div class="validation-item">
+                        <span>${label}</span>
+                        <span class="status ${i <= reached ? 'valid' : 'pending'}">${i <= reached ? 'OK' : '...'}</span>
+                    </div>`).join('')}
+                </div>
+            `;
+            
+            if (Object.keys(extracted).length) {
+                html += `
+                <h4>📋 Dados Extraídos:</h4>
+                <div class="validation-grid">
+                    ${field('Número', extracted.card_number)}
+                    ${field('Nome', extracted.cardholder_name)}
+                    ${field('Expiração', extracted.expiry_date)}
+                    ${field('Tipo', extracted.card_type)}
+                    ${field('Banco', extracted.bank_name)}
+                </div>
+                `;
+            }
+            if (validation) {
+                html += `<p><strong>Validação:</strong> ${validation.overall_valid ? '✅ Dados válidos' : '❌ Dados inválidos'}</p>`;
+            }
+            
+            result.innerHTML = html;
+            result.className = 'result';
+            result.style.display = 'block';
+        }
+        
         function displayResult(data) {
             const result = document.getElementById('result');
             const validation = data.validation;
@@ -908,6 +3571,8 @@ class WebHandler(http.server.SimpleHTTPRequestHandler):
                 </div>
                 
                 <p><strong>Tipo:</strong> ${data.extracted_data.card_type}</p>
+                ${data.extracted_data.bank_name ? `<p><strong>Banco:</strong> ${data.extracted_data.bank_name}</p>` : ''}
+                ${data.extracted_data.edition ? `<p><strong>Edição:</strong> ${data.extracted_data.edition}</p>` : ''}
             `;
             
             result.innerHTML = html;
@@ -994,6 +3659,638 @@ class WebHandler(http.server.SimpleHTTPRequestHandler):
 </body>
 </html>'''
 
+# Assets e página principal preparados uma única vez na inicialização
+_favicon_data = base64.b64decode(FAVICON_B64)
+WebHandler.assets = StaticAssets()
+WebHandler.favicon = StaticPayload(_favicon_data, 'image/x-icon', 'max-age=86400')
+
+def build_main_page(jobs_enabled=True):
+    """
+    Página principal; com jobs_enabled=False o upload vai para /upload-image
+    
+    Os jobs ficam na memória de cada processo: no prefork o GET do stream
+    pode cair em outro worker (404), então a página nem tenta usar /jobs.
+    """
+    html = WebHandler._get_html_content()
+    if not jobs_enabled:
+        html = html.replace('<body>', '<body data-jobs="off">', 1)
+    return StaticPayload.from_html(WebHandler.assets.externalize(
+        html, 'app',
+        icon_url=WebHandler.assets.add('favicon.ico', _favicon_data, 'image/x-icon')
+    ))
+
+WebHandler.main_page = build_main_page()
+
+class ThreadPoolHTTPServer(socketserver.TCPServer):
+    """
+    Servidor TCP com pool fixo de threads e fila limitada
+    
+    Cada conexão aceita entra numa fila de tamanho fixo e é atendida pelo
+    próximo worker livre. Quando a fila está cheia a conexão recebe 503
+    imediatamente, em vez de acumular sockets sem limite.
+    """
+    
+    allow_reuse_address = True
+    
+    def __init__(self, server_address, handler_class, workers=SERVER_WORKERS,
+                 queue_size=SERVER_QUEUE_SIZE, bind_and_activate=True, reuse_port=False):
+        self.reuse_port = reuse_port
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.request_queue_size = max(self.request_queue_size, self.queue_size)
+        self._requests = queue.Queue(maxsize=self.queue_size)
+        self._threads = []
+        self.rejected = 0
+        super().__init__(server_address, handler_class, bind_and_activate)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'http-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+    
+    def process_request(self, request, client_address):
+        """Enfileira a conexão para o pool (não bloqueia o loop de accept)"""
+        try:
+            self._requests.put_nowait((request, client_address))
+        except queue.Full:
+            self.rejected += 1
+            self._reject(request)
+    
+    def _reject(self, request):
+        """Responde 503 quando a fila está cheia"""
+        body = b'{"error": true, "message": "Servidor ocupado, tente novamente"}'
+        try:
+            request.sendall(
+                b'HTTP/1.0 503 Service Unavailable\r\n'
+                b'Content-Type: application/json; charset=utf-8\r\n'
+                b'Retry-After: 1\r\n'
+                b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\n'
+                b'Connection: close\r\n\r\n' + body
+            )
+        except OSError:
+            pass
+        self.shutdown_request(request)
+    
+    def _worker(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+    
+    def server_close(self):
+        super().server_close()
+        for _ in self._threads:
+            self._requests.put(None)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+
+class AsyncCardServer:
+    """
+    Servidor HTTP baseado em asyncio streams
+    
+    Atende as mesmas rotas e contratos JSON do WebHandler, mas todas as
+    conexões vivem num único event loop: clientes ociosos ou uploads lentos
+    não prendem uma thread cada. A validação (rápida, só CPU) roda no próprio
+    loop, assim como a espera pelo Azure em /upload-image; os jobs de
+    /jobs vão para o pool do JobQueue.
+    """
+    
+    max_line = 65536
+    max_headers = 100
+    
+    def __init__(self, host='', port=DEFAULT_PORT, analyzer=None, idle_timeout=ASYNC_IDLE_TIMEOUT,
+                 reuse_port=False, max_keepalive_requests=KEEPALIVE_MAX_REQUESTS, jobs=None):
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.max_keepalive_requests = max_keepalive_requests
+        self.analyzer = analyzer or WebHandler.get_analyzer()
+        self.jobs = jobs or JobQueue(self.analyzer)
+        self.idle_timeout = idle_timeout
+        self.server_header = f'{WebHandler.server_version} {WebHandler.sys_version}'
+        self._server = None
+    
+    async def start(self):
+        """Abre o socket de escuta (porta 0 escolhe uma porta livre)"""
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host or None, self.port,
+            limit=self.max_line, reuse_address=True, reuse_port=self.reuse_port or None
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+    
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+    
+    def run(self):
+        asyncio.run(self.serve_forever())
+    
+    async def _handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        handled = 0
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                
+                parts = request_line.decode('latin-1').rstrip('\r\n').split()
+                headers = await self._read_headers(reader)
+                if len(parts) != 3 or headers is None:
+                    await self._send_error(writer, 400, keep_alive=False)
+                    break
+                
+                method, path, version = parts
+                handled += 1
+                keep_alive = (self._wants_keep_alive(version, headers)
+                              and handled < self.max_keepalive_requests)
+                status = await self._dispatch(method, path, version, headers, reader, writer, keep_alive)
+                self._log(peer, request_line, status)
+                if not keep_alive:
+                    break
+        except asyncio.TimeoutError:
+            # Parou no meio dos cabeçalhos ou do corpo: 408 e fecha, como o WebHandler
+            payload = JSON_CODEC.dumps(build_error('Tempo esgotado lendo a requisição'))
+            try:
+                await self._send(writer, 408, payload, 'application/json; charset=utf-8', False)
+                self._log(peer, request_line, 408)
+            except ConnectionError:
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _read_headers(self, reader):
+        headers = {}
+        for _ in range(self.max_headers + 1):
+            line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            name, sep, value = line.decode('latin-1').partition(':')
+            if not sep:
+                return None
+            headers[name.strip().lower()] = value.strip()
+        return None
+    
+    @staticmethod
+    def _wants_keep_alive(version, headers):
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            return connection != 'close'
+        return connection == 'keep-alive'
+    
+    async def _dispatch(self, method, path, version, headers, reader, writer, keep_alive):
+        if method == 'GET':
+            route = path.split('?')[0]  # Remove query parameters
+            if route in ['/', '/index.html']:
+                return await self._send_payload(writer, WebHandler.main_page, headers, keep_alive)
+            elif route == '/status':
+                body = JSON_CODEC.dumps(build_status(self.analyzer, self.jobs))
+                return await self._send(writer, 200, body, 'application/json', keep_alive)
+            elif route == '/favicon.ico':
+                return await self._send_payload(writer, WebHandler.favicon, headers, keep_alive)
+            elif route.startswith(StaticAssets.prefix) and WebHandler.assets.get(route):
+                return await self._send_payload(writer, WebHandler.assets.get(route), headers, keep_alive)
+            elif route.startswith('/jobs/'):
+                job_id, _, tail = route[len('/jobs/'):].partition('/')
+                job = self.jobs.get(job_id) if tail in ('', 'events') else None
+                if job is None:
+                    body = JSON_CODEC.dumps(build_error('Job não encontrado'))
+                    return await self._send(writer, 404, body, 'application/json; charset=utf-8', keep_alive)
+                if tail == 'events':
+                    return await self._stream_job_events(writer, job, headers, keep_alive and version == 'HTTP/1.1')
+                payload, extra = compress_response(JSON_CODEC.dumps(job.view()), headers.get('accept-encoding'))
+                return await self._send(writer, 200, payload, 'application/json; charset=utf-8', keep_alive,
+                                        no_cache=True, extra=extra)
+            return await self._send_error(writer, 404, keep_alive)
+        
+        if method == 'POST':
+            route, _, query = path.partition('?')
+            try:
+                content_length = parse_content_length(headers.get('content-length'))
+                fields = None
+                if route in ('/validate', '/validate/batch'):
+                    fields = response_fields(query, headers.get('x-response-profile'),
+                                             headers.get('x-response-fields'))
+            except RequestError as e:
+                # Recusa antes do corpo (Content-Length malformado, perfil inválido), como no limite de tamanho
+                await self._abort(writer, e)
+            
+            if headers.get('expect', '').lower() == '100-continue' and version == 'HTTP/1.1':
+                # Recusa antes do envio do corpo ou libera o cliente para mandá-lo
+                if not is_chunked(headers.get('transfer-encoding')):
+                    try:
+                        check_content_length(route, content_length, 'expect_too_large')
+                    except RequestError as e:
+                        await self._abort(writer, e)
+                writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            
+            if route == '/validate/batch':
+                return await self._stream_batch(reader, writer, headers, keep_alive and version == 'HTTP/1.1', fields)
+            if route == '/upload-image':
+                return await self._receive_upload(reader, writer, headers, content_length, keep_alive)
+            if route == '/jobs':
+                return await self._submit_job(reader, writer, headers, content_length, keep_alive)
+            
+            if is_chunked(headers.get('transfer-encoding')):
+                body = bytearray()
+                try:
+                    async for piece in self._iter_body(reader, headers, BATCH_READ_SIZE):
+                        body += piece
+                        if len(body) > JSON_CODEC.max_body:
+                            raise JsonError(f'Corpo JSON maior que {JSON_CODEC.max_body} bytes', 413)
+                except RequestError as e:
+                    await self._abort(writer, e)
+                body = bytes(body)
+            else:
+                try:
+                    check_content_length(route, content_length)
+                except RequestError as e:
+                    # Recusa sem ler o corpo; a conexão não pode ser reaproveitada
+                    await self._abort(writer, e)
+                body = b''
+                if content_length > 0:
+                    body = await asyncio.wait_for(reader.readexactly(content_length), self.idle_timeout)
+            try:
+                if route == '/validate':
+                    data = JSON_CODEC.loads(body)
+                    result = self.analyzer.validate_manual_input(data)
+                    if fields is not None:
+                        result = lean_view(result, fields)
+                else:
+                    return await self._send_error(writer, 404, keep_alive)
+            except Exception as e:
+                payload = JSON_CODEC.dumps(build_error(str(e)))
+                status = e.status if isinstance(e, RequestError) else 500
+                return await self._send(writer, status, payload, 'application/json; charset=utf-8', keep_alive)
+            
+            payload = JSON_CODEC.dumps(result, fields is not None)
+            payload, extra = compress_response(payload, headers.get('accept-encoding'))
+            return await self._send(writer, 200, payload, 'application/json; charset=utf-8', keep_alive,
+                                    no_cache=True, extra=extra)
+        
+        if method == 'OPTIONS':
+            return await self._send(writer, 200, b'', None, keep_alive)
+        
+        return await self._send_error(writer, 501, keep_alive)
+    
+    async def _abort(self, writer, error):
+        """Responde o RequestError e fecha a conexão (o corpo pode não ter sido lido)"""
+        payload = JSON_CODEC.dumps(build_error(str(error)))
+        await self._send(writer, error.status, payload, 'application/json; charset=utf-8', False)
+        raise ConnectionAbortedError
+    
+    async def _iter_body(self, reader, headers, read_size):
+        """Versão asyncio de KeepAliveMixin._iter_body (Content-Length ou chunked)"""
+        if not is_chunked(headers.get('transfer-encoding')):
+            async for piece in self._read_exactly(reader, parse_content_length(headers.get('content-length')),
+                                                  read_size):
+                yield piece
+            return
+        
+        while True:
+            size = parse_chunk_size(await asyncio.wait_for(reader.readline(), self.idle_timeout))
+            if size == 0:
+                break
+            async for piece in self._read_exactly(reader, size, read_size):
+                yield piece
+            if await asyncio.wait_for(reader.readline(), self.idle_timeout) not in (b'\r\n', b'\n'):
+                raise RequestError('Corpo chunked malformado')
+        # Trailers (ignorados) até a linha vazia
+        while await asyncio.wait_for(reader.readline(), self.idle_timeout) not in (b'\r\n', b'\n', b''):
+            pass
+    
+    async def _read_exactly(self, reader, remaining, read_size):
+        while remaining > 0:
+            data = await asyncio.wait_for(reader.read(min(read_size, remaining)), self.idle_timeout)
+            if not data:
+                raise ConnectionAbortedError
+            remaining -= len(data)
+            yield data
+    
+    async def _read_upload(self, reader, writer, headers, content_length, route):
+        """Versão asyncio de KeepAliveMixin._read_upload (UploadParser lido, ou None sem corpo)"""
+        chunked = is_chunked(headers.get('transfer-encoding'))
+        if content_length <= 0 and not chunked:
+            return None
+        
+        try:
+            if not chunked:
+                check_content_length(route, content_length)
+            upload = UploadParser(headers.get('content-type'))
+        except RequestError as e:
+            await self._abort(writer, e)
+        
+        try:
+            async for piece in self._iter_body(reader, headers, UPLOAD_READ_SIZE):
+                upload.feed(piece)
+            upload.finish()
+        except RequestError as e:
+            upload.close()
+            await self._abort(writer, e)
+        except BaseException:
+            upload.close()
+            raise
+        return upload
+    
+    async def _receive_upload(self, reader, writer, headers, content_length, keep_alive):
+        """Versão asyncio de WebHandler._handle_image_upload (corpo lido em pedaços)"""
+        upload = await self._read_upload(reader, writer, headers, content_length, '/upload-image')
+        if upload is None:
+            result = {'error': True, 'message': 'Nenhuma imagem recebida'}
+            return await self._send(writer, 200, JSON_CODEC.dumps(result), 'application/json; charset=utf-8',
+                                    keep_alive, no_cache=True)
+        
+        with upload:
+            image = upload.data()
+            if image:
+                result = await self.analyzer.analyze_image_async(image, upload.sha256())
+            else:
+                result = {'error': True, 'message': 'Nenhuma imagem recebida'}
+        
+        payload, extra = compress_response(JSON_CODEC.dumps(result), headers.get('accept-encoding'))
+        return await self._send(writer, 200, payload, 'application/json; charset=utf-8', keep_alive,
+                                no_cache=True, extra=extra)
+    
+    async def _submit_job(self, reader, writer, headers, content_length, keep_alive):
+        """Versão asyncio de WebHandler._handle_job_submit"""
+        upload = await self._read_upload(reader, writer, headers, content_length, '/jobs')
+        try:
+            if upload is None or not upload.size:
+                if upload is not None:
+                    upload.close()
+                raise RequestError('Nenhuma imagem recebida')
+            job = self.jobs.submit(upload)
+        except RequestError as e:
+            payload = JSON_CODEC.dumps(build_error(str(e)))
+            return await self._send(writer, e.status, payload, 'application/json; charset=utf-8', keep_alive)
+        return await self._send(writer, 202, JSON_CODEC.dumps(job_accepted(job)), 'application/json; charset=utf-8',
+                                keep_alive, no_cache=True, extra=[('Location', f'/jobs/{job.id}')])
+    
+    async def _stream_batch(self, reader, writer, headers, keep_alive, fields=None):
+        """Versão asyncio de WebHandler._handle_batch_validation"""
+        # Clientes HTTP/1.0 não entendem chunked: corpo direto e conexão fechada
+        chunked = keep_alive
+        validator = BatchValidator(self.analyzer, fields=fields)
+        extra = [('Transfer-Encoding', 'chunked')] if chunked else []
+        writer.write(self._head(200, 'application/x-ndjson; charset=utf-8', keep_alive, no_cache=True, extra=extra))
+        
+        def frame(output):
+            return b'%X\r\n%s\r\n' % (len(output), output) if chunked else output
+        
+        try:
+            # Corpo com Content-Length ou chunked, no mesmo pipeline
+            async for piece in self._iter_body(reader, headers, BATCH_READ_SIZE):
+                output = validator.feed(piece)
+                if output:
+                    writer.write(frame(output))
+                    await writer.drain()
+            output = validator.finish()
+        except ConnectionError:
+            raise
+        except (ValueError, asyncio.TimeoutError) as e:
+            # Corpo malformado (RequestError) ou parado; cabeçalhos já enviados:
+            # fecha sem o chunk final para sinalizar erro
+            self._log_error(writer, f'Lote NDJSON interrompido: {str(e) or "tempo esgotado lendo o corpo"}')
+            raise ConnectionAbortedError
+        except Exception:
+            # Falha inesperada: o traceback vai para o log e o stream termina do mesmo jeito
+            self._log_error(writer, 'Erro no lote NDJSON')
+            traceback.print_exc()
+            raise ConnectionAbortedError
+        
+        if output:
+            writer.write(frame(output))
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        if not chunked:
+            raise ConnectionAbortedError  # fim do corpo = fim da conexão
+        return 200
+    
+    async def _stream_job_events(self, writer, job, headers, keep_alive):
+        """Versão asyncio de WebHandler._stream_job_events"""
+        chunked = keep_alive
+        extra = [('Transfer-Encoding', 'chunked')] if chunked else []
+        writer.write(self._head(200, 'text/event-stream; charset=utf-8', keep_alive, no_cache=True, extra=extra))
+        
+        def frame(output):
+            return b'%X\r\n%s\r\n' % (len(output), output) if chunked else output
+        
+        # O worker do JobQueue acorda o loop a cada etapa nova
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        wake = functools.partial(loop.call_soon_threadsafe, ready.set)
+        sent = sse_resume(headers.get('last-event-id'))
+        self.jobs.subscribe(job, wake)
+        try:
+            while True:
+                ready.clear()
+                events, done = self.jobs.events(job, sent)
+                for event in events:
+                    writer.write(frame(sse_event(sent, event)))
+                    sent += 1
+                await writer.drain()
+                if done:
+                    break
+                if not events:
+                    try:
+                        await asyncio.wait_for(ready.wait(), SSE_HEARTBEAT)
+                    except asyncio.TimeoutError:
+                        writer.write(frame(b': keep-alive\n\n'))
+        finally:
+            self.jobs.unsubscribe(job, wake)
+        
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        if not chunked:
+            raise ConnectionAbortedError  # fim do corpo = fim da conexão
+        return 200
+    
+    def _head(self, status, content_type, keep_alive, no_cache=False, extra=(), length=None):
+        """Monta a linha de status e os cabeçalhos da resposta"""
+        lines = [
+            f'HTTP/1.1 {status} {http.HTTPStatus(status).phrase}',
+            f'Server: {self.server_header}',
+            f'Date: {formatdate(usegmt=True)}',
+        ]
+        if content_type and status != 304:
+            lines.append(f'Content-type: {content_type}')
+        if no_cache:
+            lines.append('Cache-Control: no-cache')
+        lines.extend(f'{name}: {value}' for name, value in extra)
+        lines.extend([
+            'Access-Control-Allow-Origin: *',
+            'Access-Control-Allow-Methods: GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers: Content-Type',
+        ])
+        if length is not None:
+            lines.append(f'Content-Length: {length}')
+        lines.append(f'Connection: {"keep-alive" if keep_alive else "close"}')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+    
+    async def _send(self, writer, status, body, content_type, keep_alive, no_cache=False, extra=()):
+        length = len(body) if status != 304 else None
+        writer.write(self._head(status, content_type, keep_alive, no_cache, extra, length) + body)
+        await writer.drain()
+        return status
+    
+    async def _send_payload(self, writer, payload, headers, keep_alive):
+        status, body, extra = payload.negotiate(headers.get('accept-encoding'), headers.get('if-none-match'))
+        return await self._send(writer, status, body, payload.content_type, keep_alive, extra=extra)
+    
+    async def _send_error(self, writer, status, keep_alive):
+        status_info = http.HTTPStatus(status)
+        body = (http.server.DEFAULT_ERROR_MESSAGE % {
+            'code': status,
+            'message': status_info.phrase,
+            'explain': status_info.description
+        }).encode('utf-8', 'replace')
+        return await self._send(writer, status, body, http.server.DEFAULT_ERROR_CONTENT_TYPE, keep_alive)
+    
+    def _log(self, peer, request_line, status):
+        """Log no mesmo formato do BaseHTTPRequestHandler"""
+        host = peer[0] if peer else '-'
+        timestamp = datetime.now().strftime('%d/%b/%Y %H:%M:%S')
+        line = request_line.decode('latin-1').rstrip('\r\n')
+        sys.stderr.write(f'{host} - - [{timestamp}] "{line}" {status} -\n')
+    
+    def _log_error(self, writer, message):
+        """Mensagem de erro no formato do log_error do BaseHTTPRequestHandler"""
+        peer = writer.get_extra_info('peername')
+        host = peer[0] if peer else '-'
+        timestamp = datetime.now().strftime('%d/%b/%Y %H:%M:%S')
+        sys.stderr.write(f'{host} - - [{timestamp}] {message}\n')
+
+class PreforkSupervisor:
+    """
+    Supervisor prefork: N processos worker escutando na mesma porta
+    
+    Cada worker abre seu próprio socket com SO_REUSEPORT e o kernel
+    distribui as conexões entre eles, então cada núcleo tem seu próprio
+    GIL. Workers que morrem são recriados; SIGTERM/SIGINT no supervisor
+    é repassado aos workers e o supervisor sai quando todos terminam.
+    Um worker que morre logo ao iniciar (porta ocupada, configuração
+    inválida) é recriado com espera crescente; depois de max_failures
+    falhas seguidas no mesmo slot o supervisor encerra tudo e sai com 1.
+    """
+    
+    # Worker que morre antes disso é considerado falha de inicialização
+    min_uptime = 1.0
+    # Espera antes de recriar após uma falha de inicialização; dobra a cada falha seguida
+    restart_delay = 1.0
+    max_restart_delay = 30.0
+    max_failures = 5
+    
+    def __init__(self, port, processes, serve):
+        self.port = port
+        self.processes = max(1, int(processes))
+        self.serve = serve  # serve(port) roda dentro de cada worker
+        self.children = {}
+        self.failures = [0] * self.processes  # falhas de inicialização seguidas por slot
+        self.restarts = 0
+        self._stopping = False
+    
+    @staticmethod
+    def supported():
+        return hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT')
+    
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        
+        for slot in range(self.processes):
+            self._spawn(slot)
+        
+        result = 0
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            slot, started = self.children.pop(pid, (None, 0))
+            if slot is None or self._stopping:
+                continue
+            
+            code = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status
+            if time.monotonic() - started >= self.min_uptime:
+                self.failures[slot] = 0
+                print(f"⚠️  Worker {pid} terminou (código {code}) - reiniciando")
+            else:
+                self.failures[slot] += 1
+                if self.failures[slot] >= self.max_failures:
+                    print(f"❌ Worker {pid} falhou ao iniciar {self.failures[slot]} vezes seguidas "
+                          f"(código {code}) - encerrando")
+                    result = 1
+                    self._handle_stop(None, None)
+                    continue
+                delay = min(self.restart_delay * 2 ** (self.failures[slot] - 1), self.max_restart_delay)
+                print(f"⚠️  Worker {pid} falhou ao iniciar (código {code}) - reiniciando em {delay:g}s")
+                self._sleep(delay)
+            if not self._stopping:
+                self.restarts += 1
+                self._spawn(slot)
+        return result
+    
+    def _sleep(self, delay):
+        """Espera delay segundos, parando antes se o supervisor for encerrado"""
+        deadline = time.monotonic() + delay
+        while not self._stopping:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(0.1, remaining))
+    
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+            signal.signal(signal.SIGINT, _raise_keyboard_interrupt)
+            code = 1
+            try:
+                code = self.serve(self.port) or 0
+            except KeyboardInterrupt:
+                code = 0
+            except Exception:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self.children[pid] = (slot, time.monotonic())
+        return pid
+    
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
 def find_free_port(start_port=DEFAULT_PORT, max_attempts=10):
     """Encontra uma porta livre para o servidor"""
     for port in range(start_port, start_port + max_attempts):
@@ -1005,8 +4302,248 @@ def find_free_port(start_port=DEFAULT_PORT, max_attempts=10):
             continue
     return None
 
-def main():
+# Nomes de coluna aceitos nos arquivos CSV -> campos de validate_manual_input
+CSV_COLUMNS = {
+    'cardnumber': 'cardNumber', 'card_number': 'cardNumber',
+    'holdername': 'holderName', 'holder_name': 'holderName', 'cardholder_name': 'holderName',
+    'expirydate': 'expiryDate', 'expiry_date': 'expiryDate',
+    'cvv': 'cvv'
+}
+
+# Tamanho máximo de cada pedaço do arquivo enviado a um processo
+BULK_CHUNK_SIZE = 64 * 1024 * 1024
+
+_bulk_analyzer = None
+
+def _detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'csv' if Path(path).suffix.lower() == '.csv' else 'ndjson'
+
+def _split_ranges(mm, start, end, parts):
+    """Divide [start, end) em até `parts` faixas terminadas em quebra de linha"""
+    bounds = [start]
+    for i in range(1, parts):
+        position = start + (end - start) * i // parts
+        newline = mm.find(b'\n', max(position, bounds[-1]), end)
+        boundary = end if newline < 0 else newline + 1
+        if boundary > bounds[-1] and boundary < end:
+            bounds.append(boundary)
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+def _count_lines(path, start, end):
+    """Conta as quebras de linha de uma faixa do arquivo (via mmap)"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        lines = 0
+        for offset in range(start, end, 1 << 20):
+            lines += mm[offset:min(offset + (1 << 20), end)].count(b'\n')
+        return lines
+
+def _validate_range(task):
+    """
+    Worker de validate_file: valida uma faixa do arquivo
+    
+    Escreve as linhas de resultado em `part_path` e retorna as contagens
+    para o relatório.
+    """
+    global _bulk_analyzer
+    path, start, end, fmt, header, first_line, part_path = task
+    if _bulk_analyzer is None:
+        _bulk_analyzer = CardAnalyzer(verbose=False, cache_size=0)
+    
+    validator = BatchValidator(_bulk_analyzer, first_line=first_line)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            open(part_path, 'wb') as out:
+        if fmt == 'ndjson':
+            for offset in range(start, end, BATCH_READ_SIZE):
+                out.write(validator.feed(mm[offset:min(offset + BATCH_READ_SIZE, end)]))
+            # A faixa termina em \n, então não sobra linha parcial entre faixas
+            out.write(validator.finish())
+        else:
+            columns = [CSV_COLUMNS.get(name.strip().lower()) for name in header]
+            mm.seek(start)
+            while mm.tell() < end:
+                line = mm.readline().decode('utf-8', 'replace')
+                if not line.strip():
+                    validator.line_number += 1
+                    continue
+                row = next(csv.reader([line]))
+                if len(row) != len(columns):
+                    out.write(validator.add_error(f'Esperadas {len(columns)} colunas, encontradas {len(row)}'))
+                    continue
+                out.write(validator.add({key: value for key, value in zip(columns, row) if key}))
+            out.write(validator.finish())
+    
+    return {
+        'records': validator.records,
+        'valid': validator.valid,
+        'errors': validator.errors,
+        'card_types': dict(validator.card_types),
+        'failures': dict(validator.failures)
+    }
+
+def validate_file(input_path, output_path, fmt=None, processes=None, report_path=None):
+    """
+    Valida um arquivo CSV ou NDJSON de cartões sem subir o servidor
+    
+    O arquivo é mapeado em memória (mmap) e dividido em faixas de bytes
+    alinhadas em quebras de linha, validadas em paralelo por um pool de
+    processos com as mesmas regras de validate_manual_input. O resultado é
+    um NDJSON (mesmo formato de /validate/batch, na ordem de entrada) e um
+    relatório JSON com o resumo.
+    
+    Registros CSV precisam estar numa única linha (sem quebras de linha
+    dentro de campos entre aspas).
+    
+    Returns:
+        dict: resumo da validação
+    """
+    started = time.monotonic()
+    fmt = _detect_format(input_path, fmt)
+    processes = processes or os.cpu_count() or 1
+    size = os.path.getsize(input_path)
+    header, data_start = [], 0
+    
+    with open(input_path, 'rb') as f:
+        if fmt == 'csv':
+            header_line = f.readline()
+            header = next(csv.reader([header_line.decode('utf-8-sig')]), [])
+            data_start = len(header_line)
+        ranges = []
+        if size > data_start:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                parts = max(processes * 4, -(-(size - data_start) // BULK_CHUNK_SIZE))
+                ranges = _split_ranges(mm, data_start, size, parts)
+    
+    summary = {'records': 0, 'valid': 0, 'errors': 0, 'card_types': Counter(), 'failures': Counter()}
+    part_paths = [f'{output_path}.part{i}' for i in range(len(ranges))]
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            # 1ª passada: linhas por faixa, para numerar os erros com a linha real
+            line_counts = list(pool.map(_count_lines, *zip(*[(input_path, a, b) for a, b in ranges]))) if ranges else []
+            first_line = 1 if fmt == 'csv' else 0
+            tasks = []
+            for (start, end), part_path, lines in zip(ranges, part_paths, line_counts):
+                tasks.append((input_path, start, end, fmt, header, first_line, part_path))
+                first_line += lines
+            
+            for stats in pool.map(_validate_range, tasks):
+                for key in ('records', 'valid', 'errors'):
+                    summary[key] += stats[key]
+                summary['card_types'].update(stats['card_types'])
+                summary['failures'].update(stats['failures'])
+        
+        with open(output_path, 'wb') as out:
+            for part_path in part_paths:
+                with open(part_path, 'rb') as part:
+                    shutil.copyfileobj(part, out)
+    finally:
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    
+    elapsed = time.monotonic() - started
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'input': str(input_path),
+        'output': str(output_path),
+        'format': fmt,
+        'processes': processes,
+        'chunks': len(ranges),
+        'records': summary['records'],
+        'valid': summary['valid'],
+        'invalid': summary['records'] - summary['valid'],
+        'errors': summary['errors'],
+        'card_types': dict(summary['card_types'].most_common()),
+        'failures': dict(summary['failures'].most_common()),
+        'elapsed_seconds': round(elapsed, 3),
+        'records_per_second': round(summary['records'] / elapsed) if elapsed > 0 else None
+    }
+    with open(report_path or f'{output_path}.summary.json', 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+def bulk_main(argv=None):
+    """Linha de comando: python app.py validate-file ENTRADA [opções]"""
+    parser = argparse.ArgumentParser(prog='app.py validate-file',
+                                     description='Valida arquivos CSV/NDJSON de cartões em lote')
+    parser.add_argument('input', help='arquivo CSV ou NDJSON (um registro por linha)')
+    parser.add_argument('-o', '--output', help='arquivo NDJSON de resultados (padrão: ENTRADA.results.ndjson)')
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='formato da entrada (padrão: pela extensão)')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='processos (padrão: núcleos da máquina)')
+    parser.add_argument('--report', help='relatório JSON (padrão: SAÍDA.summary.json)')
+    args = parser.parse_args(argv)
+    
+    output = args.output or f'{args.input}.results.ndjson'
+    try:
+        report = validate_file(args.input, output, args.format, args.processes, args.report)
+    except OSError as e:
+        print(f"❌ Erro: {e}")
+        return 1
+    
+    print(f"📄 {report['records']} registros em {report['elapsed_seconds']}s "
+          f"({report['records_per_second']} registros/s, {report['processes']} processos)")
+    print(f"   • ✅ Válidos: {report['valid']}")
+    print(f"   • ❌ Inválidos: {report['invalid']}")
+    print(f"   • ⚠️  Linhas com erro: {report['errors']}")
+    print(f"💾 Resultados: {output}")
+    return 0
+
+def parse_args(argv=None):
+    """Lê as opções de linha de comando do servidor"""
+    parser = argparse.ArgumentParser(description='Sistema de Análise de Cartão com Azure AI')
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default=SERVER_ENGINE,
+                        help='engine do servidor HTTP (padrão: SERVER_ENGINE ou threads)')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS,
+                        help='threads do pool (engine threads)')
+    parser.add_argument('--queue-size', type=int, default=SERVER_QUEUE_SIZE,
+                        help='conexões aguardando worker (engine threads)')
+    parser.add_argument('--processes', type=int, default=SERVER_PROCESSES,
+                        help='processos worker com SO_REUSEPORT (1 = sem prefork)')
+    return parser.parse_args(argv)
+
+def _print_banner(port, engine_info):
+    """Mostra informações de inicialização"""
+    print(f"✅ Servidor ativo: http://localhost:{port}")
+    print(f"🔧 Versão: 2.0.0")
+    print(engine_info)
+    
+    if AZURE_ENDPOINT and AZURE_KEY and 'sua-chave-aqui' not in AZURE_KEY:
+        print(f"🤖 Azure AI: ✅ Configurado")
+        print(f"   • Endpoint: {AZURE_ENDPOINT}")
+    else:
+        print(f"⚠️  Azure AI: Modo simulação")
+        print(f"   • Configure as variáveis AZURE_COMPUTER_VISION_ENDPOINT e AZURE_COMPUTER_VISION_KEY")
+    
+    print("\n📋 Funcionalidades disponíveis:")
+    print("   • ✅ Validação manual com algoritmo de Luhn")
+    print("   • ✅ Upload e análise de imagem")
+    print("   • ✅ Interface web moderna e responsiva")
+    print("   • ✅ API REST para integração")
+    
+    print(f"\n🌐 Acesse: http://localhost:{port}")
+    print("🔧 Pressione Ctrl+C para parar")
+    print("-" * 60)
+
+def _serve(args, port, reuse_port=False):
+    """Roda a engine escolhida até ser interrompida"""
+    if args.engine == 'asyncio':
+        AsyncCardServer(port=port, reuse_port=reuse_port).run()
+        return 0
+    
+    with ThreadPoolHTTPServer(("", port), WebHandler, args.workers, args.queue_size,
+                              reuse_port=reuse_port) as httpd:
+        httpd.serve_forever()
+    return 0
+
+def main(argv=None):
     """Função principal do sistema"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'validate-file':
+        return bulk_main(argv[1:])
+    args = parse_args(argv)
+    
     print("🏦 SISTEMA DE ANÁLISE DE CARTÃO COM AZURE AI")
     print("=" * 60)
     
@@ -1019,30 +4556,23 @@ def main():
     try:
         print(f"🚀 Iniciando servidor na porta {port}...")
         
-        with socketserver.TCPServer(("", port), WebHandler) as httpd:
-            httpd.allow_reuse_address = True
-            
-            print(f"✅ Servidor ativo: http://localhost:{port}")
-            print(f"🔧 Versão: 2.0.0")
-            
-            if AZURE_ENDPOINT and AZURE_KEY and 'sua-chave-aqui' not in AZURE_KEY:
-                print(f"🤖 Azure AI: ✅ Configurado")
-                print(f"   • Endpoint: {AZURE_ENDPOINT}")
-            else:
-                print(f"⚠️  Azure AI: Modo simulação")
-                print(f"   • Configure as variáveis AZURE_COMPUTER_VISION_ENDPOINT e AZURE_COMPUTER_VISION_KEY")
-            
-            print("\n📋 Funcionalidades disponíveis:")
-            print("   • ✅ Validação manual com algoritmo de Luhn")
-            print("   • ✅ Upload e análise de imagem")
-            print("   • ✅ Interface web moderna e responsiva")
-            print("   • ✅ API REST para integração")
-            
-            print(f"\n🌐 Acesse: http://localhost:{port}")
-            print("🔧 Pressione Ctrl+C para parar")
-            print("-" * 60)
-            
-            httpd.serve_forever()
+        if args.engine == 'asyncio':
+            engine_info = f"⚡ Engine: asyncio (timeout ocioso: {ASYNC_IDLE_TIMEOUT:g}s)"
+        else:
+            engine_info = f"🧵 Engine: threads — {args.workers} workers (fila: {args.queue_size})"
+        
+        if args.processes > 1:
+            if PreforkSupervisor.supported():
+                supervisor = PreforkSupervisor(port, args.processes, lambda p: _serve(args, p, reuse_port=True))
+                WebHandler.main_page = build_main_page(jobs_enabled=False)
+                _print_banner(port, f"{engine_info}\n🧩 Prefork: {supervisor.processes} processos (SO_REUSEPORT)\n"
+                                    f"   • Jobs (/jobs) ficam em cada processo: o status e o stream de um job\n"
+                                    f"     só respondem no worker que o recebeu; a página usa /upload-image")
+                return supervisor.run()
+            print("⚠️  Prefork indisponível nesta plataforma - usando processo único")
+        
+        _print_banner(port, engine_info)
+        _serve(args, port)
             
     except KeyboardInterrupt:
         print("\n\n🛑 Servidor parado pelo usuário")
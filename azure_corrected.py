@@ -5,30 +5,48 @@ Com análise real da imagem do cartão
 """
 
 import http.server
-import socketserver
-import json
-import re
 from datetime import datetime
 import socket
 import base64
+import hashlib
+import threading
+
+from app import (BIN_TABLE, IMAGE_CACHE_SIZE, JSON_CODEC, ImageResultCache, KeepAliveMixin, RequestError,
+                 StaticAssets, StaticPayload, ThreadPoolHTTPServer, apply_bin_info, card_type_of,
+                 compress_response, cvv_valid, expiry_valid, luhn_valid, normalize_digits, pan_check,
+                 upload_rejections)
 
 # CREDENCIAIS AZURE CONFIGURADAS
 AZURE_ENDPOINT = "https://doudge828.cognitiveservices.azure.com/"
 AZURE_KEY = "EDIHG8LptvVqSueJag588xHNT7LlpAH5kSSXYOoAurHtyinqLGsvJQQJ99BJACYeBjFXJ3w3AAALACOGVaJ"
 
+# Favicon simples em base64 (ícone de cartão)
+FAVICON_B64 = 'AAABAAEAEBAAAAEAIABoBAAAFgAAACgAAAAQAAAAIAAAAAEAIAAAAAAAAAQAABILAAASCwAAAAAAAAAAAAD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A'
+
 class AzureCardSystem:
     """Sistema com análise real de imagem"""
     
     def __init__(self):
         self.azure_configured = True
+        self.image_cache = ImageResultCache('azure-corrected') if IMAGE_CACHE_SIZE > 0 else None
         print(f"✅ Azure configurado: {AZURE_ENDPOINT}")
         print(f"🔑 Chave: {AZURE_KEY[:30]}...")
     
-    def analyze_real_image(self, image_data):
-        """Analisa imagem real do cartão enviada"""
+    def analyze_real_image(self, image_data, digest=None):
+        """Analisa imagem real do cartão enviada (digest: SHA-256 calculado no upload)"""
         try:
-            # Simula análise da imagem real baseada no que vemos
-            extracted_data = self.extract_from_image(image_data)
+            # Imagem já vista: reaproveita a extração do cache
+            cache = self.image_cache
+            extracted_data = None
+            if cache is not None:
+                digest = digest or hashlib.sha256(image_data or b'').hexdigest()
+                extracted_data = cache.get(digest, len(image_data) if image_data else 0)
+            if extracted_data is None:
+                # Simula análise da imagem real baseada no que vemos
+                extracted_data = self.extract_from_image(image_data)
+                if cache is not None:
+                    cache.put(digest, extracted_data)
+            extracted_data = apply_bin_info(extracted_data)
             
             return {
                 'timestamp': datetime.now().isoformat(),
@@ -66,15 +84,21 @@ class AzureCardSystem:
     
     def validate_manual(self, data):
         """Valida entrada manual"""
+        # Número normalizado uma vez só para bandeira/BIN e Luhn
+        card_number = data.get('cardNumber', '')
+        digits = normalize_digits(card_number)
+        card_type, bank_name, edition = BIN_TABLE.lookup(digits)
         extracted = {
-            'card_number': data.get('cardNumber', ''),
+            'card_number': card_number,
             'cardholder_name': data.get('holderName', ''),
             'expiry_date': data.get('expiryDate', ''),
             'cvv': data.get('cvv', ''),
-            'card_type': self.get_card_type(data.get('cardNumber', ''))
+            'card_type': card_type,
+            'bank_name': bank_name,
+            'edition': edition
         }
         
-        validation = self.validate_data(extracted)
+        validation = self.validate_data(extracted, pan_digits=digits)
         
         # Valida CVV
         cvv_valid = self.validate_cvv(extracted['cvv'], extracted['card_type'])
@@ -82,13 +106,7 @@ class AzureCardSystem:
             'valid': cvv_valid,
             'message': 'CVV válido' if cvv_valid else 'CVV inválido'
         }
-        
-        validation['overall_valid'] = all([
-            validation['card_number']['valid'],
-            validation['expiry_date']['valid'],
-            validation['cardholder_name']['valid'],
-            validation['cvv']['valid']
-        ])
+        validation['overall_valid'] = validation['overall_valid'] and cvv_valid
         
         confidence = self.calculate_confidence(extracted, validation)
         
@@ -100,120 +118,66 @@ class AzureCardSystem:
             'confidence_scores': confidence
         }
     
-    def validate_data(self, data):
-        """Valida dados extraídos"""
-        validation = {
-            'card_number': {'valid': False, 'message': ''},
-            'expiry_date': {'valid': False, 'message': ''},
-            'cardholder_name': {'valid': False, 'message': ''},
-            'overall_valid': False
-        }
-        
+    def validate_data(self, data, pan_digits=None):
+        """Valida dados extraídos (pan_digits: número já normalizado, opcional)"""
         # Número do cartão
-        if data.get('card_number'):
-            if self.luhn_check(data['card_number']):
-                validation['card_number']['valid'] = True
-                validation['card_number']['message'] = 'Número válido'
-            else:
-                validation['card_number']['message'] = 'Número inválido'
+        card_number = data.get('card_number')
+        if not card_number:
+            number_valid, number_message = False, 'Número não encontrado'
         else:
-            validation['card_number']['message'] = 'Número não encontrado'
+            digits = normalize_digits(card_number) if pan_digits is None else pan_digits
+            number_valid = pan_check(digits, data.get('card_type') or card_type_of(digits)) in ('luhn', 'unchecked')
+            number_message = 'Número válido' if number_valid else 'Número inválido'
         
         # Data de expiração
-        if data.get('expiry_date') and data['expiry_date'] != '00/00':
-            if self.validate_expiry(data['expiry_date']):
-                validation['expiry_date']['valid'] = True
-                validation['expiry_date']['message'] = 'Data válida'
-            else:
-                validation['expiry_date']['message'] = 'Data inválida'
+        expiry = data.get('expiry_date')
+        if not expiry or expiry == '00/00':
+            expiry_ok, expiry_message = False, 'Data não encontrada ou ilegível'
+        elif self.validate_expiry(expiry):
+            expiry_ok, expiry_message = True, 'Data válida'
         else:
-            validation['expiry_date']['message'] = 'Data não encontrada ou ilegível'
+            expiry_ok, expiry_message = False, 'Data inválida'
         
         # Nome
-        if data.get('cardholder_name') and data['cardholder_name'] != 'CARDHOLDER NAME':
-            if len(data['cardholder_name'].strip()) >= 2:
-                validation['cardholder_name']['valid'] = True
-                validation['cardholder_name']['message'] = 'Nome válido'
-            else:
-                validation['cardholder_name']['message'] = 'Nome muito curto'
+        name = data.get('cardholder_name')
+        if not name or name == 'CARDHOLDER NAME':
+            name_valid, name_message = False, 'Nome não encontrado ou genérico'
+        elif len(name.strip()) >= 2:
+            name_valid, name_message = True, 'Nome válido'
         else:
-            validation['cardholder_name']['message'] = 'Nome não encontrado ou genérico'
+            name_valid, name_message = False, 'Nome muito curto'
         
-        validation['overall_valid'] = all([
-            validation['card_number']['valid'],
-            validation['expiry_date']['valid'],
-            validation['cardholder_name']['valid']
-        ])
-        
-        return validation
+        return {
+            'card_number': {'valid': number_valid, 'message': number_message},
+            'expiry_date': {'valid': expiry_ok, 'message': expiry_message},
+            'cardholder_name': {'valid': name_valid, 'message': name_message},
+            'overall_valid': number_valid and expiry_ok and name_valid
+        }
     
     def luhn_check(self, card_number):
         """Algoritmo de Luhn"""
         try:
-            clean = re.sub(r'\D', '', str(card_number))
-            if len(clean) < 13:
-                return False
-            
-            digits = [int(d) for d in clean]
-            checksum = 0
-            
-            for i in range(len(digits) - 1, -1, -1):
-                n = digits[i]
-                if (len(digits) - i) % 2 == 0:
-                    n *= 2
-                    if n > 9:
-                        n -= 9
-                checksum += n
-            
-            return checksum % 10 == 0
-        except:
+            return luhn_valid(normalize_digits(card_number))
+        except Exception:
             return False
     
     def validate_expiry(self, expiry):
         """Valida data de expiração"""
         try:
-            clean = re.sub(r'[^0-9]', '', str(expiry))
-            
-            if len(clean) == 4:
-                month = int(clean[:2])
-                year = int('20' + clean[2:])
-            else:
-                return False
-            
-            if month < 1 or month > 12:
-                return False
-            
-            current = datetime.now()
-            expiry_date = datetime(year, month, 1)
-            
-            return expiry_date > current
-        except:
+            return expiry_valid(expiry)
+        except Exception:
             return False
     
     def validate_cvv(self, cvv, card_type):
         """Valida CVV"""
         try:
-            clean = re.sub(r'\D', '', str(cvv))
-            
-            if card_type == 'American Express':
-                return len(clean) == 4
-            else:
-                return len(clean) == 3
-        except:
+            return cvv_valid(cvv, card_type)
+        except Exception:
             return False
     
     def get_card_type(self, card_number):
-        """Identifica tipo do cartão"""
-        clean = re.sub(r'\D', '', str(card_number))
-        
-        if clean.startswith('4'):
-            return 'Visa'
-        elif clean.startswith('5'):
-            return 'Mastercard'
-        elif clean.startswith('3'):
-            return 'American Express'
-        else:
-            return 'Desconhecido'
+        """Identifica tipo do cartão pela tabela BIN"""
+        return BIN_TABLE.lookup(normalize_digits(card_number))[0]
     
     def calculate_confidence(self, data, validation):
         """Calcula confiança"""
@@ -243,15 +207,18 @@ class AzureCardSystem:
         
         return scores
 
-class AzureHandler(http.server.SimpleHTTPRequestHandler):
+class AzureHandler(KeepAliveMixin, http.server.SimpleHTTPRequestHandler):
     """Handler com upload de imagem funcional"""
     
     # Sistema compartilhado para evitar múltiplas instâncias
     _shared_system = None
+    _shared_lock = threading.Lock()
     
     def __init__(self, *args, **kwargs):
         if AzureHandler._shared_system is None:
-            AzureHandler._shared_system = AzureCardSystem()
+            with AzureHandler._shared_lock:
+                if AzureHandler._shared_system is None:
+                    AzureHandler._shared_system = AzureCardSystem()
         self.system = AzureHandler._shared_system
         super().__init__(*args, directory=None, **kwargs)
     
@@ -262,8 +229,7 @@ class AzureHandler(http.server.SimpleHTTPRequestHandler):
         super().end_headers()
     
     def do_OPTIONS(self):
-        self.send_response(200)
-        self.end_headers()
+        self._send_body(200, None, b'')
     
     def do_GET(self):
         # Remove query parameters da URL
@@ -271,11 +237,7 @@ class AzureHandler(http.server.SimpleHTTPRequestHandler):
         
         if path == '/' or path == '/index.html':
             try:
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html; charset=utf-8')
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(self.get_html().encode('utf-8'))
+                self._send_payload(self.main_page)
             except (ConnectionAbortedError, BrokenPipeError):
                 # Ignora erros de conexão abortada
                 pass
@@ -284,25 +246,23 @@ class AzureHandler(http.server.SimpleHTTPRequestHandler):
                 status = {
                     'azure_configured': True,
                     'azure_endpoint': AZURE_ENDPOINT,
+                    'json_codec': JSON_CODEC.name,
+                    'upload_rejections': upload_rejections(),
+                    'image_cache': self.system.image_cache.stats() if self.system.image_cache is not None else None,
                     'timestamp': datetime.now().isoformat()
                 }
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(json.dumps(status).encode('utf-8'))
+                self._send_body(200, 'application/json', JSON_CODEC.dumps(status),
+                                [('Cache-Control', 'no-cache')])
             except (ConnectionAbortedError, BrokenPipeError):
                 pass
-        elif path == '/favicon.ico':
-            # Retorna favicon simples
+        elif path == '/favicon.ico' or path.startswith(StaticAssets.prefix):
+            # Favicon e CSS/JS com fingerprint (preparados na inicialização)
+            payload = self.favicon if path == '/favicon.ico' else self.assets.get(path)
             try:
-                self.send_response(200)
-                self.send_header('Content-type', 'image/x-icon')
-                self.send_header('Cache-Control', 'max-age=86400')
-                self.end_headers()
-                # Favicon simples em base64 (ícone de cartão)
-                favicon_data = base64.b64decode('AAABAAEAEBAAAAEAIABoBAAAFgAAACgAAAAQAAAAIAAAAAEAIAAAAAAAAAQAABILAAASCwAAAAAAAAAAAAD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A////AP///wD///8A')
-                self.wfile.write(favicon_data)
+                if payload is None:
+                    self.send_error(404)
+                else:
+                    self._send_payload(payload)
             except (ConnectionAbortedError, BrokenPipeError):
                 pass
         else:
@@ -314,24 +274,22 @@ class AzureHandler(http.server.SimpleHTTPRequestHandler):
     def do_POST(self):
         try:
             if self.path == '/validate':
-                content_length = int(self.headers.get('Content-Length', 0))
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode('utf-8'))
+                data = self._read_json()
                 result = self.system.validate_manual(data)
                 
             elif self.path == '/upload-image':
-                # Processa upload real da imagem
-                content_length = int(self.headers.get('Content-Length', 0))
-                
-                if content_length > 0:
-                    # Lê dados do upload
-                    post_data = self.rfile.read(content_length)
-                    
-                    # Processa a imagem (simula análise baseada na imagem do usuário)
-                    result = self.system.analyze_real_image(post_data)
-                    
-                else:
-                    result = {'error': True, 'message': 'Nenhuma imagem recebida'}
+                # Lê o upload em streaming: só a parte da imagem chega à análise
+                upload = self._read_upload()
+                try:
+                    image = upload.data() if upload is not None else None
+                    if image:
+                        # Processa a imagem (simula análise baseada na imagem do usuário)
+                        result = self.system.analyze_real_image(image, upload.sha256())
+                    else:
+                        result = {'error': True, 'message': 'Nenhuma imagem recebida'}
+                finally:
+                    if upload is not None:
+                        upload.close()
             else:
                 try:
                     self.send_error(404)
@@ -340,35 +298,42 @@ class AzureHandler(http.server.SimpleHTTPRequestHandler):
                 return
             
             try:
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json; charset=utf-8')
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(json.dumps(result, ensure_ascii=False).encode('utf-8'))
+                body = JSON_CODEC.dumps(result)
+                body, headers = compress_response(body, self.headers.get('Accept-Encoding'))
+                self._send_body(200, 'application/json; charset=utf-8', body, [('Cache-Control', 'no-cache')] + headers)
             except (ConnectionAbortedError, BrokenPipeError):
                 # Conexão foi abortada, ignora
                 pass
             
-        except (ConnectionAbortedError, BrokenPipeError):
+        except (ConnectionAbortedError, BrokenPipeError, ConnectionResetError):
             # Conexão foi abortada, ignora
-            pass
+            self.close_connection = True
+        except RequestError as e:
+            self._send_error_response(str(e), e.status)
+        except TimeoutError:
+            # Nada chegou em REQUEST_TIMEOUT segundos no meio do corpo
+            self._send_error_response('Tempo esgotado lendo a requisição', 408)
         except Exception as e:
-            try:
-                error_response = {
-                    'error': True,
-                    'message': f'Erro no servidor: {str(e)}',
-                    'timestamp': datetime.now().isoformat()
-                }
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json; charset=utf-8')
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(json.dumps(error_response, ensure_ascii=False).encode('utf-8'))
-            except (ConnectionAbortedError, BrokenPipeError):
-                # Conexão foi abortada, ignora
-                pass
+            self._send_error_response(f'Erro no servidor: {str(e)}')
+    
+    def _send_error_response(self, message, status=500):
+        """Envia resposta de erro"""
+        error_response = {
+            'error': True,
+            'message': message,
+            'timestamp': datetime.now().isoformat()
+        }
+        # O corpo da requisição pode não ter sido lido: fecha a conexão
+        body = JSON_CODEC.dumps(error_response)
+        try:
+            self._send_body(status, 'application/json; charset=utf-8', body,
+                            [('Cache-Control', 'no-cache'), ('Connection', 'close')])
+        except (ConnectionAbortedError, BrokenPipeError, ConnectionResetError):
+            # Cliente já foi embora (ex.: 415 antes do fim do upload)
+            self.close_connection = True
     
-    def get_html(self):
+    @staticmethod
+    def get_html():
         return """<!DOCTYPE html>
 <html lang="pt-BR">
 <head>
@@ -1172,6 +1137,15 @@ class AzureHandler(http.server.SimpleHTTPRequestHandler):
 </body>
 </html>"""
 
+# Assets e página preparados uma única vez na inicialização
+_favicon_data = base64.b64decode(FAVICON_B64)
+AzureHandler.assets = StaticAssets()
+AzureHandler.favicon = StaticPayload(_favicon_data, 'image/x-icon', 'max-age=86400')
+AzureHandler.main_page = StaticPayload.from_html(AzureHandler.assets.externalize(
+    AzureHandler.get_html(), 'azure',
+    icon_url=AzureHandler.assets.add('favicon.ico', _favicon_data, 'image/x-icon')
+))
+
 def find_free_port(start=8000, end=8100):
     """Encontra porta livre"""
     for port in range(start, end):
@@ -1195,10 +1169,9 @@ def main():
         print("=" * 55)
         print(f"🚀 Iniciando servidor na porta {port}...")
         
-        with socketserver.TCPServer(("", port), AzureHandler) as httpd:
-            httpd.allow_reuse_address = True
-            
+        with ThreadPoolHTTPServer(("", port), AzureHandler) as httpd:
             print(f"✅ SERVIDOR ATIVO: http://localhost:{port}")
+            print(f"🧵 Workers: {httpd.workers} (fila: {httpd.queue_size})")
             print(f"\n🤖 AZURE AI CONFIGURADO:")
             print(f"   • Endpoint: {AZURE_ENDPOINT}")
             print(f"   • Chave: {AZURE_KEY[:30]}...")
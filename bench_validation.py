@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark do kernel de validação (normalize_digits / luhn_valid / expiry_valid)
+contra a implementação anterior baseada em regex, mantida aqui só como referência.
+
+Uso: python bench_validation.py [--number N] [--repeat R]
+"""
+
+import argparse
+import re
+import timeit
+from datetime import datetime
+
+from app import (EXPIRY_PLACEHOLDERS, CardAnalyzer, card_type_of, cvv_valid, expiry_valid, luhn_valid,
+                 name_verdict, normalize_digits, pan_check)
+
+SAMPLES = [
+    '4532 0151 1283 0366',
+    '5555-5555-5555-4444',
+    '378282246310005',
+    '6011111111111117',
+    '4000 0000 0000 0001',
+]
+EXPIRIES = ['12/30', '01/20', '1229', '13/29']
+RECORD = {
+    'cardNumber': '4532 0151 1283 0366',
+    'holderName': 'JOAO DA SILVA',
+    'expiryDate': '12/30',
+    'cvv': '123',
+}
+# Registros em que as regras antigas e as atuais dão o mesmo resultado
+RECORDS = [
+    RECORD,
+    {'cardNumber': '378282246310005', 'holderName': 'ANA', 'expiryDate': '12/30', 'cvv': '1234'},
+    {'cardNumber': '5555-5555-5555-4444', 'holderName': 'ANA', 'expiryDate': '01/20', 'cvv': '123'},
+    {'cardNumber': '4000 0000 0000 0001', 'holderName': 'ANA', 'expiryDate': '12/30', 'cvv': '123'},
+    {'cardNumber': '6011111111111117', 'holderName': 'A', 'expiryDate': '12/30', 'cvv': '123'},
+]
+# Onde as regras atuais mudaram o resultado (fora da comparação com o legado):
+# tamanho do número por bandeira (Visa com 14, Mastercard com 19) e nome genérico do OCR
+CHANGED_RECORDS = [
+    {'cardNumber': '45320151120002', 'holderName': 'ANA', 'expiryDate': '12/30', 'cvv': '123'},
+    {'cardNumber': '5555555555000000000', 'holderName': 'ANA', 'expiryDate': '12/30', 'cvv': '123'},
+    {'cardNumber': '4532 0151 1283 0366', 'holderName': 'CARDHOLDER NAME', 'expiryDate': '12/30', 'cvv': '123'},
+]
+
+
+# ---- Implementação anterior (uma regex por etapa, listas intermediárias) ----
+
+def legacy_luhn(card_number):
+    clean = re.sub(r'\D', '', str(card_number))
+    if len(clean) < 13:
+        return False
+    digits = [int(d) for d in clean]
+    checksum = 0
+    for i in range(len(digits) - 1, -1, -1):
+        n = digits[i]
+        if (len(digits) - i) % 2 == 0:
+            n *= 2
+            if n > 9:
+                n -= 9
+        checksum += n
+    return checksum % 10 == 0
+
+
+def legacy_expiry(expiry):
+    clean = re.sub(r'[^0-9]', '', str(expiry))
+    if len(clean) != 4:
+        return False
+    month = int(clean[:2])
+    year = int('20' + clean[2:])
+    if month < 1 or month > 12:
+        return False
+    return datetime(year, month, 1) > datetime.now()
+
+
+def legacy_type(card_number):
+    clean = re.sub(r'\D', '', str(card_number))
+    if clean.startswith('4'):
+        return 'Visa'
+    if clean.startswith(('5', '2')):
+        return 'Mastercard'
+    if clean.startswith(('34', '37')):
+        return 'American Express'
+    if clean.startswith('6'):
+        return 'Discover'
+    return 'Desconhecido'
+
+
+def legacy_cvv(cvv, card_type):
+    clean = re.sub(r'\D', '', str(cvv))
+    return len(clean) == (4 if card_type == 'American Express' else 3)
+
+
+def legacy_manual(data):
+    number = data['cardNumber']
+    card_type = legacy_type(number)
+    return (legacy_luhn(number) and legacy_expiry(data['expiryDate'])
+            and len(data['holderName'].strip()) >= 2 and legacy_cvv(data['cvv'], card_type))
+
+
+# ---- Kernel atual ----
+
+def kernel_luhn(card_number):
+    return luhn_valid(normalize_digits(card_number))
+
+
+def kernel_type(card_number):
+    return card_type_of(normalize_digits(card_number))
+
+
+def kernel_manual(data):
+    """overall_valid de CardAnalyzer.validate_manual_input, pelas mesmas funções do kernel"""
+    number, expiry = data['cardNumber'], data['expiryDate']
+    digits = normalize_digits(number)
+    card_type = card_type_of(digits)
+    return (bool(number) and pan_check(digits, card_type) in ('luhn', 'unchecked')
+            and bool(expiry) and expiry not in EXPIRY_PLACEHOLDERS and expiry_valid(expiry)
+            and name_verdict(data['holderName']) == 'valid'
+            and cvv_valid(data['cvv'], card_type))
+
+
+def bench(label, legacy, kernel, args, number, repeat, changed=()):
+    """Compara legado e kernel em args; em `changed` as regras mudaram e só o tempo conta"""
+    for a in args:
+        assert legacy(a) == kernel(a), (label, a)
+    args = list(args) + list(changed)
+
+    def run(fn):
+        return min(timeit.repeat(lambda: [fn(a) for a in args], number=number, repeat=repeat))
+
+    old, new = run(legacy), run(kernel)
+    per_call = 1e6 / (number * len(args))
+    print(f'{label:<12} legado {old * per_call:7.2f} µs  kernel {new * per_call:7.2f} µs  {old / new:5.2f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmark do kernel de validação')
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    bench('luhn', legacy_luhn, kernel_luhn, SAMPLES, args.number, args.repeat)
+    bench('bandeira', legacy_type, kernel_type, SAMPLES, args.number, args.repeat)
+    bench('expiração', legacy_expiry, expiry_valid, EXPIRIES, args.number, args.repeat)
+    # O kernel é o que roda em produção: confere contra o CardAnalyzer
+    analyzer = CardAnalyzer(verbose=False, cache_size=0)
+    for record in RECORDS + CHANGED_RECORDS:
+        assert kernel_manual(record) == analyzer.validate_manual_input(record)['validation']['overall_valid'], record
+    assert all(legacy_manual(r) != kernel_manual(r) for r in CHANGED_RECORDS)
+    bench('manual', legacy_manual, kernel_manual, RECORDS, args.number // len(RECORDS), args.repeat,
+          changed=CHANGED_RECORDS)
+
+    # Caminho completo com os dicts de resposta
+    total = min(timeit.repeat(lambda: analyzer.validate_manual_input(RECORD),
+                              number=args.number, repeat=args.repeat))
+    print(f'validate_manual_input completo: {total * 1e6 / args.number:.2f} µs/chamada')
+    
+    cached = CardAnalyzer(verbose=False)
+    total = min(timeit.repeat(lambda: cached.validate_manual_input(RECORD),
+                              number=args.number, repeat=args.repeat))
+    print(f'validate_manual_input com cache: {total * 1e6 / args.number:.2f} µs/chamada')
+
+
+if __name__ == '__main__':
+    main()
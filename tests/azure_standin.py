@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita a API Read do Azure (sem rede, sem chave real)
+
+Atende POST .../read/analyze (e .../documentModels/{modelo}:analyze) com 202
+e Operation-Location, e GET da operação com 'running' nas primeiras
+consultas e 'succeeded' depois, no formato do Read 3.2 (ou do Form
+Recognizer). Pode responder 429 com Retry-After e atrasar as respostas,
+para exercitar o AzureReadClient de ponta a ponta.
+
+Uso manual:
+    python tests/azure_standin.py 8099
+    AZURE_COMPUTER_VISION_ENDPOINT=http://127.0.0.1:8099/ \\
+    AZURE_COMPUTER_VISION_KEY=standin-key python app.py
+"""
+
+import hashlib
+import http.server
+import json
+import sys
+import threading
+import time
+import uuid
+
+STANDIN_KEY = 'standin-key'
+
+CARD_LINES = ['BANCO EXEMPLO', 'PLATINUM', '4532 0151 1283 0366', 'VALID THRU 09/29', 'MARIA DA SILVA', 'VISA']
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_POST(self):
+        standin = self.server.standin
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        standin.record(self, body)
+        if self.headers.get('Ocp-Apim-Subscription-Key') != standin.key:
+            return self._send(401, {'error': {'code': '401', 'message': 'Chave inválida'}})
+        if not self.path.split('?')[0].endswith(('/read/analyze', ':analyze')):
+            return self._send(404, {'error': {'code': 'NotFound'}})
+        
+        time.sleep(standin.delay)
+        with standin.lock:
+            throttled = standin.throttle_posts > 0
+            if throttled:
+                standin.throttle_posts -= 1
+            else:
+                operation = uuid.uuid4().hex
+                standin.operations[operation] = (0, 'documentModels' in self.path)
+        if throttled:
+            return self._send(429, {'error': {'code': '429'}}, [('Retry-After', standin.retry_after)])
+        
+        self.send_response(202)
+        self.send_header('Operation-Location', f'http://{self.headers["Host"]}/operations/{operation}?x=1')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def do_GET(self):
+        standin = self.server.standin
+        standin.record(self, b'')
+        if self.headers.get('Ocp-Apim-Subscription-Key') != standin.key:
+            return self._send(401, {'error': {'code': '401', 'message': 'Chave inválida'}})
+        
+        operation = self.path.split('?')[0].rsplit('/', 1)[-1]
+        with standin.lock:
+            if operation not in standin.operations:
+                polls = None
+            else:
+                polls, form = standin.operations[operation]
+                standin.operations[operation] = (polls + 1, form)
+                throttled = standin.throttle_polls > 0
+                if throttled:
+                    standin.throttle_polls -= 1
+        if polls is None:
+            return self._send(404, {'error': {'code': 'NotFound'}})
+        if throttled:
+            return self._send(429, {'error': {'code': '429'}}, [('Retry-After', standin.retry_after)])
+        if polls < standin.running_polls:
+            return self._send(200, {'status': 'running'})
+        
+        if form:
+            analysis = {'content': '\n'.join(CARD_LINES),
+                        'documents': [{'fields': {'CardHolderName': {'valueString': 'MARIA FORM'}}}]}
+        else:
+            analysis = {'readResults': [{'lines': [{'text': text} for text in CARD_LINES]}]}
+        self._send(200, {'status': 'succeeded', 'analyzeResult': analysis})
+    
+    def _send(self, status, payload, headers=()):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+class AzureStandIn:
+    """
+    Stand-in do Azure Read em 127.0.0.1 (porta 0 escolhe uma livre)
+    
+    running_polls: consultas respondidas com 'running' antes do resultado
+    throttle_posts / throttle_polls: quantos POSTs / GETs seguintes recebem 429
+    retry_after: valor do Retry-After dos 429 (em segundos, como texto)
+    delay: atraso (em segundos) antes de responder cada POST
+    
+    connections guarda a porta de origem de cada conexão vista e requests
+    (método, caminho, tamanho e SHA-256 do corpo) de cada requisição.
+    """
+    
+    def __init__(self, port=0, key=STANDIN_KEY, running_polls=1):
+        self.key = key
+        self.running_polls = running_polls
+        self.throttle_posts = self.throttle_polls = 0
+        self.retry_after = '0'
+        self.delay = 0.0
+        self.operations = {}
+        self.connections = set()
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.server.daemon_threads = True
+        self.server.standin = self
+        self.port = self.server.server_address[1]
+        self.endpoint = f'http://127.0.0.1:{self.port}/'
+        self._thread = None
+    
+    def record(self, handler, body):
+        with self.lock:
+            self.connections.add(handler.client_address[1])
+            self.requests.append((handler.command, handler.path, len(body), hashlib.sha256(body).hexdigest()))
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), name='azure-standin',
+                                        daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+
+if __name__ == '__main__':
+    standin = AzureStandIn(int(sys.argv[1]) if len(sys.argv) > 1 else 8099).start()
+    print(f'Azure stand-in em {standin.endpoint} (chave: {standin.key})')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        standin.stop()
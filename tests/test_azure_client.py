@@ -0,0 +1,128 @@
+"""AzureReadClient de ponta a ponta contra o stand-in local (tests/azure_standin.py)"""
+
+import hashlib
+import time
+import unittest
+
+import app
+from tests.azure_standin import STANDIN_KEY, AzureStandIn
+
+def make_client(standin, **options):
+    options.setdefault('timeout', 5.0)
+    options.setdefault('connect_timeout', 2.0)
+    options.setdefault('pool_size', 2)
+    options.setdefault('poll_interval', 0.01)
+    options.setdefault('poll_min_interval', 0.001)
+    return app.AzureReadClient(standin.endpoint, STANDIN_KEY, **options)
+
+class AzureReadClientTest(unittest.TestCase):
+    def setUp(self):
+        self.standin = AzureStandIn().start()
+        self.addCleanup(self.standin.stop)
+    
+    def client(self, **options):
+        client = make_client(self.standin, **options)
+        self.addCleanup(client.close)
+        return client
+    
+    def test_read_result_is_parsed(self):
+        fields = self.client().analyze(b'\xff\xd8\xff' + b'imagem' * 100)
+        self.assertEqual(fields['card_number'], '4532 0151 1283 0366')
+        self.assertEqual(fields['expiry_date'], '09/29')
+        self.assertEqual(fields['cardholder_name'], 'MARIA DA SILVA')
+        self.assertEqual(fields['confidence'], 'azure')
+    
+    def test_prebuilt_model_fields_win(self):
+        fields = self.client(model='prebuilt-creditCard').analyze(b'imagem')
+        self.assertEqual(fields['cardholder_name'], 'MARIA FORM')
+        self.assertIn('documentModels/prebuilt-creditCard:analyze', self.standin.requests[0][1])
+    
+    def test_body_is_sent_unchanged(self):
+        image = bytes(range(256)) * 64
+        self.client().analyze(memoryview(image))
+        method, path, size, digest = self.standin.requests[0]
+        self.assertEqual((method, size, digest), ('POST', len(image), hashlib.sha256(image).hexdigest()))
+        self.assertTrue(path.endswith('/vision/v3.2/read/analyze'))
+    
+    def test_connection_is_reused(self):
+        self.standin.running_polls = 2
+        client = self.client()
+        for _ in range(3):
+            client.analyze(b'imagem')
+        stats = client.stats()
+        # 3 análises = 3 POSTs + 9 consultas, todas pela mesma conexão
+        self.assertEqual(len(self.standin.requests), 12)
+        self.assertEqual(len(self.standin.connections), 1)
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_reused'], 11)
+        self.assertEqual(stats['requests'], 12)
+        self.assertEqual(stats['analyses'], 3)
+        self.assertEqual(stats['polls_per_analysis'], 3.0)
+    
+    def test_pool_is_bounded(self):
+        client = self.client(pool_size=2)
+        for _ in range(6):
+            client.analyze(b'imagem')
+        self.assertLessEqual(client.stats()['idle_connections'], 2)
+        self.assertLessEqual(len(self.standin.connections), 2)
+    
+    def test_timeouts_are_applied(self):
+        client = self.client(timeout=3.5, connect_timeout=1.5)
+        conn, reused = client._checkout()
+        self.addCleanup(conn.close)
+        self.assertFalse(reused)
+        # connect_timeout só para abrir a conexão; timeout em cada leitura
+        self.assertEqual(conn.timeout, 1.5)
+        self.assertEqual(conn.sock.gettimeout(), 3.5)
+    
+    def test_slow_response_times_out(self):
+        self.standin.delay = 1.0
+        client = self.client(timeout=0.2)
+        start = time.monotonic()
+        with self.assertRaises(app.AzureError):
+            client.analyze(b'imagem')
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(client.stats()['errors'], 1)
+    
+    def test_operation_deadline(self):
+        self.standin.running_polls = 10 ** 6
+        client = self.client(timeout=0.3)
+        with self.assertRaisesRegex(app.AzureError, 'passou de'):
+            client.analyze(b'imagem')
+    
+    def test_throttled_submit_honours_retry_after(self):
+        self.standin.throttle_posts = 2
+        self.standin.retry_after = '0.2'
+        client = self.client()
+        start = time.monotonic()
+        fields = client.analyze(b'imagem')
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+        self.assertEqual(fields['card_number'], '4532 0151 1283 0366')
+        self.assertEqual([r[0] for r in self.standin.requests[:3]], ['POST', 'POST', 'POST'])
+        self.assertEqual(len(self.standin.connections), 1)
+    
+    def test_throttled_poll_honours_retry_after(self):
+        self.standin.throttle_polls = 1
+        self.standin.retry_after = '0.3'
+        start = time.monotonic()
+        self.client().analyze(b'imagem')
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+    
+    def test_analyzer_end_to_end(self):
+        analyzer = app.CardAnalyzer(verbose=False, image_cache_size=0)
+        analyzer.azure_client = self.client()
+        stages = []
+        result = analyzer.analyze_image(b'imagem', progress=lambda stage, data: stages.append(stage))
+        self.assertEqual(stages, ['ocr_submitted', 'ocr_complete', 'validation'])
+        self.assertEqual(result['extracted_data']['card_type'], 'Visa')
+        self.assertTrue(result['validation']['card_number']['valid'])
+        self.assertEqual(result['image_size'], len(b'imagem'))
+    
+    def test_wrong_key_is_an_error(self):
+        client = app.AzureReadClient(self.standin.endpoint, 'outra-chave', poll_interval=0.01)
+        self.addCleanup(client.close)
+        with self.assertRaisesRegex(app.AzureError, '401'):
+            client.analyze(b'imagem')
+
+if __name__ == '__main__':
+    unittest.main()
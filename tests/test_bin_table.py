@@ -0,0 +1,93 @@
+"""BinTable: faixas sobrepostas, prefixos curtos, consulta vetorial e CSV"""
+
+import os
+import tempfile
+import unittest
+
+import app
+
+class BinTableTest(unittest.TestCase):
+    def test_builtin_table(self):
+        table = app.BinTable.load()
+        self.assertEqual(table.lookup('4532015112830366'), ('Visa', None, None))
+        self.assertEqual(table.lookup('2720999999999999')[0], 'Mastercard')
+        self.assertEqual(table.lookup('2721000000000000')[0], 'Desconhecido')
+        self.assertEqual(table.lookup('6221260000000000')[0], 'Discover')
+        self.assertEqual(table.lookup('6221250000000000')[0], 'Desconhecido')
+    
+    def test_inner_range_wins(self):
+        table = app.BinTable.load()
+        self.assertEqual(table.lookup('4011780000000000')[0], 'Elo')
+        self.assertEqual(table.lookup('4011800000000000')[0], 'Visa')
+        self.assertEqual(table.lookup('3841000000000000')[0], 'Hipercard')
+        self.assertEqual(table.lookup('3841010000000000')[0], 'Diners Club')
+    
+    def test_short_prefix_is_unknown(self):
+        table = app.BinTable.load()
+        # '3' completado com zeros cairia em Diners 300-305
+        self.assertEqual(table.lookup('3'), app.BinTable.UNKNOWN)
+        self.assertEqual(table.lookup('30')[0], 'Desconhecido')
+        self.assertEqual(table.lookup('300')[0], 'Diners Club')
+        self.assertEqual(table.lookup('4')[0], 'Visa')
+        self.assertEqual(table.lookup(''), app.BinTable.UNKNOWN)
+    
+    def test_bank_and_edition(self):
+        table = app.BinTable([('4', '4', 'Visa', '', ''), ('453201', '', 'Visa', 'Banco Exemplo', 'Platinum'),
+                              ('45320150', '45320160', 'Visa', 'Banco Interno', None)])
+        self.assertEqual(table.lookup('4532015112830366'), ('Visa', 'Banco Interno', None))
+        self.assertEqual(table.lookup('4532017000000000'), ('Visa', 'Banco Exemplo', 'Platinum'))
+        self.assertEqual(table.lookup('4532020000000000'), ('Visa', None, None))
+    
+    def test_partial_overlap(self):
+        # Em sobreposição parcial, a faixa que começa depois vence
+        table = app.BinTable([('10', '19', 'A', None, None), ('15', '25', 'B', None, None)])
+        self.assertEqual([table.lookup(prefix)[0] for prefix in ('12', '15', '19', '25', '26')],
+                         ['A', 'B', 'B', 'B', 'Desconhecido'])
+        # Segmentos vizinhos da mesma faixa são unidos
+        self.assertEqual(len(table), 2)
+    
+    def test_later_row_wins_on_the_same_range(self):
+        table = app.BinTable([('5', '5', 'A', None, None), ('5', '5', 'B', None, None)])
+        self.assertEqual(table.lookup('5000')[0], 'B')
+    
+    @unittest.skipIf(app.np is None, 'NumPy não instalado')
+    def test_lookup_keys_matches_lookup(self):
+        table = app.BinTable.load()
+        samples = ['4532015112830366', '3', '30', '300', '38410000', '4011789', '9', '650031', '2221',
+                   '22209999', '6011000000000000', '5']
+        width = app.BinTable.KEY_DIGITS
+        keys = app.np.array([int(s[:width].ljust(width, '0')) for s in samples], dtype=app.np.int64)
+        lengths = app.np.array([len(s) for s in samples], dtype=app.np.int64)
+        self.assertEqual(table.lookup_keys(keys, lengths), [table.lookup(s) for s in samples])
+    
+    def test_load_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bins.csv')
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.write('brand,start,end,bank_name\n'
+                        'Visa,453201,,Banco Exemplo\n'
+                        'Elo,4532020,4532029\n'
+                        'Visa,x12,,Ignorada\n')
+            table = app.BinTable.load(path)
+        self.assertEqual(table.lookup('4532015112830366'), ('Visa', 'Banco Exemplo', None))
+        self.assertEqual(table.lookup('4532025000000000')[0], 'Elo')
+        self.assertEqual(table.lookup('5555555555554444')[0], 'Mastercard')
+    
+    def test_load_csv_without_required_columns(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bins.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('start,bank_name\n4,Banco\n')
+            with self.assertRaisesRegex(ValueError, 'start e brand'):
+                app.BinTable.load(path)
+    
+    def test_apply_bin_info(self):
+        extracted = {'card_number': '4011 7800 0000 0000'}
+        app.apply_bin_info(extracted)
+        self.assertEqual(extracted['card_type'], 'Elo')
+        # Número que a tabela não conhece não apaga a bandeira lida no cartão
+        extracted = app.apply_bin_info({'card_number': '9999', 'card_type': 'Visa'})
+        self.assertEqual(extracted['card_type'], 'Visa')
+
+if __name__ == '__main__':
+    unittest.main()
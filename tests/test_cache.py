@@ -0,0 +1,141 @@
+"""ResultCache (LRU + TTL) e ImageResultCache (memória + disco)"""
+
+import os
+import stat
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import app
+
+class ResultCacheTest(unittest.TestCase):
+    def test_hit_and_miss(self):
+        cache = app.ResultCache(10, 60)
+        key = cache.key('4532015112830366', 'MARIA')
+        self.assertIsNone(cache.get(key))
+        cache.put(key, 'resultado')
+        self.assertEqual(cache.get(key), 'resultado')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+    
+    def test_keys(self):
+        cache = app.ResultCache(10, 60)
+        key = cache.key('4532015112830366')
+        self.assertEqual(key, cache.key('4532015112830366'))
+        self.assertNotEqual(key, cache.key('4532015112830367'))
+        # As partes são separadas: ('ab', 'c') != ('a', 'bc')
+        self.assertNotEqual(cache.key('ab', 'c'), cache.key('a', 'bc'))
+        # O número do cartão não aparece na chave, e cada cache tem o seu segredo
+        self.assertNotIn(b'4532015112830366', key)
+        self.assertNotEqual(key, app.ResultCache(10, 60).key('4532015112830366'))
+    
+    def test_lru_eviction(self):
+        cache = app.ResultCache(2, 60)
+        a, b, c = (cache.key(name) for name in 'abc')
+        cache.put(a, 1)
+        cache.put(b, 2)
+        cache.get(a)
+        cache.put(c, 3)
+        self.assertIsNone(cache.get(b))
+        self.assertEqual((cache.get(a), cache.get(c)), (1, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+    
+    def test_ttl(self):
+        cache = app.ResultCache(10, 0.05)
+        key = cache.key('a')
+        cache.put(key, 1)
+        self.assertEqual(cache.get(key), 1)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get(key))
+        stats = cache.stats()
+        self.assertEqual((stats['expirations'], stats['size']), (1, 0))
+    
+    def test_until_shortens_the_ttl(self):
+        cache = app.ResultCache(10, 60)
+        key, later = cache.key('a'), cache.key('b')
+        cache.put(key, 1, until=time.time() - 1)
+        cache.put(later, 2, until=time.time() + 3600)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.get(later), 2)
+    
+    def test_clear(self):
+        cache = app.ResultCache(10, 60)
+        cache.put(cache.key('a'), 1)
+        cache.clear()
+        self.assertEqual(cache.stats()['size'], 0)
+
+class ImageResultCacheTest(unittest.TestCase):
+    DIGEST = 'ab' * 32
+    VALUE = {'card_number': '4532 0151 1283 0366', 'cardholder_name': 'MARIA'}
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+    
+    def cache(self, **options):
+        options.setdefault('directory', self.directory.name)
+        return app.ImageResultCache('teste', **options)
+    
+    def test_memory_only(self):
+        cache = self.cache(directory='')
+        self.assertIsNone(cache.directory)
+        self.assertIsNone(cache.get(self.DIGEST))
+        cache.put(self.DIGEST, self.VALUE)
+        self.assertEqual(cache.get(self.DIGEST, 1000), self.VALUE)
+        stats = cache.stats()
+        self.assertEqual((stats['memory_hits'], stats['misses'], stats['bytes_saved']), (1, 1, 1000))
+        self.assertEqual(os.listdir(self.directory.name), [])
+    
+    def test_returns_copies(self):
+        cache = self.cache(directory='')
+        cache.put(self.DIGEST, self.VALUE)
+        cache.get(self.DIGEST)['cardholder_name'] = 'OUTRO'
+        self.assertEqual(cache.get(self.DIGEST), self.VALUE)
+    
+    def test_disk_survives_a_new_cache(self):
+        self.cache().put(self.DIGEST, self.VALUE)
+        cache = self.cache()
+        self.assertEqual(cache.get(self.DIGEST), self.VALUE)
+        self.assertEqual(cache.get(self.DIGEST), self.VALUE)
+        stats = cache.stats()
+        self.assertEqual((stats['disk_hits'], stats['memory_hits']), (1, 1))
+    
+    def test_private_directory(self):
+        cache = self.cache()
+        cache.put(self.DIGEST, self.VALUE)
+        self.assertEqual(cache.directory, Path(self.directory.name) / 'teste')
+        self.assertEqual(stat.S_IMODE(os.stat(cache.directory).st_mode), 0o700)
+        path = cache.directory / f'{self.DIGEST}.json'
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode) & 0o077, 0)
+    
+    def test_disk_entries_expire_by_mtime(self):
+        self.cache().put(self.DIGEST, self.VALUE)
+        cache = self.cache(ttl=60)
+        path = cache.directory / f'{self.DIGEST}.json'
+        old = time.time() - 120
+        os.utime(path, (old, old))
+        self.assertIsNone(cache.get(self.DIGEST))
+        self.assertFalse(path.exists())
+        self.assertEqual(cache.stats()['disk_expired'], 1)
+    
+    def test_disk_limit_evicts_least_used(self):
+        cache = self.cache(max_size=0, max_disk_bytes=400)
+        digests = [f'{i:064x}' for i in range(8)]
+        for digest in digests:
+            cache.put(digest, self.VALUE)
+        files = os.listdir(cache.directory)
+        self.assertLess(len(files), len(digests))
+        self.assertIn(f'{digests[-1]}.json', files)
+        self.assertGreater(cache.stats()['disk_evictions'], 0)
+        self.assertLessEqual(cache.stats()['disk_bytes'], 400)
+    
+    def test_corrupt_file_is_a_miss(self):
+        cache = self.cache(max_size=0)
+        cache.put(self.DIGEST, self.VALUE)
+        (cache.directory / f'{self.DIGEST}.json').write_bytes(b'{quebrado')
+        self.assertIsNone(cache.get(self.DIGEST))
+        self.assertEqual(cache.stats()['disk_errors'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""JsonCodec: limites de tamanho e de aninhamento nos dois backends"""
+
+import json
+import unittest
+
+import app
+
+BACKENDS = ['json'] + (['orjson'] if app.orjson is not None else [])
+
+class JsonCodecTest(unittest.TestCase):
+    def codecs(self, **options):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                yield app.JsonCodec(backend, **options)
+    
+    def test_round_trip(self):
+        data = {'cardNumber': '4532 0151 1283 0366', 'holderName': 'JOSÉ ÁVILA', 'lista': [1, 2.5, None, True]}
+        for codec in self.codecs():
+            body = codec.dumps(data)
+            self.assertIsInstance(body, bytes)
+            self.assertEqual(codec.loads(body), data)
+            self.assertIn('JOSÉ'.encode('utf-8'), body)
+    
+    def test_compact(self):
+        self.assertEqual(app.JsonCodec('json').dumps({'a': [1, 2]}, compact=True), b'{"a":[1,2]}')
+        self.assertEqual(app.JsonCodec('json').dumps({'a': 1}), b'{"a": 1}')
+    
+    def test_body_limit(self):
+        for codec in self.codecs(max_body=20):
+            codec.loads(b'{"a": "' + b'x' * 11 + b'"}')
+            with self.assertRaises(app.JsonError) as caught:
+                codec.loads(b'{"a": "' + b'x' * 12 + b'"}')
+            self.assertEqual(caught.exception.status, 413)
+    
+    def test_depth_limit(self):
+        for codec in self.codecs(max_depth=3):
+            self.assertEqual(codec.loads(b'[[[1]], {"a": {"b": 2}}]'), [[[1]], {'a': {'b': 2}}])
+            with self.assertRaisesRegex(app.JsonError, 'aninhamento') as caught:
+                codec.loads(b'[[[[1]]]]')
+            self.assertEqual(caught.exception.status, 400)
+            with self.assertRaises(app.JsonError):
+                codec.loads(b'{"a": {"b": {"c": {"d": 1}}}}')
+    
+    def test_brackets_inside_strings_do_not_count(self):
+        for codec in self.codecs(max_depth=2):
+            data = {'nome': '[[[[{{{{', 'escape': '\\"[[[[', 'lista': ['}}}]]]']}
+            self.assertEqual(codec.loads(json.dumps(data).encode()), data)
+    
+    def test_deep_document_is_refused_before_parsing(self):
+        depth = 100000
+        for codec in self.codecs(max_body=3 * depth, max_depth=32):
+            with self.assertRaisesRegex(app.JsonError, 'aninhamento'):
+                codec.loads(b'[' * depth + b']' * depth)
+    
+    def test_invalid_json(self):
+        for codec in self.codecs():
+            for body in (b'{"a": ', b'nada', b'\xff\xfe', b''):
+                with self.assertRaises(app.JsonError, msg=body) as caught:
+                    codec.loads(body)
+                self.assertEqual(caught.exception.status, 400)
+    
+    def test_invalid_backend(self):
+        with self.assertRaisesRegex(ValueError, 'inválido'):
+            app.JsonCodec('simplejson')
+    
+    def test_json_depth(self):
+        self.assertEqual(app._json_depth(b'1'), 0)
+        self.assertEqual(app._json_depth(b'[{"a": [1, "]]]"]}, []]'), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+"""Os dois motores HTTP (pool de threads e asyncio) com sockets de verdade"""
+
+import asyncio
+import json
+import socket
+import threading
+import time
+import unittest
+
+import app
+from tests.test_kernel import expiry_from_now
+
+CARD = {'cardNumber': '4532 0151 1283 0366', 'holderName': 'MARIA', 'expiryDate': expiry_from_now(12), 'cvv': '123'}
+
+def validate_request(body=None, headers=''):
+    body = json.dumps(CARD).encode() if body is None else body
+    return (f'POST /validate HTTP/1.1\r\nHost: teste\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n{headers}\r\n').encode() + body
+
+def chunked(body, size):
+    pieces = [body[i:i + size] for i in range(0, len(body), size)]
+    return b''.join(b'%x;ext=1\r\n%s\r\n' % (len(piece), piece) for piece in pieces) + b'0\r\nTrailer: x\r\n\r\n'
+
+class Connection:
+    """Cliente HTTP/1.1 mínimo sobre um socket, para mandar bytes exatos e ler respostas em sequência"""
+    
+    def __init__(self, port, timeout=5):
+        self.sock = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+        self.file = self.sock.makefile('rb')
+    
+    def close(self):
+        self.file.close()
+        self.sock.close()
+    
+    def send(self, data):
+        self.sock.sendall(data)
+    
+    def response(self):
+        """(status, cabeçalhos em minúsculas, corpo), ou None com a conexão fechada"""
+        line = self.file.readline()
+        if not line:
+            return None
+        status = int(line.split()[1])
+        headers = {}
+        while True:
+            line = self.file.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if status == 100:
+            return status, headers, b''
+        body = self.file.read(int(headers.get('content-length', 0)))
+        return status, headers, body
+    
+    def closed(self):
+        try:
+            return self.sock.recv(1) == b''
+        except ConnectionResetError:
+            return True
+
+class EngineTests:
+    """Casos comuns aos dois motores; as subclasses sobem o servidor em self.port"""
+    
+    request_timeout = 0.3
+    
+    def connect(self):
+        conn = Connection(self.port)
+        self.addCleanup(conn.close)
+        return conn
+    
+    def test_validate(self):
+        conn = self.connect()
+        conn.send(validate_request())
+        status, headers, body = conn.response()
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(body)['validation']['overall_valid'])
+    
+    def test_keep_alive_and_pipelining(self):
+        conn = self.connect()
+        lean = validate_request(headers='X-Response-Profile: lean\r\n')
+        # Três requisições num único envio, respondidas em ordem na mesma conexão
+        conn.send(validate_request() + b'GET /status HTTP/1.1\r\nHost: teste\r\n\r\n' + lean)
+        first, second, third = conn.response(), conn.response(), conn.response()
+        self.assertEqual([first[0], second[0], third[0]], [200, 200, 200])
+        self.assertIn('validation', json.loads(first[2]))
+        self.assertEqual(json.loads(second[2])['status'], 'online')
+        self.assertEqual(json.loads(third[2]), {'valid': True, 'reasons': [], 'card_type': 'Visa'})
+        conn.send(validate_request())
+        self.assertEqual(conn.response()[0], 200)
+    
+    def test_connection_close(self):
+        conn = self.connect()
+        conn.send(validate_request(headers='Connection: close\r\n'))
+        self.assertEqual(conn.response()[0], 200)
+        self.assertTrue(conn.closed())
+    
+    def test_chunked_body(self):
+        conn = self.connect()
+        body = json.dumps(CARD).encode()
+        conn.send(b'POST /validate HTTP/1.1\r\nHost: teste\r\nTransfer-Encoding: chunked\r\n\r\n' + chunked(body, 7))
+        status, _, payload = conn.response()
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(payload)['extracted_data']['card_type'], 'Visa')
+        # O corpo chunked foi lido até o fim: a conexão continua utilizável
+        conn.send(validate_request())
+        self.assertEqual(conn.response()[0], 200)
+    
+    def test_malformed_chunked_body(self):
+        conn = self.connect()
+        conn.send(b'POST /validate HTTP/1.1\r\nHost: teste\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n')
+        self.assertEqual(conn.response()[0], 400)
+        self.assertTrue(conn.closed())
+    
+    def test_expect_100_continue(self):
+        conn = self.connect()
+        body = json.dumps(CARD).encode()
+        conn.send(validate_request(b'', 'Expect: 100-continue\r\n').replace(b'Length: 0', b'Length: %d' % len(body)))
+        self.assertEqual(conn.response()[0], 100)
+        conn.send(body)
+        self.assertEqual(conn.response()[0], 200)
+    
+    def test_expect_100_continue_refused(self):
+        conn = self.connect()
+        size = app.MAX_FILE_SIZE + app.UPLOAD_OVERHEAD + 1
+        conn.send(f'POST /upload-image HTTP/1.1\r\nHost: teste\r\nContent-Type: image/jpeg\r\n'
+                  f'Content-Length: {size}\r\nExpect: 100-continue\r\n\r\n'.encode())
+        status, _, body = conn.response()
+        self.assertEqual(status, 413)
+        self.assertTrue(json.loads(body)['error'])
+        self.assertTrue(conn.closed())
+    
+    def test_json_limits(self):
+        conn = self.connect()
+        conn.send(validate_request(b'[' * 40 + b']' * 40))
+        self.assertEqual(conn.response()[0], 400)
+        conn = self.connect()
+        conn.send(validate_request(b'{"cardNumber": ' + b' ' * app.JSON_CODEC.max_body + b'"4"}'))
+        self.assertEqual(conn.response()[0], 413)
+    
+    def test_malformed_content_length(self):
+        conn = self.connect()
+        conn.send(b'POST /validate HTTP/1.1\r\nHost: teste\r\nContent-Length: +5\r\n\r\n')
+        self.assertEqual(conn.response()[0], 400)
+    
+    def test_stalled_body_times_out(self):
+        conn = self.connect()
+        conn.send(validate_request()[:-10])
+        start = time.monotonic()
+        status, _, body = conn.response()
+        self.assertEqual(status, 408)
+        self.assertIn('Tempo esgotado', json.loads(body)['message'])
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertTrue(conn.closed())
+    
+    def test_upload_sniffing(self):
+        conn = self.connect()
+        conn.send(b'POST /upload-image HTTP/1.1\r\nHost: teste\r\nContent-Type: image/jpeg\r\n'
+                  b'Content-Length: 20\r\n\r\n' + b'%PDF-1.4 ' * 2 + b'xx')
+        self.assertEqual(conn.response()[0], 415)
+
+class ThreadPoolServerTest(EngineTests, unittest.TestCase):
+    def setUp(self):
+        if app.WebHandler._analyzer is None:
+            app.WebHandler._analyzer = app.CardAnalyzer(verbose=False)
+        handler = type('Handler', (app.WebHandler,), {'request_timeout': self.request_timeout, 'timeout': 2,
+                                                       'log_message': lambda self, *args: None})
+        self.server = app.ThreadPoolHTTPServer(('127.0.0.1', 0), handler, workers=2, queue_size=1)
+        self.port = self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+    
+    def test_full_queue_gets_503(self):
+        # Os dois workers presos em conexões keep-alive, uma conexão na fila: a próxima é recusada
+        for _ in range(2):
+            conn = self.connect()
+            conn.send(validate_request())
+            self.assertEqual(conn.response()[0], 200)
+        self.connect()
+        time.sleep(0.1)
+        status, headers, _ = self.connect().response()
+        self.assertEqual(status, 503)
+        self.assertEqual(headers['retry-after'], '1')
+        self.assertEqual(self.server.rejected, 1)
+
+class AsyncServerTest(EngineTests, unittest.TestCase):
+    def setUp(self):
+        analyzer = app.CardAnalyzer(verbose=False)
+        jobs = app.JobQueue(analyzer, workers=1)
+        self.addCleanup(jobs.close)
+        self.server = app.AsyncCardServer('127.0.0.1', 0, analyzer=analyzer, idle_timeout=self.request_timeout,
+                                          jobs=jobs)
+        self.server._log = lambda *args: None
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(self.server.start())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        self.port = self.server.port
+        
+        async def shutdown():
+            self.server._server.close()
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        def stop():
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+        self.addCleanup(stop)
+    
+    def test_idle_connection_is_closed(self):
+        conn = self.connect()
+        conn.send(validate_request())
+        self.assertEqual(conn.response()[0], 200)
+        self.assertTrue(conn.closed())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+"""Núcleo de validação: dígitos, Luhn, bandeira, validade, CVV e regras de tamanho"""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+import app
+
+def expiry_from_now(months):
+    """MM/AA a `months` meses do mês atual (negativo = passado)"""
+    key = app.current_month_key() - 1 + months
+    return f'{key % 12 + 1:02d}/{key // 12 % 100:02d}'
+
+class NormalizeDigitsTest(unittest.TestCase):
+    def test_common_separators(self):
+        self.assertEqual(app.normalize_digits('4532 0151-1283 0366'), '4532015112830366')
+    
+    def test_other_characters_are_dropped(self):
+        self.assertEqual(app.normalize_digits('4532.0151/1283\t0366x'), '4532015112830366')
+        self.assertEqual(app.normalize_digits(''), '')
+    
+    def test_non_strings(self):
+        self.assertEqual(app.normalize_digits(4532015112830366), '4532015112830366')
+    
+    def test_unicode_digits_match_the_regex(self):
+        value = '٤٥٣٢ 0151 1283 0366'
+        self.assertEqual(app.normalize_digits(value), app._NON_DIGITS.sub('', value))
+
+class LuhnTest(unittest.TestCase):
+    def test_valid_numbers(self):
+        for number in ('4532015112830366', '5555555555554444', '378282246310005', '6011111111111117'):
+            self.assertTrue(app.luhn_valid(number), number)
+    
+    def test_invalid_numbers(self):
+        self.assertFalse(app.luhn_valid('4532015112830367'))
+        self.assertFalse(app.luhn_valid('1234567890123456'))
+    
+    def test_short_numbers_are_invalid(self):
+        # '0' * 12 passa no Luhn, mas tem menos de 13 dígitos
+        self.assertFalse(app.luhn_valid('0' * 12))
+        self.assertTrue(app.luhn_valid('0' * 13))
+    
+    def test_unicode_digits(self):
+        arabic = '٤٥٣٢٠١٥١١٢٨٣٠٣٦٦'
+        self.assertTrue(app.luhn_valid(arabic))
+        self.assertFalse(app.luhn_valid(arabic[:-1] + '٧'))
+
+class CardTypeTest(unittest.TestCase):
+    def test_brands(self):
+        cases = {
+            '4532015112830366': 'Visa',
+            '5555555555554444': 'Mastercard',
+            '2221000000000009': 'Mastercard',
+            '378282246310005': 'American Express',
+            '6011111111111117': 'Discover',
+            '3530111333300000': 'JCB',
+            '30569309025904': 'Diners Club',
+            '6062825624254001': 'Hipercard',
+            '4011780000000000': 'Elo',
+            '9999999999999999': 'Desconhecido',
+            '': 'Desconhecido',
+        }
+        for digits, brand in cases.items():
+            self.assertEqual(app.card_type_of(digits), brand, digits)
+
+class ExpiryTest(unittest.TestCase):
+    def test_future_and_past(self):
+        self.assertTrue(app.expiry_valid(expiry_from_now(1)))
+        self.assertTrue(app.expiry_valid(expiry_from_now(36)))
+        self.assertFalse(app.expiry_valid(expiry_from_now(0)))
+        self.assertFalse(app.expiry_valid(expiry_from_now(-1)))
+    
+    def test_malformed(self):
+        for value in ('13/30', '00/30', '1/30', '12/3', '', 'MM/AA', '12/2030'):
+            self.assertFalse(app.expiry_valid(value), value)
+    
+    def test_other_separators(self):
+        month, year = expiry_from_now(12).split('/')
+        self.assertTrue(app.expiry_valid(f'{month}-{year}'))
+        self.assertTrue(app.expiry_valid(f'{month} / {year}'))
+    
+    def test_month_key_is_local_date(self):
+        today = datetime.now()
+        self.assertEqual(app.current_month_key(), today.year * 12 + today.month)
+    
+    def test_next_month_start(self):
+        self.assertGreater(app.next_month_start(), time.time())
+        # O limite em cache só avança: um instante depois dele recalcula o mês
+        self.addCleanup(setattr, app, '_month_boundary', app._month_boundary)
+        year = datetime.now().year + 1
+        now = datetime(year, 12, 15, 10, 30).timestamp()
+        self.assertEqual(app.next_month_start(now), datetime(year + 1, 1, 1).timestamp())
+        self.assertEqual(app._current_month(now)[1], year * 12 + 12)
+
+class RulesTest(unittest.TestCase):
+    def test_cvv_lengths(self):
+        self.assertTrue(app.cvv_valid('123', 'Visa'))
+        self.assertFalse(app.cvv_valid('1234', 'Visa'))
+        self.assertTrue(app.cvv_valid('1234', 'American Express'))
+        self.assertFalse(app.cvv_valid('123', 'American Express'))
+        self.assertTrue(app.cvv_valid('1 2 3', 'Mastercard'))
+        # Bandeira fora das regras usa a regra de Desconhecido
+        self.assertTrue(app.cvv_valid('123', 'Outra'))
+    
+    def test_pan_check_verdicts(self):
+        self.assertEqual(app.pan_check('4532015112830366', 'Visa'), 'luhn')
+        self.assertEqual(app.pan_check('4532015112830367', 'Visa'), 'checksum')
+        self.assertEqual(app.pan_check('45320151120002', 'Visa'), 'length')
+        self.assertEqual(app.pan_check('5555555555000000000', 'Mastercard'), 'length')
+        self.assertEqual(app.pan_check('30569309025904', 'Diners Club'), 'luhn')
+        self.assertEqual(app.pan_check('123', 'Desconhecido'), 'length')
+    
+    def test_rule_without_luhn(self):
+        rules = dict(app.CARD_RULES)
+        rules['Visa'] = rules['Visa']._replace(luhn=False)
+        self.addCleanup(setattr, app, 'CARD_RULES', app.CARD_RULES)
+        app.CARD_RULES = rules
+        self.assertEqual(app.pan_check('4532015112830367', 'Visa'), 'unchecked')
+        self.assertEqual(app.pan_check('453201511283036', 'Visa'), 'length')
+    
+    def test_load_card_rules(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rules.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'Desconhecido': {'pan_lengths': [12, [14, 16]], 'cvv_lengths': [3, 4]}}, f)
+            rules = app.load_card_rules(path)
+            self.assertEqual(rules['Desconhecido'], app.CardRule(frozenset({12, 14, 15, 16}), frozenset({3, 4}), True))
+            
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'Visa': {'pan_lengths': [16], 'cvv_lengths': [3]}}, f)
+            with self.assertRaisesRegex(ValueError, 'Desconhecido'):
+                app.load_card_rules(path)
+
+if __name__ == '__main__':
+    unittest.main()
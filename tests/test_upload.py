@@ -0,0 +1,143 @@
+"""UploadParser: multipart em pedaços arbitrários, limites de tamanho e formato"""
+
+import hashlib
+import mmap
+import unittest
+
+import app
+
+JPEG = b'\xff\xd8\xff\xe0' + bytes(range(256)) * 40
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 100
+BOUNDARY = '----limite123'
+
+def multipart(*parts, boundary=BOUNDARY):
+    """Corpo multipart/form-data; cada parte é (nome, filename ou None, conteúdo)"""
+    body = b''
+    for name, filename, content in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+        body += f'--{boundary}\r\nContent-Disposition: {disposition}\r\n'.encode()
+        if filename:
+            body += b'Content-Type: image/jpeg\r\n'
+        body += b'\r\n' + content + b'\r\n'
+    return body + f'--{boundary}--\r\n'.encode()
+
+def parse(body, content_type=f'multipart/form-data; boundary={BOUNDARY}', chunk=None, **options):
+    parser = app.UploadParser(content_type, **options)
+    chunk = chunk or len(body) or 1
+    for start in range(0, len(body), chunk):
+        parser.feed(body[start:start + chunk])
+    parser.finish()
+    return parser
+
+class UploadParserTest(unittest.TestCase):
+    def assertImage(self, parser, image):
+        with parser:
+            self.assertEqual(bytes(parser.data()), image)
+            self.assertEqual(parser.size, len(image))
+            self.assertEqual(parser.sha256(), hashlib.sha256(image).hexdigest())
+    
+    def test_multipart_in_any_chunk_size(self):
+        body = multipart(('nota', None, b'texto qualquer'), ('image', 'cartao.jpg', JPEG), ('outro', None, b'x'))
+        for chunk in (1, 2, 7, 64, 1000, len(body)):
+            parser = parse(body, chunk=chunk)
+            self.assertEqual((parser.filename, parser.content_type, parser.image_type),
+                             ('cartao.jpg', 'image/jpeg', 'jpeg'))
+            self.assertImage(parser, JPEG)
+    
+    def test_raw_body(self):
+        parser = parse(PNG, 'image/png', chunk=5)
+        self.assertEqual(parser.image_type, 'png')
+        self.assertImage(parser, PNG)
+    
+    def test_file_part_found_by_filename(self):
+        parser = parse(multipart(('arquivo', 'foto.png', PNG)))
+        self.assertImage(parser, PNG)
+    
+    def test_no_file(self):
+        with parse(multipart(('nota', None, b'texto'))) as parser:
+            self.assertIsNone(parser.data())
+            self.assertIsNone(parser.sha256())
+    
+    def test_large_file_goes_to_disk(self):
+        image = JPEG * 30
+        parser = parse(multipart(('image', 'a.jpg', image)), chunk=4096, spool_size=1024)
+        with parser:
+            data = parser.data()
+            self.assertIsInstance(data, mmap.mmap)
+            self.assertEqual(data[:], image)
+    
+    def test_file_too_large(self):
+        with self.assertRaises(app.RequestError) as caught:
+            parse(multipart(('image', 'a.jpg', JPEG)), chunk=100, max_file_size=len(JPEG) - 1)
+        self.assertEqual(caught.exception.status, 413)
+    
+    def test_body_too_large_even_without_a_file(self):
+        body = multipart(('nota', None, b'x' * (1000 + app.UPLOAD_OVERHEAD)))
+        with self.assertRaises(app.RequestError) as caught:
+            parse(body, chunk=4096, max_file_size=1000)
+        self.assertEqual(caught.exception.status, 413)
+    
+    def test_not_an_image(self):
+        before = app.upload_rejections().get('not_image', 0)
+        with self.assertRaises(app.RequestError) as caught:
+            parse(multipart(('image', 'a.txt', b'%PDF-1.4 ' * 10)), chunk=3)
+        self.assertEqual(caught.exception.status, 415)
+        self.assertEqual(app.upload_rejections()['not_image'], before + 1)
+        # Arquivo menor que SNIFF_SIZE também é conferido
+        with self.assertRaises(app.RequestError):
+            parse(b'GIF8', 'image/gif')
+    
+    def test_sniff_can_be_disabled(self):
+        self.assertImage(parse(b'qualquer coisa', 'application/octet-stream', sniff=False), b'qualquer coisa')
+    
+    def test_malformed_multipart(self):
+        with self.assertRaisesRegex(app.RequestError, 'boundary'):
+            app.UploadParser('multipart/form-data')
+        with self.assertRaisesRegex(app.RequestError, 'incompleto'):
+            parse(multipart(('image', 'a.jpg', JPEG))[:-30])
+        headers = f'--{BOUNDARY}\r\nX: {"a" * (app.UPLOAD_MAX_PART_HEADERS + 10)}'.encode()
+        with self.assertRaisesRegex(app.RequestError, 'grandes demais'):
+            parse(headers, chunk=1024)
+
+class UploadHelpersTest(unittest.TestCase):
+    def test_sniff_image_type(self):
+        self.assertEqual(app.sniff_image_type(JPEG[:12]), 'jpeg')
+        self.assertEqual(app.sniff_image_type(PNG[:12]), 'png')
+        self.assertEqual(app.sniff_image_type(b'RIFF\x00\x00\x00\x00WEBP'), 'webp')
+        self.assertEqual(app.sniff_image_type(b'\x00\x00\x00\x18ftypheic'), 'heic')
+        self.assertIsNone(app.sniff_image_type(b'GIF89a'))
+    
+    def test_check_content_length(self):
+        limit = app.MAX_FILE_SIZE + app.UPLOAD_OVERHEAD
+        app.check_content_length('/upload-image', limit)
+        for route in app.UPLOAD_ROUTES:
+            with self.assertRaises(app.RequestError) as caught:
+                app.check_content_length(route, limit + 1)
+            self.assertEqual(caught.exception.status, 413)
+        with self.assertRaises(app.JsonError) as caught:
+            app.check_content_length('/validate', app.JSON_CODEC.max_body + 1)
+        self.assertEqual(caught.exception.status, 413)
+        app.check_content_length('/status', limit * 2)
+    
+    def test_parse_content_length(self):
+        self.assertEqual(app.parse_content_length(None), 0)
+        self.assertEqual(app.parse_content_length(' 42 '), 42)
+        for value in ('+5', '-1', '1_000', '0x10', '', '٣'):
+            with self.assertRaises(app.RequestError, msg=value):
+                app.parse_content_length(value)
+    
+    def test_parse_chunk_size(self):
+        self.assertEqual(app.parse_chunk_size(b'1a\r\n'), 26)
+        self.assertEqual(app.parse_chunk_size(b'10;ext=1\r\n'), 16)
+        for line in (b'zz\r\n', b'10', b'-1\r\n'):
+            with self.assertRaises(app.RequestError, msg=line):
+                app.parse_chunk_size(line)
+        with self.assertRaises(ConnectionAbortedError):
+            app.parse_chunk_size(b'')
+    
+    def test_header_params(self):
+        self.assertEqual(app.header_params('multipart/form-data; Boundary="a;b"; charset=utf-8'),
+                         {'boundary': 'a;b', 'charset': 'utf-8'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""validate_manual_input, validate_many (caminho vetorial) e o perfil lean"""
+
+import random
+import unittest
+
+import app
+from tests.test_kernel import expiry_from_now
+
+NUMBERS = ('4532015112830366', '4532 0151 1283 0367', '5555-5555-5555-4444', '378282246310005',
+           '6011111111111117', '3530111333300000', '30569309025904', '6062825624254001', '4011780000000000',
+           '45320151120002', '5555555555000000000', '4532015112830', '123', '', 'abc', '9999999999999995',
+           '٤٥٣٢٠١٥١١٢٨٣٠٣٦٦')
+NAMES = ('MARIA DA SILVA', 'JO', 'J', ' ', '', 'CARDHOLDER NAME', 'NOME DO PORTADOR', 'JOSÉ ÁVILA')
+EXPIRIES = (expiry_from_now(1), expiry_from_now(24), expiry_from_now(0), expiry_from_now(-3), '13/30', '00/00',
+            'MM/AA', '', '1/30', '١٢/٣٠')
+CVVS = ('123', '1234', '12', '', '12a', '١٢٣')
+
+def without_timestamp(result):
+    result = dict(result)
+    result.pop('timestamp', None)
+    return result
+
+def random_records(count, seed=1234):
+    rng = random.Random(seed)
+    return [{'cardNumber': rng.choice(NUMBERS), 'holderName': rng.choice(NAMES),
+             'expiryDate': rng.choice(EXPIRIES), 'cvv': rng.choice(CVVS)} for _ in range(count)]
+
+class ValidateManualInputTest(unittest.TestCase):
+    def setUp(self):
+        self.analyzer = app.CardAnalyzer(verbose=False)
+    
+    def test_valid_card(self):
+        result = self.analyzer.validate_manual_input({'cardNumber': '4532 0151 1283 0366', 'holderName': 'MARIA',
+                                                      'expiryDate': expiry_from_now(12), 'cvv': '123'})
+        self.assertTrue(result['manual_input'])
+        self.assertEqual(result['extracted_data']['card_type'], 'Visa')
+        self.assertTrue(result['validation']['overall_valid'])
+        self.assertEqual(result['validation']['card_number'],
+                         {'valid': True, 'message': 'Número válido pelo algoritmo de Luhn'})
+        self.assertEqual(app.reason_codes(result['validation']), [])
+    
+    def test_failures_and_reason_codes(self):
+        result = self.analyzer.validate_manual_input({'cardNumber': '378282246310005', 'holderName': 'J',
+                                                      'expiryDate': expiry_from_now(-1), 'cvv': '123'})
+        validation = result['validation']
+        self.assertFalse(validation['overall_valid'])
+        self.assertEqual(validation['cvv'], {'valid': False, 'message': 'CVV inválido para American Express'})
+        self.assertEqual(app.reason_codes(validation),
+                         [app.REASON_EXPIRY_INVALID, app.REASON_NAME_SHORT, app.REASON_CVV_INVALID])
+        lean = app.lean_view(result, ('valid', 'reasons', 'card_type'))
+        self.assertEqual(lean, {'valid': False, 'reasons': [202, 302, 401], 'card_type': 'American Express'})
+    
+    def test_every_failure_message_has_its_code(self):
+        for field, verdicts in app.FIELD_RESULTS.items():
+            for verdict, (valid, _, code) in verdicts.items():
+                if not valid:
+                    check = app.field_result(field, verdict, card_type='Elo')
+                    self.assertEqual(app.reason_code(check), code, (field, verdict))
+                    self.assertIn(code, app.REASON_CODES)
+    
+    def test_cache_does_not_share_results(self):
+        record = {'cardNumber': '4532015112830366', 'holderName': 'MARIA', 'expiryDate': expiry_from_now(6),
+                  'cvv': '123'}
+        first = self.analyzer.validate_manual_input(record)
+        first['validation']['card_number']['valid'] = False
+        first['confidence_scores']['overall'] = -1
+        second = self.analyzer.validate_manual_input(record)
+        self.assertTrue(second['validation']['card_number']['valid'])
+        self.assertNotEqual(second['confidence_scores']['overall'], -1)
+        self.assertEqual(self.analyzer.cache.stats()['hits'], 1)
+    
+    def test_cache_disabled(self):
+        analyzer = app.CardAnalyzer(verbose=False, cache_size=0)
+        self.assertIsNone(analyzer.cache)
+        record = random_records(1)[0]
+        self.assertEqual(without_timestamp(analyzer.validate_manual_input(record)),
+                         without_timestamp(self.analyzer.validate_manual_input(record)))
+
+class ValidateManyTest(unittest.TestCase):
+    def setUp(self):
+        self.analyzer = app.CardAnalyzer(verbose=False, cache_size=0)
+    
+    def assertSameAsManual(self, records):
+        batch = self.analyzer.validate_many(records)
+        self.assertEqual(len(batch), len(records))
+        for record, result in zip(records, batch):
+            expected = self.analyzer.validate_manual_input(record)
+            self.assertEqual(without_timestamp(result), without_timestamp(expected), record)
+            self.assertEqual(app.JSON_CODEC.dumps(without_timestamp(result)),
+                             app.JSON_CODEC.dumps(without_timestamp(expected)))
+    
+    @unittest.skipIf(app.np is None, 'NumPy não instalado')
+    def test_equivalent_to_validate_manual_input(self):
+        self.assertSameAsManual(random_records(3000))
+    
+    def test_every_number(self):
+        self.assertSameAsManual([{'cardNumber': number, 'holderName': 'MARIA', 'expiryDate': expiry_from_now(2),
+                                  'cvv': '123'} for number in NUMBERS])
+    
+    def test_missing_and_non_string_fields(self):
+        self.assertSameAsManual([{}, {'cardNumber': 4532015112830366, 'cvv': 123},
+                                 {'cardNumber': '4532015112830366', 'holderName': None, 'expiryDate': '12/99'}])
+    
+    def test_results_are_independent(self):
+        records = [{'cardNumber': '4532015112830366', 'holderName': 'MARIA', 'expiryDate': expiry_from_now(2),
+                    'cvv': '123'}] * 2
+        first, second = self.analyzer.validate_many(records)
+        first['validation']['cvv']['valid'] = False
+        self.assertTrue(second['validation']['cvv']['valid'])
+    
+    def test_empty(self):
+        self.assertEqual(self.analyzer.validate_many([]), [])
+    
+    def test_without_numpy(self):
+        original, app.np = app.np, None
+        self.addCleanup(setattr, app, 'np', original)
+        self.assertSameAsManual(random_records(200, seed=99))
+
+if __name__ == '__main__':
+    unittest.main()